@@ -0,0 +1,102 @@
+"""
+    @description:   Benchmark of the scans of the Fileserver on the virtual file system (see virtualfs.py). The
+                    same tree is registered with register_files() in several modes, and the time and the file
+                    system calls of each mode are printed:
+
+                    * plain - ext/scandir.walk()
+                    * cache_cold, cache_warm - directory cache, first with an empty cache, then again
+                    * governor - parallel listing by an IOGovernor
+                    * governor_cache - directory cache throttled by the IOGovernor (warm cache)
+
+                    Example:
+
+                        python benchmark.py --depth 4 --folders 5 --files 20 --listing-latency 0.02 --stat-latency 0.005
+                        python benchmark.py --tree ./tree.json --modes plain cache_cold cache_warm
+
+                    A tree of a real folder can be recorded with VirtualFS.record(path).save("./tree.json").
+"""
+
+import argparse, json, os, sys, tempfile, time
+
+from fileserver import Fileserver
+from governor import IOGovernor
+from virtualfs import VirtualFS
+
+MODES = ('plain', 'cache_cold', 'cache_warm', 'governor', 'governor_cache')
+
+
+"""
+    @description:   This function registers the virtual tree once per mode.
+
+    @parameters:    * fs [VirtualFS] - the virtual tree
+                    * modes [Iterable] - modes of MODES, in the order they are run
+                    * path_storage [String] - storage folder of the Fileserver (directory cache, catalogue)
+                    * governor_options [Dict] - keyword arguments of the IOGovernor
+
+    @return:        [Dict] Returns per mode the seconds, the number of files and the file system calls.
+"""
+def run_benchmark(fs, modes, path_storage, governor_options=None):
+    results = {}
+    with fs.patch():
+        fileserver = Fileserver(fs.root + "/", path_storage, loading_existant=False)
+        cache = os.path.join(path_storage, "directory_cache")
+
+        for mode in modes:
+            if mode not in MODES:
+                raise ValueError("Unknown mode '{}'.".format(mode))
+            if mode == 'cache_cold':
+                for filename in os.listdir(path_storage):
+                    if filename.startswith("directory_cache"):
+                        os.remove(os.path.join(path_storage, filename))
+
+            fileserver.governor = IOGovernor(**(governor_options or {})) if mode.startswith('governor') else None
+            fs.reset_counts()
+            time_start = time.time()
+            fileserver.register_files(use_cache=mode != 'plain' and mode != 'governor')
+            results[mode] = {
+                'seconds': round(time.time() - time_start, 3),
+                'files': len(fileserver.fileserver),
+                'calls': dict(fs.counts)
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks register_files() on a virtual file system.")
+    parser.add_argument("--tree", default="", help="JSON file of a recorded tree (default: synthetic tree)")
+    parser.add_argument("--root", default="L:/Fileserver", help="root of the synthetic tree")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--folders", type=int, default=5, help="folders per level of the synthetic tree")
+    parser.add_argument("--files", type=int, default=20, help="files per folder of the synthetic tree")
+    parser.add_argument("--listing-latency", type=float, default=0.0, help="seconds per listing")
+    parser.add_argument("--stat-latency", type=float, default=0.0, help="seconds per stat()")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative jitter of the latencies")
+    parser.add_argument("--max-workers", type=int, default=8, help="maximum concurrency of the governor")
+    parser.add_argument("--ops-per-second", type=float, default=None, help="operations per second of the governor")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--output", default="", help="JSON file the results are written to")
+    arguments = parser.parse_args(argv)
+
+    options = {'listing_latency': arguments.listing_latency, 'stat_latency': arguments.stat_latency,
+               'jitter': arguments.jitter}
+    if arguments.tree:
+        fs = VirtualFS.load(arguments.tree, **options)
+    else:
+        fs = VirtualFS.synthetic(arguments.root, arguments.depth, arguments.folders, arguments.files, **options)
+    governor_options = {'max_workers': arguments.max_workers, 'ops_per_second': arguments.ops_per_second}
+
+    with tempfile.TemporaryDirectory() as path_storage:
+        results = run_benchmark(fs, arguments.modes, path_storage + "/", governor_options)
+
+    print("")
+    for mode, result in results.items():
+        calls = ", ".join("{} {}".format(number, call) for call, number in sorted(result['calls'].items()))
+        print("{:<15} {:>8.3f}s  {} files  ({})".format(mode, result['seconds'], result['files'], calls))
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+    @description:   Concordance class which loads the normalization rules of the database identifiers from
+                    a data file (./storage/concordance.json) and keeps them in indexed lookup tables.
+
+                    For every category of database connections (see Fileserver.extract_db_connection()), the
+                    file may define:
+
+                    * strip_prefixes [List] - prefixes which are removed from the found identifier
+                        (case-sensitive), e.g. "AU" for "AU1000"
+                    * concordance [Dict] - source spellings (case-insensitive) and the database id they
+                        stand for, e.g. "tt95" -> "10000"
+                    * upper [bool] - if True, the result is converted to upper case
+
+                    The file can be edited while a session is running; reload_if_changed() picks up the new
+                    version without restarting.
+"""
+
+import os, json, hashlib
+
+
+class Concordance:
+    def __init__(self, path_concordance):
+        self.path_concordance = path_concordance
+        self.rules = {}
+        self.forward = {}
+        self.reverse_index = {}
+        self.fingerprint = None
+        self.mtime = None
+        self.load()
+
+    """
+        @description:   This method (re-)loads the data file and rebuilds the lookup tables.
+
+        @return:        [Set] Returns the categories whose rules have changed compared to the previously
+                        loaded version.
+    """
+    def load(self):
+        try:
+            with open(self.path_concordance, "rb") as concordance_file:
+                content = concordance_file.read()
+            self.mtime = os.stat(self.path_concordance).st_mtime
+        except FileNotFoundError:
+            print("There is no concordance file at {}. Please correct the path.".format(self.path_concordance))
+            content = b"{}"
+            self.mtime = None
+
+        rules = json.loads(content.decode("utf-8"))
+        forward = {}
+        reverse_index = {}
+        for category, rule in rules.items():
+            forward[category] = {}
+            reverse_index[category] = {}
+            for spelling, db_id in rule.get('concordance', {}).items():
+                forward[category][spelling.lower()] = db_id
+                reverse_index[category].setdefault(db_id, []).append(spelling)
+
+        changed = self.changes({'rules': rules})
+
+        self.rules = rules
+        self.forward = forward
+        self.reverse_index = reverse_index
+        self.fingerprint = hashlib.sha1(content).hexdigest()
+        return changed
+
+    """
+        @description:   This method returns the state of the loaded rules. It is saved with the catalogue (see
+                        Fileserver.save_json()), so changes made between two sessions can be detected.
+    """
+    def state(self):
+        return {'fingerprint': self.fingerprint, 'rules': self.rules}
+
+    """
+        @description:   This method compares the loaded rules with the rules of a state (see state()).
+
+        @return:        [Set] Returns the categories whose rules differ.
+    """
+    def changes(self, state):
+        rules = state.get('rules', {})
+        return {category for category in set(rules) | set(self.rules) if rules.get(category) != self.rules.get(category)}
+
+    """
+        @description:   This method reloads the data file if it has been modified since it has been loaded.
+
+        @return:        [Set] Returns the categories whose rules have changed (empty if nothing changed).
+    """
+    def reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path_concordance).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return set()
+
+        changed = self.load()
+        if changed:
+            print("Concordance has been reloaded, changed categories: {}".format(", ".join(sorted(changed))))
+        return changed
+
+    """
+        @description:   This method applies the rules of a category to an identifier found in a path.
+
+        @return:        [String] Returns the normalized identifier.
+    """
+    def normalize(self, category, value):
+        rule = self.rules.get(category)
+        if rule is None:
+            return value
+
+        for prefix in rule.get('strip_prefixes', ()):
+            if value.startswith(prefix):
+                value = value[len(prefix):]
+                break
+
+        db_id = self.forward[category].get(value.lower())
+        if db_id is not None:
+            value = db_id
+
+        if rule.get('upper'):
+            value = value.upper()
+        return value
+
+    """
+        @description:   This method looks up the database id of a single source spelling.
+
+        @return:        [String] Returns the database id, or None if the spelling is not in the concordance.
+    """
+    def lookup(self, category, spelling):
+        return self.forward.get(category, {}).get(spelling.lower())
+
+    """
+        @description:   Reverse lookup: all source spellings which stand for the given database id(s).
+
+        @return:        [List] / [Dict] Returns the spellings of one id, or for reverse_many() a dictionary
+                        with the spellings of every given id (all ids of the category if ids is None).
+    """
+    def reverse(self, category, db_id):
+        return list(self.reverse_index.get(category, {}).get(db_id, []))
+
+    def reverse_many(self, category, ids=None):
+        index = self.reverse_index.get(category, {})
+        if ids is None:
+            return {db_id: list(spellings) for db_id, spellings in index.items()}
+        return {db_id: list(index.get(db_id, [])) for db_id in ids}
@@ -0,0 +1,225 @@
+"""
+    @description:   Local service which keeps one Fileserver object in memory and makes its methods available
+                    over HTTP on localhost, so scripts and notebooks can query a warm catalogue without
+                    loading the Fileserver JSON first. The calls are executed one after another.
+
+                    Start the service:
+
+                        python daemon.py --fileserver L:/Fileserver/ --storage ./storage/ --port 8765
+
+                    Use it from another process, with the token printed by the service:
+
+                        fileserver = FileserverClient("http://127.0.0.1:8765", token="...")
+                        fileserver.get_files_by_package("diary")
+                        files = fileserver.iter_files(extension="tif", processed=False)
+
+                    The printed output of a method is printed by the client as well; generators are returned
+                    as lists.
+
+                    As the service can save and load catalogues and write files, every request has to send
+                    the token along (X-Token header). Unless one is given (--token, or --token-file to read
+                    it from and write it to a file), a random token is generated at the start. Requests whose
+                    Host header is not the local host (DNS rebinding) and POST requests which are not sent as
+                    application/json (cross-site forms) are rejected as well.
+"""
+
+import argparse, contextlib, hmac, io, json, os, secrets, sys, threading, types
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+# methods of the Fileserver object which can be called through the service
+METHODS = (
+    'add_folder_to_package', 'check_existence', 'compute_rollups', 'diff_snapshots', 'export_catalogue',
+    'get_all_extensions', 'get_files_by_extension', 'get_files_by_package', 'get_files_without_db_connection',
+    'get_folder_numbers', 'get_list_of_packages', 'get_numbers', 'get_unassigned_files', 'get_unassigned_folders',
+    'help', 'iter_files', 'iter_files_by_extension', 'iter_files_by_package', 'iter_files_without_db_connection',
+    'iter_unassigned_files', 'load_json', 'memory_report', 'reconcile_db', 'reconcile_moves', 'register_files',
+    'reload_concordance', 'remove_lost_files', 'save_json', 'sniff_files', 'test_string', 'update_entries',
+    'update_metadata', 'write_manifests'
+)
+
+# names under which the service may be addressed (Host header)
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '[::1]', '::1')
+
+
+def to_json(value):
+    if isinstance(value, (types.GeneratorType, set, frozenset, tuple)):
+        return list(value)
+    raise TypeError("{} is not JSON serializable".format(type(value).__name__))
+
+
+class FileserverService:
+    def __init__(self, fileserver, host="127.0.0.1", port=8765, token=None):
+        self.fileserver = fileserver
+        self.host = host
+        self.port = port
+        self.token = token if token else secrets.token_urlsafe(24)
+        self.server = None
+
+    """
+        @description:   This method checks the Host header of a request against the names of the local host.
+    """
+    def host_allowed(self, header):
+        host = (header or "").strip().lower()
+        if host.startswith("["):
+            host = host[:host.find("]") + 1]
+        elif host.count(":") == 1:
+            host = host.split(":")[0]
+        return host in LOCAL_HOSTS or host == self.host
+
+    """
+        @description:   This method executes one call and captures everything the method prints.
+
+        @return:        [Dict] Returns the result and the printed output of the method.
+    """
+    def call(self, method, args=(), kwargs=None):
+        if method not in METHODS:
+            raise ValueError("The method '{}' is not available.".format(method))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = getattr(self.fileserver, method)(*args, **(kwargs or {}))
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+        return {'result': result, 'output': output.getvalue()}
+
+    def run(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, data):
+                body = json.dumps(data, default=to_json).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self, post=False):
+                if not service.host_allowed(self.headers.get("Host")):
+                    self._reply(403, {'error': "Invalid host."})
+                    return False
+                if not hmac.compare_digest(self.headers.get("X-Token", ""), service.token):
+                    self._reply(403, {'error': "Invalid token."})
+                    return False
+                content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                if post and content_type != "application/json":
+                    self._reply(415, {'error': "Requests have to be sent as application/json."})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                if self.path == "/ping":
+                    self._reply(200, {'result': len(service.fileserver.fileserver), 'output': ""})
+                else:
+                    self._reply(404, {'error': "Unknown path {}.".format(self.path)})
+
+            def do_POST(self):
+                if not self._authorized(post=True):
+                    return
+                if self.path == "/shutdown":
+                    self._reply(200, {'result': True, 'output': ""})
+                    threading.Thread(target=service.server.shutdown).start()
+                    return
+                if self.path != "/call":
+                    self._reply(404, {'error': "Unknown path {}.".format(self.path)})
+                    return
+
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    reply = service.call(request['method'], request.get('args', []), request.get('kwargs', {}))
+                except Exception as error:
+                    self._reply(400, {'error': "{}: {}".format(type(error).__name__, error)})
+                    return
+                self._reply(200, reply)
+
+            def log_message(self, format, *args):
+                sys.stderr.write("{} - {}\n".format(self.address_string(), format % args))
+
+        self.server = HTTPServer((self.host, self.port), Handler)
+        print("Fileserver service is listening on http://{}:{}/".format(self.host, self.port))
+        print("Token: {}".format(self.token), flush=True)
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            print("Fileserver service has been interrupted.")
+        finally:
+            self.server.server_close()
+
+
+"""
+    @description:   Thin client for the FileserverService. Every method of the Fileserver object listed in
+                    METHODS can be called on the client as if it were the Fileserver object itself.
+"""
+class FileserverClient:
+    def __init__(self, url="http://127.0.0.1:8765", token=None, timeout=None):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def _request(self, path, data=None):
+        headers = {"Content-Type": "application/json"}
+        if self.token is not None:
+            headers["X-Token"] = self.token
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        request = Request(self.url + path, data=body, headers=headers, method="POST" if body is not None else "GET")
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                reply = json.loads(response.read())
+        except HTTPError as error:
+            reply = json.loads(error.read())
+            raise RuntimeError(reply.get('error', str(error)))
+
+        if reply.get('output'):
+            print(reply['output'], end="")
+        return reply.get('result')
+
+    def ping(self):
+        return self._request("/ping")
+
+    def shutdown(self):
+        return self._request("/shutdown", {})
+
+    def __getattr__(self, method):
+        if method not in METHODS:
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self._request("/call", {'method': method, 'args': list(args), 'kwargs': kwargs})
+        return call
+
+
+def main(argv=None):
+    from fileserver import Fileserver
+
+    parser = argparse.ArgumentParser(description="Keeps a Fileserver object in memory and serves it on localhost.")
+    parser.add_argument("--fileserver", default="", help="path to the fileserver (default: L:/Fileserver/)")
+    parser.add_argument("--storage", default="", help="path to the storage folder (default: ./storage/)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=None, help="token the clients have to send along (default: random)")
+    parser.add_argument("--token-file", default="", help="file the token is read from or, if it does not exist, "
+                                                         "written to")
+    parser.add_argument("--read-only", action="store_true", help="open the catalogue as read-only snapshot")
+    arguments = parser.parse_args(argv)
+
+    token = arguments.token
+    if arguments.token_file and token is None and os.path.isfile(arguments.token_file):
+        with open(arguments.token_file) as token_file:
+            token = token_file.read().strip() or None
+
+    fileserver = Fileserver(arguments.fileserver, arguments.storage, read_only=arguments.read_only)
+    service = FileserverService(fileserver, port=arguments.port, token=token)
+    if arguments.token_file and token is None:
+        # readable by the owner only, so other users of the host cannot call the service
+        descriptor = os.open(arguments.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as token_file:
+            token_file.write(service.token)
+    service.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+    @description:   Reconciliation of the database connections extracted from the file paths (db_entries) with
+                    a local export of the database objects. The export is loaded once into one hash index per
+                    category, then the db_entries of all files are joined against it in a single pass; no
+                    query is sent to the database.
+
+                    The export is either a CSV file with the columns category, identifier and (optional) id:
+
+                        category,identifier,id
+                        AU,1000,4711
+                        Tomb,TT95,4712
+
+                    or a JSON file with a list of such objects, or with one list of identifiers per category
+                    ({"AU": ["1000", ...], "Tomb": [...]}). Identifiers are compared case-insensitively,
+                    after the same normalization as during the extraction (see concordance.py).
+
+                    Three kinds of findings are reported, one JSON object per line:
+
+                        {"type": "dangling", "file": ..., "category": "AU", "identifier": "1001"}
+                        {"type": "ambiguous", "file": ..., "category": "AU", "identifier": "1000", "objects": [..]}
+                        {"type": "unreferenced", "category": "Tomb", "identifier": "TT95", "objects": [...]}
+
+                    From the command line, the catalogue is read entry by entry (see snapdiff.py):
+
+                        python dbreconcile.py db_export.csv --catalogue ./storage/fileserver_json.txt -o findings.jsonl
+"""
+
+import argparse, csv, json, sys
+from collections import Counter
+
+from concordance import Concordance
+import snapdiff
+
+CONCORDANCE_CATEGORIES = ('AU', 'Planum', 'Profile', 'Tomb')
+
+
+"""
+    @description:   Hash index of the objects of a database export.
+"""
+class DatabaseIndex:
+    def __init__(self, concordance):
+        self.concordance = concordance
+        # category: {key: [identifier, object ids]}
+        self.objects = {}
+        self.count = 0
+
+    def key(self, category, identifier):
+        if category in CONCORDANCE_CATEGORIES:
+            identifier = self.concordance.normalize(category, identifier)
+        return identifier.casefold()
+
+    def add(self, category, identifier, object_id=None):
+        identifier = str(identifier).strip()
+        if not category or not identifier:
+            return
+        objects = self.objects.setdefault(category, {})
+        key = self.key(category, identifier)
+        if key not in objects:
+            objects[key] = [identifier, []]
+        objects[key][1].append(object_id if object_id not in (None, "") else identifier)
+        self.count += 1
+
+    """
+        @description:   This method loads a CSV or JSON export (see above); the format is taken from the
+                        extension of the file.
+    """
+    def load(self, path):
+        if path.lower().endswith(".json"):
+            with open(path, encoding="utf-8") as json_file:
+                data = json.load(json_file)
+            if isinstance(data, dict):
+                for category, identifiers in data.items():
+                    for identifier in identifiers:
+                        self.add(category, identifier)
+            else:
+                for row in data:
+                    self.add(row.get('category'), row.get('identifier', ""), row.get('id'))
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as csv_file:
+                for row in csv.DictReader(csv_file):
+                    self.add(row.get('category'), row.get('identifier') or "", row.get('id'))
+        return self
+
+    def lookup(self, category, identifier):
+        return self.objects.get(category, {}).get(self.key(category, identifier))
+
+
+"""
+    @description:   This function joins the db_entries of the files against the index.
+
+    @parameters:    * index [DatabaseIndex] - the loaded database export
+                    * entries [Iterable] - tuples (file, entry)
+
+    @return:        [Generator] Yields the findings; after the last file, the objects without files.
+"""
+def reconcile(index, entries):
+    used = set()
+    for file, entry in entries:
+        for category, identifiers in (entry.get('db_entries') or {}).items():
+            if category not in index.objects:
+                continue
+            for identifier in identifiers:
+                found = index.lookup(category, identifier)
+                if found is None:
+                    yield {'type': "dangling", 'file': file, 'category': category, 'identifier': identifier}
+                    continue
+                used.add((category, index.key(category, identifier)))
+                if len(found[1]) > 1:
+                    yield {'type': "ambiguous", 'file': file, 'category': category, 'identifier': identifier,
+                           'objects': found[1]}
+
+    for category, objects in index.objects.items():
+        for key, (identifier, object_ids) in objects.items():
+            if (category, key) not in used:
+                yield {'type': "unreferenced", 'category': category, 'identifier': identifier,
+                       'objects': object_ids}
+
+
+"""
+    @description:   This function writes the findings as JSON Lines (if output is given) and counts them.
+
+    @return:        [Dict] Returns the number of findings per type, per category, and the most frequent
+                    dangling identifiers.
+"""
+def write_findings(findings, output=None, top=20):
+    statistics = {'dangling': 0, 'ambiguous': 0, 'unreferenced': 0, 'categories': {}}
+    dangling = Counter()
+    for finding in findings:
+        statistics[finding['type']] += 1
+        numbers = statistics['categories'].setdefault(finding['category'], Counter())
+        numbers[finding['type']] += 1
+        if finding['type'] == "dangling":
+            dangling[(finding['category'], finding['identifier'])] += 1
+        if output is not None:
+            output.write(json.dumps(finding) + "\n")
+
+    statistics['categories'] = {category: dict(numbers) for category, numbers in statistics['categories'].items()}
+    statistics['top_dangling'] = [[category, identifier, number]
+                                  for (category, identifier), number in dangling.most_common(top)]
+    return statistics
+
+
+def print_statistics(statistics, file=sys.stdout):
+    print("{} dangling references, {} ambiguous matches, {} database objects without files.".format(
+        statistics['dangling'], statistics['ambiguous'], statistics['unreferenced']), file=file)
+    for category, numbers in sorted(statistics['categories'].items()):
+        print("- {}: {}".format(category, ", ".join("{} {}".format(number, finding)
+                                                     for finding, number in sorted(numbers.items()))), file=file)
+    if statistics['top_dangling']:
+        print("Most frequent dangling identifiers:", file=file)
+        for category, identifier, number in statistics['top_dangling']:
+            print("- {} {}: {} files".format(category, identifier, number), file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconciles the extracted database connections with a database export.")
+    parser.add_argument("export", help="CSV or JSON export of the database objects")
+    parser.add_argument("--catalogue", default="./storage/fileserver_json.txt", help="the Fileserver catalogue")
+    parser.add_argument("-c", "--concordance", default="./storage/concordance.json", help="concordance file")
+    parser.add_argument("-o", "--output", default="", help="JSON Lines file for all findings")
+    parser.add_argument("--include-skipped", action="store_true", help="also check skipped and lost files")
+    arguments = parser.parse_args(argv)
+
+    index = DatabaseIndex(Concordance(arguments.concordance)).load(arguments.export)
+    print("{} database objects loaded.".format(index.count), file=sys.stderr)
+
+    entries = snapdiff.iter_snapshot(arguments.catalogue)
+    if not arguments.include_skipped:
+        entries = ((file, entry) for file, entry in entries if not entry['skip'] and entry['still_there'])
+
+    output_file = open(arguments.output, "w", encoding="utf-8") if arguments.output else None
+    try:
+        statistics = write_findings(reconcile(index, entries), output_file)
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    print_statistics(statistics, sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
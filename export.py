@@ -0,0 +1,128 @@
+"""
+    @description:   Streaming export of the catalogue of a Fileserver object into a columnar format for analyses
+                    (e.g. with pandas). The entries are written in chunks, so the export never holds more than
+                    one chunk in addition to the catalogue itself.
+
+                    If pyarrow is installed, the catalogue is written as Parquet file, otherwise as CSV file.
+                    Every entry becomes one row with the columns:
+
+                    file, path, name, extension, skip, still_there, processed, packages, and one column
+                    db_<category> per category of database connections (e.g. db_AU, db_Tomb).
+
+                    In Parquet, packages and db_<category> are lists of strings; in CSV, their values are
+                    joined with "|".
+
+                    Example:
+
+                        export_catalogue(fileserver, "./storage/fileserver.parquet")
+                        pandas.read_parquet("./storage/fileserver.parquet", columns=["file", "db_AU"])
+"""
+
+import csv
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DB_CATEGORIES = ('AU', 'FieldNumber', 'Find', 'Planum', 'Profile', 'SU', 'ZO', 'Tomb')
+COLUMNS = ['file', 'path', 'name', 'extension', 'skip', 'still_there', 'processed', 'packages'] + \
+          ['db_' + category for category in DB_CATEGORIES]
+LIST_COLUMNS = ['packages'] + ['db_' + category for category in DB_CATEGORIES]
+
+
+"""
+    @description:   This function exports the catalogue.
+
+    @parameters:    * fileserver [Fileserver] - the Fileserver object to export
+                    * path [String] - the target file
+                    * file_format [String] - "parquet", "csv" or "auto" (default: Parquet if pyarrow is
+                        available, otherwise CSV)
+                    * chunk_size [int] - number of entries which are written at once
+                    * files [Iterable] - optional subset of the catalogue, e.g. fileserver.iter_files(...)
+
+    @return:        [int] Returns the number of exported entries.
+"""
+def export_catalogue(fileserver, path, file_format="auto", chunk_size=100000, files=None):
+    if file_format == "auto":
+        file_format = "parquet" if pyarrow is not None else "csv"
+    print("=> export_catalogue({}, file_format={})".format(path, file_format))
+
+    if files is None:
+        files = iter(fileserver.fileserver)
+    chunks = iter_chunks(fileserver.fileserver, files, chunk_size)
+
+    if file_format == "parquet":
+        if pyarrow is None:
+            raise ImportError("pyarrow is required for the export to Parquet.")
+        total = _write_parquet(path, chunks)
+    elif file_format == "csv":
+        total = _write_csv(path, chunks)
+    else:
+        raise ValueError("Unknown file format '{}'.".format(file_format))
+
+    print("{} entries have been exported to {}.".format(total, path))
+    return total
+
+
+"""
+    @description:   This function flattens the entries into rows and groups them into chunks.
+
+    @return:        [Generator] Yields dictionaries with one list of values per column.
+"""
+def iter_chunks(entries, files, chunk_size):
+    chunk = {column: [] for column in COLUMNS}
+    size = 0
+    for file in files:
+        entry = entries[file]
+        db_entries = entry.get('db_entries') or {}
+
+        chunk['file'].append(file)
+        chunk['path'].append(entry['path'])
+        chunk['name'].append(entry['name'])
+        chunk['extension'].append(entry['extension'])
+        chunk['skip'].append(entry['skip'])
+        chunk['still_there'].append(entry['still_there'])
+        chunk['processed'].append(entry['processed'])
+        chunk['packages'].append(list(entry.get('packages', [])))
+        for category in DB_CATEGORIES:
+            chunk['db_' + category].append(list(db_entries.get(category, [])))
+
+        size += 1
+        if size >= chunk_size:
+            yield chunk
+            chunk = {column: [] for column in COLUMNS}
+            size = 0
+
+    if size:
+        yield chunk
+
+
+def _write_parquet(path, chunks):
+    string = pyarrow.string()
+    schema = pyarrow.schema(
+        [(column, string) for column in ('file', 'path', 'name', 'extension')] +
+        [(column, pyarrow.bool_()) for column in ('skip', 'still_there', 'processed')] +
+        [(column, pyarrow.list_(string)) for column in LIST_COLUMNS]
+    )
+
+    total = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pyarrow.Table.from_pydict(chunk, schema=schema))
+            total += len(chunk['file'])
+    return total
+
+
+def _write_csv(path, chunks):
+    total = 0
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(COLUMNS)
+        for chunk in chunks:
+            for column in LIST_COLUMNS:
+                chunk[column] = ["|".join(values) for values in chunk[column]]
+            writer.writerows(zip(*(chunk[column] for column in COLUMNS)))
+            total += len(chunk['file'])
+    return total
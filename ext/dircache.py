@@ -0,0 +1,171 @@
+"""
+    @description:   DirectoryCache class, an optional caching layer around ext/scandir. The listing of each
+                    directory (names, types, sizes and modification times of its entries) is stored in a
+                    local on-disk cache, keyed by the path of the directory and its modification time.
+
+                    Walking a tree again then only costs one stat() per directory: if the modification time
+                    of a directory is unchanged, its cached listing is used instead of listing it again.
+                    Note that the modification time of a directory only changes if entries are added,
+                    removed or renamed - the size and modification time of a file which has been changed
+                    in place may therefore be outdated in the cache.
+
+                    If an IOGovernor is given (see governor.py), the stat() of each directory and the listing
+                    of each modified directory are throttled by it.
+
+                    Example:
+
+                        with DirectoryCache("./storage/directory_cache") as cache:
+                            for path, dirs, files in cache.walk("L:/Fileserver/"):
+                                ...
+"""
+
+import os, shelve
+import ext.scandir as scandir
+
+CACHE_VERSION = 1
+
+
+"""
+    @description:   Directory entry served from the cache. It provides the parts of the DirEntry interface
+                    which are stored in the cache.
+"""
+class CachedDirEntry:
+    __slots__ = ('name', 'path', '_is_dir', '_is_symlink', 'st_size', 'st_mtime')
+
+    def __init__(self, directory, name, is_dir, is_symlink, size, mtime):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._is_dir = is_dir
+        self._is_symlink = is_symlink
+        self.st_size = size
+        self.st_mtime = mtime
+
+    def is_dir(self, follow_symlinks=True):
+        return self._is_dir
+
+    def is_file(self, follow_symlinks=True):
+        return not self._is_dir
+
+    def is_symlink(self):
+        return self._is_symlink
+
+    def stat(self, follow_symlinks=True):
+        return self
+
+    def __repr__(self):
+        return "<CachedDirEntry {!r}>".format(self.name)
+
+
+class DirectoryCache:
+    def __init__(self, path_cache, governor=None):
+        self.path_cache = path_cache
+        self.governor = governor
+        self.db = shelve.open(path_cache)
+        if self.db.get("__version__") != CACHE_VERSION:
+            self.db.clear()
+            self.db["__version__"] = CACHE_VERSION
+
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    """
+        @description:   This method returns the listing of a directory, either from the cache (if the
+                        directory has not been modified since it has been cached) or by listing it.
+
+        @return:        [List] Returns tuples (name, is_dir, is_symlink, size, mtime).
+    """
+    def listing(self, path):
+        if self.governor is None:
+            mtime = os.stat(path).st_mtime_ns
+        else:
+            mtime = self.governor.call(os.stat, path).st_mtime_ns
+
+        cached = self.db.get(path)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        entries = []
+        listed = scandir.scandir(path) if self.governor is None else self.governor.scandir(path)
+        for entry in listed:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            try:
+                is_symlink = entry.is_symlink()
+            except OSError:
+                is_symlink = False
+
+            size = 0
+            modified = None
+            if not is_dir:
+                try:
+                    stat = entry.stat()
+                    size = stat.st_size
+                    modified = stat.st_mtime
+                except OSError:
+                    pass
+            entries.append((entry.name, is_dir, is_symlink, size, modified))
+
+        self.db[path] = (mtime, entries)
+        return entries
+
+    def scandir(self, path):
+        for name, is_dir, is_symlink, size, mtime in self.listing(path):
+            yield CachedDirEntry(path, name, is_dir, is_symlink, size, mtime)
+
+    """
+        @description:   Cached equivalent of ext/scandir.walk(). Like os.walk(), directories can be pruned
+                        by removing them from the list of directories when walking top-down.
+    """
+    def walk(self, top, topdown=True, onerror=None, followlinks=False):
+        try:
+            listing = self.listing(top)
+        except OSError as error:
+            if onerror is not None:
+                onerror(error)
+            return
+
+        dirs = []
+        nondirs = []
+        symlinks = set()
+        for name, is_dir, is_symlink, size, mtime in listing:
+            if is_dir:
+                dirs.append(name)
+                if is_symlink:
+                    symlinks.add(name)
+            else:
+                nondirs.append(name)
+
+        if topdown:
+            yield top, dirs, nondirs
+
+        for name in dirs:
+            if followlinks or name not in symlinks:
+                for result in self.walk(os.path.join(top, name), topdown, onerror, followlinks):
+                    yield result
+
+        if not topdown:
+            yield top, dirs, nondirs
+
+    """
+        @description:   This method removes all cached directories below (and including) the given path.
+    """
+    def invalidate(self, path=""):
+        removed = 0
+        for key in list(self.db.keys()):
+            if key != "__version__" and key.startswith(path):
+                del self.db[key]
+                removed += 1
+        return removed
@@ -0,0 +1,327 @@
+"""
+    @description:   Extraction of database connections (AU, FieldNumber, Find, Planum, Profile, SU, ZO, Tomb)
+                    from file paths. The regular expressions are compiled once when the module is loaded.
+
+                    Besides the single extraction used by Fileserver.extract_db_connection(), the module offers
+                    a bulk extraction for dry runs over large lists of paths, e.g. to validate a new regular
+                    expression against an export of all file names. It can be used from the command line:
+
+                        python extraction.py paths.txt -o results.jsonl --workers 4
+                        type paths.txt | python extraction.py - > results.jsonl
+
+                    Every line of the input is one path; every line of the output is one JSON object with the
+                    keys "path" and "db_entries" (or "error" if the extraction has failed). The hit statistics per
+                    category are printed at the end.
+"""
+
+import argparse, json, os, re, sys, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from concordance import Concordance
+
+REGEX_AU = re.compile(r"(AU\d+)", re.IGNORECASE)
+REGEX_FIELD = re.compile(r"(\b(AU)?\d{1,5}_V?\d+\b)", re.IGNORECASE)
+
+REGEX_FIND = [
+    re.compile(r"(\bAB\d+(\.\d+)?\b)", re.IGNORECASE),          # ab
+    re.compile(r"\b(C\d+[a-z]?)", re.IGNORECASE),               # c
+    re.compile(r"(\bCHEST\d+\b)", re.IGNORECASE),               # chest
+    re.compile(r"(\bMASK\d+\b)", re.IGNORECASE),                # mask
+    re.compile(r"(\bJackal\d+\b)", re.IGNORECASE),              # jackal
+    re.compile(r"(\bJD?E\d+\D{0,2}\b)", re.IGNORECASE),         # jde
+    re.compile(r"(\bCO\d+(\.\d+)?\b)", re.IGNORECASE),          # co
+    re.compile(r"(\bW\d+(\.\d+)?[a-z]?\b)", re.IGNORECASE),     # w
+    re.compile(r"(\bUI+\d*x?R?[a-z]?)", re.IGNORECASE),         # u
+    re.compile(r"(\bDM\d+\b)", re.IGNORECASE),                  # dm
+    re.compile(r"(\bMI\d+\b)", re.IGNORECASE),                  # mi
+    None,                                                       # fn, see below
+    re.compile(r"(\bT\d+\b)", re.IGNORECASE),                   # t
+    re.compile(r"(\bDN\d+(\.\d+)?\b)", re.IGNORECASE),          # dn
+    re.compile(r"(\bCONE\d+(\.\d+)?\b)", re.IGNORECASE)         # cone
+]
+REGEX_FN = re.compile(r"(\bFN\d+[\.]?\d{0,2}([a-z]([-|+][a-z])*)?)", re.IGNORECASE)
+REGEX_FN_FINDALL = re.compile(r"(\bFN\d+[\.]?\d{0,2}([a-z]([-|+][a-z])*)?)")
+
+REGEX_PLANUM = re.compile(r"(\b(AU)?\d+PL\d+(\.\d+)?\b)", re.IGNORECASE)
+REGEX_PROFILE = re.compile(r"(\b(AU)?\d+PR\d+\b)", re.IGNORECASE)
+REGEX_SU = re.compile(r"(\bPL\d+-\d+)", re.IGNORECASE)
+
+REGEX_ZO = [
+    re.compile(r"(\bZO\d+\b)", re.IGNORECASE),
+    re.compile(r"(\bZS\\d+[a-z]?(\.\d+[a-z]?)?)", re.IGNORECASE),
+    re.compile(r"(\bZP\d+[a-z]?(\.\d+[a-z]?)?)", re.IGNORECASE),
+    re.compile(r"(\bZK[S|C]?\d+[a-z]?(\.\d+[a-z]?)?)", re.IGNORECASE)
+]
+
+REGEX_TOMB = re.compile(r"(\b(TT|K)\d+[a-c]?|95[a-c])", re.IGNORECASE)
+
+CATEGORIES = ('AU', 'FieldNumber', 'Find', 'Planum', 'Profile', 'SU', 'ZO', 'Tomb')
+
+
+def get_regex_match(regex, string):
+    match = regex.match(string)
+    if match and match.group(0):
+        return match.group(0)
+    return None
+
+
+def get_regex_findall(regex, string):
+    findall = regex.findall(string)
+    if findall and findall[0][0]:
+        return findall[0][0]
+    return None
+
+
+def contains_au(string, concordance):
+    au = get_regex_match(REGEX_AU, string)
+    if au:
+        return concordance.normalize('AU', au)
+    return False
+
+
+def contains_field_number(string):
+    return get_regex_match(REGEX_FIELD, string) or False
+
+
+def contains_find(string):
+    for regex in REGEX_FIND:
+        if regex is None:
+            if get_regex_match(REGEX_FN, string):
+                return get_regex_findall(REGEX_FN_FINDALL, string)
+            continue
+        find = get_regex_match(regex, string)
+        if find:
+            return find
+    return False
+
+
+def contains_planum(string, concordance):
+    planum = get_regex_match(REGEX_PLANUM, string)
+    if planum:
+        return concordance.normalize('Planum', planum)
+    return False
+
+
+def contains_profile(string, concordance):
+    profile = get_regex_match(REGEX_PROFILE, string)
+    if profile:
+        return concordance.normalize('Profile', profile)
+    return False
+
+
+def contains_su(string):
+    return get_regex_match(REGEX_SU, string) or False
+
+
+def contains_zo(string):
+    for regex in REGEX_ZO:
+        zo = get_regex_match(regex, string)
+        if zo:
+            return zo
+    return False
+
+
+def contains_tomb(string, concordance):
+    tomb = get_regex_match(REGEX_TOMB, string)
+    if tomb:
+        return concordance.normalize('Tomb', tomb)
+    return False
+
+
+def add_value(dictionary, value, key):
+    if key not in dictionary:
+        dictionary[key] = []
+    if not value in dictionary[key]:
+        dictionary[key].append(value)
+    return 1
+
+
+"""
+    @description:   This function extracts the database connections from a path. Every part of the path
+                    (separated by slashes or spaces) is checked against all categories.
+
+    @return:        [Dict] Returns a dictionary with a list of identifiers per category found.
+"""
+def extract_db_connection(path_and_file_name, concordance):
+    keys = {}
+
+    path = path_and_file_name.replace(r"\\", "/").replace("\\", "/")
+    path = path.replace("/", " ")
+
+    components = path.split(' ')
+
+    for component in components:
+        value = contains_au(component, concordance)
+        if value:
+            add_value(keys, value, 'AU')
+        value = contains_field_number(component)
+        if value:
+            add_value(keys, value, 'FieldNumber')
+        value = contains_find(component)
+        if value:
+            add_value(keys, value, 'Find')
+        value = contains_planum(component, concordance)
+        if value:
+            add_value(keys, value, 'Planum')
+        value = contains_profile(component, concordance)
+        if value:
+            add_value(keys, value, 'Profile')
+        value = contains_su(component)
+        if value:
+            add_value(keys, value, 'SU')
+        value = contains_zo(component)
+        if value:
+            add_value(keys, value, 'ZO')
+        value = contains_tomb(component, concordance)
+        if value:
+            add_value(keys, value, 'Tomb')
+
+    return keys
+
+
+# concordance of a worker process of the bulk extraction
+_worker_concordance = None
+
+
+def _init_worker(path_concordance):
+    global _worker_concordance
+    _worker_concordance = Concordance(path_concordance)
+
+
+# an error while extracting a single path is recorded for that path, so it does not abort the whole chunk
+def _extract_one(path, concordance):
+    try:
+        return path, extract_db_connection(path, concordance), None
+    except Exception as error:
+        return path, None, "{}: {}".format(type(error).__name__, error)
+
+
+def _extract_chunk(paths):
+    return [_extract_one(path, _worker_concordance) for path in paths]
+
+
+def _chunks(paths, chunk_size):
+    chunk = []
+    for path in paths:
+        path = path.rstrip("\r\n")
+        if not path:
+            continue
+        chunk.append(path)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+"""
+    @description:   This function extracts the database connections of many paths in parallel chunks. Only a
+                    few chunks per worker are in progress at the same time, so the paths can be streamed from a
+                    file of any size. The results are returned in the order of the input.
+
+    @parameters:    * paths [Iterable] - paths (e.g. an open file with one path per line)
+                    * path_concordance [String] - the concordance file (see concordance.py)
+                    * workers [int] - number of worker processes; 0 extracts in the current process
+                    * chunk_size [int] - number of paths per chunk
+
+    @return:        [Generator] Yields tuples (path, db_entries, error); error is None unless the extraction
+                    of the path has failed, in which case db_entries is None.
+"""
+def extract_bulk(paths, path_concordance="./storage/concordance.json", workers=None, chunk_size=5000):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 0:
+        concordance = Concordance(path_concordance)
+        for chunk in _chunks(paths, chunk_size):
+            for path in chunk:
+                yield _extract_one(path, concordance)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path_concordance,)) as executor:
+        pending = deque()
+        for chunk in _chunks(paths, chunk_size):
+            pending.append(executor.submit(_extract_chunk, chunk))
+            if len(pending) >= workers * 2:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+
+
+"""
+    @description:   This function writes the results of extract_bulk() as JSON Lines and counts the hits.
+
+    @return:        [Dict] Returns the statistics: number of paths, paths without any connection, paths whose
+                    extraction has failed, and per category the number of paths with a hit and the number of
+                    distinct identifiers.
+"""
+def write_results(results, output):
+    total = 0
+    without = 0
+    errors = 0
+    hits = dict.fromkeys(CATEGORIES, 0)
+    identifiers = {category: set() for category in CATEGORIES}
+
+    for path, db_entries, error in results:
+        total += 1
+        if error is not None:
+            errors += 1
+            output.write(json.dumps({'path': path, 'error': error}) + "\n")
+            continue
+        if not db_entries:
+            without += 1
+        for category, values in db_entries.items():
+            hits[category] = hits.get(category, 0) + 1
+            identifiers.setdefault(category, set()).update(values)
+        output.write(json.dumps({'path': path, 'db_entries': db_entries}) + "\n")
+
+    return {
+        'paths': total,
+        'without_db_connection': without,
+        'errors': errors,
+        'categories': {
+            category: {'paths': hits[category], 'identifiers': len(identifiers[category])} for category in hits
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extracts the database connections of a list of paths.")
+    parser.add_argument("input", help="file with one path per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output file, or - for stdout (default)")
+    parser.add_argument("-s", "--statistics", default="", help="also write the hit statistics to this JSON file")
+    parser.add_argument("-c", "--concordance", default="./storage/concordance.json", help="concordance file")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (0: no parallelism)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="paths per chunk")
+    arguments = parser.parse_args(argv)
+
+    time_start = time.time()
+    input_file = sys.stdin if arguments.input == "-" else open(arguments.input, encoding="utf-8")
+    output_file = sys.stdout if arguments.output == "-" else open(arguments.output, "w", encoding="utf-8")
+    try:
+        results = extract_bulk(input_file, arguments.concordance, arguments.workers, arguments.chunk_size)
+        statistics = write_results(results, output_file)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    if arguments.statistics:
+        with open(arguments.statistics, "w") as statistics_file:
+            json.dump(statistics, statistics_file, indent=4)
+
+    print("{} paths processed in {:.2f}s, {} without database connection, {} with errors.".format(
+        statistics['paths'], time.time() - time_start, statistics['without_db_connection'], statistics['errors']),
+        file=sys.stderr)
+    for category, numbers in statistics['categories'].items():
+        print("- {}: {} paths, {} distinct identifiers".format(category, numbers['paths'], numbers['identifiers']),
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
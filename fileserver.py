@@ -6,13 +6,34 @@
                     automatically registers all files on the fileserver.
 """
 
-import os, json, re, time
+import os, sys, json, time, itertools
 import ext.scandir as scandir
+from ext.dircache import DirectoryCache
+from skiprules import SkipRules
+from concordance import Concordance
+from rollups import FolderRollups
+import export
+import snapdiff
+import extraction
+import metadata
+import sniff
+import moves
+import dbreconcile
+import manifest
+from governor import IOGovernor
+import memreport
+from locking import FileLock
 from pprint import pprint
 
+# version of the rules in extract_db_connection(); increase it whenever the regular expressions change, so
+# that the next update_entries() extracts the database connections again (changes of the concordance file
+# are detected by reload_concordance(), also between sessions, as its state is saved with the catalogue)
+DB_EXTRACTOR_VERSION = 1
+
 
 class Fileserver:
-    def __init__(self, input_path_to_fileserver="", input_path_to_storage="", loading_existant=True):
+    def __init__(self, input_path_to_fileserver="", input_path_to_storage="", loading_existant=True, read_only=False,
+                 track_memory=False):
         print("Creating a new Fileserver object.")
 
         if input_path_to_fileserver == "":
@@ -26,13 +47,55 @@ class Fileserver:
             self.path_storage = r"" + input_path_to_storage
 
         self.json_fileserver = "fileserver_json"
+        self.json_rules = "fileserver_rules"
+        self.json_concordance = "fileserver_concordance"
         self.path_skipped_folders = self.slash("./storage/skipped_folders.txt")
         self.path_skipped_extensions = self.slash("./storage/skipped_extensions.txt")
+        self.path_good_extensions = self.slash("./storage/good_extensions.txt")
         self.skipped_folders = None
         self.skipped_extensions = None
+        self.skip_rules = None
+        self.path_concordance = self.slash("./storage/concordance.json")
+        self.concordance = Concordance(self.path_concordance)
+
+        # state of the concordance which the database connections in the entries have been extracted with
+        self.concordance_state = self.concordance.state()
+
+        # fingerprint and content of the skip rules which have been used for the stored verdicts
+        self.rules_state = {}
+
+        # aggregated numbers per folder, computed when needed (see get_rollups())
+        self.rollups = None
+
+        # a read-only session (snapshot) never writes to the storage folder; for all other sessions, the
+        # state (modification time, size) of every loaded or saved catalogue is kept, so a session does
+        # not overwrite a catalogue which has been saved by another session in the meantime
+        self.read_only = read_only
+        self.catalogue_stamps = {}
+
+        # long operations (register_files, update_entries) append the entries changed since the last checkpoint
+        # to a checkpoint file every checkpoint_every files or every checkpoint_interval seconds, from which they
+        # can be resumed (resume=True)
+        self.json_checkpoint = "fileserver_checkpoint"
+        self.checkpoint_every = 100000
+        self.checkpoint_interval = 600
+        self.time_last_checkpoint = time.time()
+
+        # optional IOGovernor (see governor.py) which throttles the scans of the share; if it is set,
+        # register_files() lists the folders in parallel within its limits
+        self.governor = None
+
+        # if track_memory is True, the memory allocated by load_json() and update_entries() is measured with
+        # tracemalloc and kept in memory_peaks (see memreport.py and memory_report()); the memory_top_lines lines
+        # allocating most are listed as well, which takes a snapshot of all traces at the end of the operation
+        self.track_memory = track_memory
+        self.memory_peaks = {}
+        self.memory_top_lines = 0
+        if track_memory:
+            memreport.start()
 
         self.fileserver = {}
-        if loading_existant:
+        if loading_existant or read_only:
             print("Loading existent Fileserver save.")
             self.load_json(self.path_storage + self.json_fileserver + ".txt")
         else:
@@ -49,17 +112,35 @@ class Fileserver:
         print("help()")
         print("")
         print("add_folder_to_package(path_to_folder, package_name, recursive)")
+        print("check_existence(include_skipped=False)")
+        print("diff_snapshots(old, new='current', output_path='')")
+        print("export_catalogue(alternative_path='', file_format='auto', chunk_size=100000)")
         print("get_all_extensions()")
         print("get_files_by_extension(extension, print_skipped=False)")
         print("get_files_by_package(package_name, print_skipped=False)")
         print("get_files_without_db_connection(print_skipped=False)")
+        print("get_folder_numbers(path_to_folder, recursive=True)")
         print("get_list_of_packages()")
         print("get_unassigned_files(print_skipped=False)")
         print("get_unassigned_folders(print_skipped=False)")
+        print("iter_files(extension, package, skip, still_there, processed, prefix, db_category, db_connection, in_package)")
+        print("iter_files_by_extension(extension, include_skipped=False)")
+        print("iter_files_by_package(package_name, include_skipped=False)")
+        print("iter_files_without_db_connection(include_skipped=False)")
+        print("iter_unassigned_files(include_skipped=False)")
         print("load_json(alternative_path='')")
-        print("register_files()")
-        print("save_json(alternative_path='')")
-        print("update_entries(doublecheck=False)")
+        print("memory_report(output_path='', top=20)")
+        print("reconcile_db(path_export, output_path='', include_skipped=False)")
+        print("reconcile_moves(use_fingerprint=False, dry_run=False)")
+        print("register_files(only_new=False, use_cache=False, prune=False, record_pruned=False, resume=False)")
+        print("reload_concordance()")
+        print("save_json(alternative_path='', force=False)")
+        print("sniff_files(workers=8, force=False, include_skipped=False)")
+        print("test_string(string)")
+        print("test_strings(path_to_list, output_path, workers=None)")
+        print("update_entries(doublecheck=False, force_extraction=False, resume=False)")
+        print("update_metadata(workers=8, force=False, include_skipped=False)")
+        print("write_manifests(package=None, prefix=None, output_directory='', file_format='json', max_entries=10000, max_bytes=50 GB)")
         return 0
 
     """
@@ -67,7 +148,7 @@ class Fileserver:
                         accordingly in a JSON storage. The JSON is structured by file paths. Each
                         subsequent JSON has currently the following keys:
                         
-                        * extension [string] - file extension
+                        * extension [string] - file extension ("" if the file name contains no dot)
                         * skip [bool] - if True, file should not be uploaded
                         * still_there [bool] - if True, the file is still assumed to be in place
                         * processed [bool] - if True, the data has already been uploaded
@@ -76,43 +157,224 @@ class Fileserver:
                         * db_entries - another dictionary which contains information about the
                             relation between the file and database objects
                         * packages [Set] - set of packages this file has been assigned to
-                            
+
+        @parameters:    * only_new [bool, default=False] - if True, only files which are not registered yet
+                            are taken into account
+                        * use_cache [bool, default=False] - if True, the listings of all folders are stored
+                            in a directory cache in the storage folder (see ext/dircache.py); folders which
+                            have not been modified since the last walk are then not listed again; the
+                            folders are walked one after another, throttled by self.governor if it is set
+                        * prune [bool, default=False] - if True, skipped folders (see prune_folder()) are
+                            not walked into at all
+                        * record_pruned [bool, default=False] - if True, every pruned folder is registered as
+                            one single placeholder entry (key: folder path with trailing slash, 'pruned': True)
+                            instead of leaving it out completely; together with only_new, the entries of
+                            files registered within the folder before are replaced by the placeholder
+                        * resume [bool, default=False] - if True, the registration continues from the last
+                            checkpoint of an interrupted registration; folders which had already been
+                            registered are not registered again
+
         @return:        Nothing. The resulting dictionary is directly saved into self.fileserver.
     """
-    def register_files(self, only_new=False):
-        print("=> register_files()")
+    def register_files(self, only_new=False, use_cache=False, prune=False, record_pruned=False, resume=False):
+        print("=> register_files(only_new={}, use_cache={}, prune={}, record_pruned={}, resume={})".format(
+            only_new, use_cache, prune, record_pruned, resume))
 
         file_counter = 0
+        pruned_counter = 0
         file_dict = {}
+        done_folders = set()
+
+        checkpoint = self.load_checkpoint('register_files') if resume else None
+        if checkpoint is not None:
+            file_counter = checkpoint['file_counter']
+            pruned_counter = checkpoint['pruned_counter']
+            file_dict = checkpoint['entries']
+            done_folders = set(checkpoint['done_folders'])
+        else:
+            self.remove_checkpoint()
+        self.time_last_checkpoint = time.time()
+        checkpoint_counter = file_counter
+
+        # entries and folders registered since the last checkpoint
+        pending_entries = []
+        pending_folders = []
+
+        if prune:
+            self.load_skip_rules()
+
+        cache = None
+        walk = scandir.walk
+        if use_cache:
+            cache = DirectoryCache(self.slash(self.path_storage) + "directory_cache", self.governor)
+            walk = cache.walk
+        elif self.governor is not None:
+            walk = self.governor.walk
+
+        # the cache is closed even if the walk is interrupted, so its file is never left inconsistent
+        try:
+            for path, subdirs, files in walk(self.path_fileserver):
+                # the folder is normalized once, all of its files share the same (interned) string
+                path = self.normalize_folder(path)
+
+                if prune:
+                    # remove skipped folders before the walk descends into them
+                    for folder in list(subdirs):
+                        folder_path = self.join_path(path, folder)
+                        reason = self.prune_folder(folder_path)
+                        if not reason:
+                            continue
+                        subdirs.remove(folder)
+                        pruned_counter += 1
+                        if record_pruned:
+                            file_dict[folder_path + "/"] = self.create_placeholder(folder_path, reason)
+                            pending_entries.append(folder_path + "/")
+
+                # folders which have been registered before the last checkpoint
+                if path in done_folders:
+                    continue
 
-        for path, subdirs, files in scandir.walk(self.path_fileserver):
-            for file in files:
-                file_counter += 1
-                file_path = self.slash(os.path.join(path, file))
+                for file in files:
+                    file_counter += 1
+                    file_path = self.join_path(path, file)
+
+                    if only_new and file_path in self.fileserver:
+                        continue
+
+                    file_dict[file_path] = self.create_entry(path, file)
+                    pending_entries.append(file_path)
+
+                    if file_counter % 10000 == 0:
+                        print("Files processed: {}".format(file_counter), flush=True)
+
+                done_folders.add(path)
+                pending_folders.append(path)
+                if self.checkpoint_due(file_counter - checkpoint_counter):
+                    checkpoint_counter = file_counter
+                    self.save_checkpoint('register_files', {
+                        'file_counter': file_counter,
+                        'pruned_counter': pruned_counter,
+                        'done_folders': pending_folders,
+                        'entries': {key: file_dict[key] for key in pending_entries}
+                    })
+                    pending_entries = []
+                    pending_folders = []
+        finally:
+            if cache is not None:
+                cache.close()
 
-                if only_new and file_path in self.fileserver:
-                    continue
+        print("\nAll {} Files processed!\n".format(file_counter))
+        if prune:
+            print("{} skipped folders have been pruned.\n".format(pruned_counter))
+        if cache is not None:
+            print("Directory cache: {} folders unchanged, {} folders listed.\n".format(cache.hits, cache.misses))
+        if self.governor is not None:
+            self.governor.report()
+        if only_new:
+            # the new files are added to the files which have been registered before; files registered before
+            # their folder has been pruned are replaced by the placeholder of the folder
+            pruned_folders = tuple(file for file, entry in file_dict.items() if entry.get('pruned'))
+            if pruned_folders:
+                replaced = [file for file, entry in self.fileserver.items()
+                            if not entry.get('pruned') and (entry['path'] + "/").startswith(pruned_folders)]
+                for file in replaced:
+                    del self.fileserver[file]
+            self.fileserver.update(file_dict)
+        else:
+            self.fileserver = file_dict
+        self.compute_rollups()
+        self.remove_checkpoint()
 
-                file_ext = file[file.rfind(".") + 1:].lower()
-                file_path_only = self.slash(path)
-                still_there = True
-                processed = False
-                skip = False
+    """
+        @description:   This method creates the entry of a single file as it is stored in self.fileserver
+                        (see register_files()). The path of the folder has to be normalized already
+                        (see normalize_folder()).
 
-                file_dict[file_path] = {
-                    'extension' : file_ext,
-                    'still_there' : still_there,
-                    'processed' : processed,
-                    'skip' : skip,
-                    'path' : file_path_only,
-                    'name' : file
-                }
+        @return:        [Dict] Returns the new entry.
+    """
+    def create_entry(self, path, file):
+        file_ext = file[file.rfind(".") + 1:].lower() if "." in file else ""
+        file_path_only = path
+        still_there = True
+        processed = False
+        skip = False
+
+        return {
+            'extension' : file_ext,
+            'still_there' : still_there,
+            'processed' : processed,
+            'skip' : skip,
+            'path' : file_path_only,
+            'name' : file
+        }
 
-                if file_counter % 10000 == 0:
-                    print("Files processed: {}".format(file_counter), flush=True)
+    """
+        @description:   This method reads technical metadata (dimensions, bit depth, pages, dates) from the
+                        headers of all TIFF, JPEG and PDF files whose extension is listed in
+                        storage/good_extensions.txt (see metadata.py); if there is no such file, of all TIFF,
+                        JPEG and PDF files. Only the first KB of every file are
+                        read, in a bounded thread pool; the result is stored per entry in 'metadata' together
+                        with size and modification time of the file, so unchanged files are not read again.
+
+        @parameters:    * workers [int, default=8] - number of threads reading files
+                        * force [bool, default=False] - if True, the metadata of all files is read again
+                        * include_skipped [bool, default=False] - if True, skipped files are read as well
+
+        @return:        [Dict] Returns the number of files read, unchanged, missing and with errors.
+    """
+    def update_metadata(self, workers=8, force=False, include_skipped=False):
+        print("=> update_metadata(workers={}, force={})".format(workers, force))
+        time_metadata_start = time.time()
 
-        print("\nAll {} Files processed!\n".format(file_counter))
-        self.fileserver = file_dict
+        good_extensions = set()
+        try:
+            with open(self.path_good_extensions) as extensions_file:
+                for line in extensions_file:
+                    extension = line.strip().lower()
+                    if extension and not extension.startswith("#") and extension in metadata.FORMATS:
+                        good_extensions.add(extension)
+        except FileNotFoundError:
+            print("There is no good_extensions file at {}. Please correct the path.".format(self.path_good_extensions))
+            good_extensions = set(metadata.FORMATS)
+
+        files = (file for file, entry in self.fileserver.items()
+                 if entry['extension'] in good_extensions and entry['still_there'] and not entry.get('pruned')
+                 and (include_skipped or not entry['skip']))
+        statistics = metadata.collect_metadata(self.fileserver, files, workers, force)
+
+        print("Metadata of {} files read ({} with errors), {} unchanged, {} missing. ({:.2f}s)".format(
+            statistics['read'], statistics['errors'], statistics['unchanged'], statistics['missing'],
+            time.time() - time_metadata_start))
+        return statistics
+
+    """
+        @description:   This method detects the real format of all files from their leading bytes (see
+                        sniff.py), in a bounded thread pool. The format is stored per entry in
+                        'detected_type', together with flags for files whose content does not match their
+                        extension and for truncated or corrupt files. Corrupt files are skipped by the next
+                        update_entries(). Files whose size and modification time have not changed since they
+                        have been sniffed are not read again.
+
+        @parameters:    * workers [int, default=8] - number of threads reading files
+                        * force [bool, default=False] - if True, all files are read again
+                        * include_skipped [bool, default=False] - if True, skipped files are read as well
+
+        @return:        [Dict] Returns the number of files read, unchanged, missing, mismatched,
+                        truncated and corrupt.
+    """
+    def sniff_files(self, workers=8, force=False, include_skipped=False):
+        print("=> sniff_files(workers={}, force={})".format(workers, force))
+        time_sniff_start = time.time()
+
+        files = (file for file, entry in self.fileserver.items()
+                 if entry['still_there'] and not entry.get('pruned') and (include_skipped or not entry['skip']))
+        statistics = sniff.sniff_entries(self.fileserver, files, workers, force)
+
+        print("{} files read, {} unchanged, {} missing. ({:.2f}s)".format(
+            statistics['read'], statistics['unchanged'], statistics['missing'], time.time() - time_sniff_start))
+        print("{} files do not match their extension, {} are truncated, {} are corrupt.".format(
+            statistics['mismatch'], statistics['truncated'], statistics['corrupt']))
+        return statistics
 
     """
         @description:   This method flags all data entries which have been classified as unnecessary for
@@ -123,36 +385,47 @@ class Fileserver:
                         In the same way, this method checks whether files that have been registered in the
                         past are still in their place. If not, the "still_there" flag is set to False.
                         
+                        The verdict of the skipped folders and extensions is stored per entry ('rule_verdict')
+                        together with a fingerprint of the rule files. As long as the rules do not change,
+                        the stored verdicts are reused; otherwise only entries affected by changed rules
+                        are evaluated again. As skipped and lost files are only classified again with
+                        doublecheck, the rules are only stored after a doublecheck.
+
+                        The database connections only depend on the path of a file. They are extracted again
+                        only for entries which have none yet (new or moved files) or which have been stamped
+                        ('db_version') with an older DB_EXTRACTOR_VERSION.
+
         @parameters:    * doublecheck   If True, all files will be checked. If False (default), all files with
                                         a 'skip' flag will not be looked at again.
+                        * force_extraction [bool, default=False] - if True, the database connections of all
+                                        checked files are extracted again, regardless of their version stamp.
+                        * resume [bool, default=False] - if True, the update continues from the last
+                                        checkpoint of an interrupted update.
     """
-    def update_entries(self, doublecheck=False):
-        print("=> update_entries(doublecheck={})".format(doublecheck))
+    @memreport.tracked
+    def update_entries(self, doublecheck=False, force_extraction=False, resume=False):
+        print("=> update_entries(doublecheck={}, force_extraction={}, resume={})".format(
+            doublecheck, force_extraction, resume))
         time_update_start = time.time()
-        try:
-            with open(self.path_skipped_folders) as folder_file:
-                temp = folder_file.read().splitlines()
-                folders = []
-                for entry in temp:
-                    if entry[-1:] != "\\" and entry[-1:] != "/":
-                        entry = entry + "\\"
-                    folders.append(self.slash(entry))
-                self.skipped_folders = folders
-        except FileNotFoundError:
-            print("There is no skipped_folder file at {}. Please correct the path.".format(self.path_skipped_folders))
-
-        try:
-            with open(self.path_skipped_extensions) as extension_file:
-                extensions = extension_file.read().splitlines()
-                self.skipped_extensions = extensions
-        except FileNotFoundError:
-            print("There is no skipped_extensions file at {}. Please correct the path.".format(self.path_skipped_extensions))
-
-        def skipped_folder(path):
-            path = self.slash(path) + "/"
-            for entry in self.skipped_folders:
-                entry = self.slash(entry)
-                if path.startswith(entry) or path == entry:
+        fingerprint = self.load_skip_rules()
+        self.reload_concordance()
+
+        # find out which rules have changed since the verdicts have been stored
+        rules_unchanged = self.rules_state.get('fingerprint') == fingerprint
+        changed_folders, changed_extensions, changed_suffixes = set(), set(), set()
+        if not rules_unchanged and self.rules_state:
+            changed_folders, changed_extensions, changed_suffixes = self.skip_rules.changes(self.rules_state)
+            print("Skip rules have changed: {} folder rules, {} extension rules and {} suffix rules are affected.".format(
+                len(changed_folders), len(changed_extensions), len(changed_suffixes)))
+
+        def rules_affect(path, name, extension, detected_type):
+            if (extension or name).casefold() in changed_extensions or detected_type in changed_extensions:
+                return True
+            if changed_suffixes and name.casefold().endswith(tuple(changed_suffixes)):
+                return True
+            path = path + "/"
+            for entry in changed_folders:
+                if path.startswith(entry):
                     return True
             return False
 
@@ -160,9 +433,32 @@ class Fileserver:
         non_existent = 0
         processed = 0
         skipped = 0
+        extracted = 0
+
+        # the checkpoint contains the entries updated before the interruption; it is applied to the catalogue the
+        # interrupted update has started from, so the order of the entries is the same
+        checkpoint = self.load_checkpoint('update_entries') if resume else None
+        if checkpoint is not None:
+            self.fileserver.update(checkpoint['entries'])
+            total, non_existent, processed, skipped, extracted = checkpoint['counters']
+        else:
+            self.remove_checkpoint()
+        self.time_last_checkpoint = time.time()
+        checkpoint_counter = total
+        pending_entries = []
+
+        # the entries already updated before the checkpoint are left out
+        for file in itertools.islice(self.fileserver, total, None):
+            if self.checkpoint_due(total - checkpoint_counter):
+                checkpoint_counter = total
+                self.save_checkpoint('update_entries', {
+                    'counters': [total, non_existent, processed, skipped, extracted],
+                    'entries': {key: self.fileserver[key] for key in pending_entries}
+                })
+                pending_entries = []
 
-        for file in self.fileserver:
             total += 1
+            pending_entries.append(file)
             if total % 1000 == 0:
                 print("* still updating, currently at file {}...".format(total))
 
@@ -171,6 +467,17 @@ class Fileserver:
             file_path = self.fileserver[file]['path']
             file_extension = self.fileserver[file]['extension']
 
+            # placeholders of pruned folders are always skipped, only the folder itself is checked
+            if self.fileserver[file].get('pruned'):
+                self.fileserver[file]['still_there'] = os.path.isdir(file_path)
+                self.skip_rules.count(self.fileserver[file]['rule_verdict'])
+                skipped += 1
+                continue
+
+            # older catalogues stored the whole name as extension of files without a dot
+            if file_extension and "." not in self.fileserver[file]['name']:
+                file_extension = self.fileserver[file]['extension'] = ""
+
             # in case there shan't be a doublecheck, skip file
             if not doublecheck:
                 if file_skipped:
@@ -182,25 +489,31 @@ class Fileserver:
                 non_existent += 1
                 continue
 
-            # skip JPG if corresponding TIFF is available
-            if file_extension == "jpg" or file_extension == "jpeg":
-                path_stem = file[:file.rfind(".") + 1]
-                if path_stem + "tif" in self.fileserver or path_stem + "tiff" in self.fileserver:
-                    self.fileserver[file]['skip'] = True
-                    continue
-
-            # skip file if in skipped folder or has skipped extension
-            if skipped_folder(file_path) or file_extension in self.skipped_extensions:
+            # skip JPG if corresponding TIFF is available; the verdict of the rules is not evaluated, so it
+            # is dropped and evaluated again once the TIFF is gone
+            if self.has_tiff_version(file):
                 self.fileserver[file]['skip'] = True
-            elif self.fileserver[file]['name'].startswith("."):
-                # skip all invisible files (starting with a .)
-                self.fileserver[file]['skip'] = True
-            else:
-                self.fileserver[file]['skip'] = False
+                self.fileserver[file].pop('rule_verdict', None)
+                continue
 
-            # flag for all files whether they are still in place
-            if os.path.isfile(file):
+            # skip file if in skipped folder or has skipped extension; the verdict of the rules is only
+            # re-evaluated if there is none yet or if the rules affecting this file have changed (all
+            # verdicts if the rules they are based on are unknown)
+            file_name = self.fileserver[file]['name']
+            detected_type = self.fileserver[file].get('detected_type')
+            reevaluate = not rules_unchanged and (not self.rules_state or
+                                                  rules_affect(file_path, file_name, file_extension, detected_type))
+            self.classify_entry(file, reevaluate)
+
+            # flag for all files whether they are still in place; size, modification time, inode and device are
+            # recorded, so the file can be recognized after it has been moved (see reconcile_moves())
+            if self.governor is None:
+                file_stat = moves.file_stat(file)
+            else:
+                file_stat = self.governor.call(moves.file_stat, file)
+            if file_stat is not None:
                 self.fileserver[file]['still_there'] = True
+                self.fileserver[file]['stat'] = file_stat
             else:
                 self.fileserver[file]['still_there'] = False
 
@@ -214,9 +527,17 @@ class Fileserver:
                 processed += 1
                 print(str(total) + " - Already processed: " + file)
 
-            self.fileserver[file]['db_entries'] = self.extract_db_connection(file)
-
-        self.save_json()
+            if self.update_db_connection(file, force_extraction):
+                extracted += 1
+
+        # without doublecheck, skipped and lost entries have not been classified with the current rules, so
+        # the rules the verdicts are based on are only stored after a pass which has classified all entries
+        if doublecheck:
+            self.rules_state = self.skip_rules.state()
+        self.compute_rollups()
+        if not self.save_json():
+            print("The updated catalogue has not been saved, the changes are only kept in this session.")
+        self.remove_checkpoint()
         uploadable = total - skipped - non_existent
         time_update = time.time() - time_update_start
 
@@ -224,14 +545,200 @@ class Fileserver:
         print("{} files in total.".format(total))
         print("{} files were marked to be skipped for upload.".format(skipped))
         print("{} files cannot be found.".format(non_existent))
+        print("{} database connections were extracted.".format(extracted))
         print("----")
         print("{} files remain to be uploaded.".format(uploadable))
+        if doublecheck:
+            self.skip_rules.report_unused()
+
+    """
+        @description:   This method recognizes files which have been moved or renamed (see moves.py): their
+                        old entry is no longer there and their new entry has been registered as unprocessed
+                        file. The upload state, the package assignments and the database connections of the
+                        old entry are carried over to the new one, and the old entry is removed, so moved
+                        files are not uploaded a second time. It relies on the state of the files recorded
+                        by update_entries(), so it should be called after update_entries().
+
+        @parameters:    * use_fingerprint [bool, default=False] - if True, files which cannot be told apart
+                            by size, modification time and inode are compared by their content fingerprint;
+                            afterwards, fingerprints are recorded for all processed files, so they can be
+                            recognized after future moves
+                        * dry_run [bool, default=False] - if True, the moves are only printed
+
+        @return:        [Dict] Returns the number of moves and of ambiguous groups.
+    """
+    def reconcile_moves(self, use_fingerprint=False, dry_run=False):
+        print("=> reconcile_moves(use_fingerprint={}, dry_run={})".format(use_fingerprint, dry_run))
+        found, ambiguous = moves.find_moves(self.fileserver, use_fingerprint, self.governor)
+
+        for old_path, new_path, criterion in found:
+            print("Moved ({}): {} -> {}".format(criterion, old_path, new_path))
+            if dry_run:
+                continue
+            before = self.rollup_before(new_path)
+            moves.carry_over(self.fileserver[old_path], self.fileserver[new_path], old_path)
+            self.rollup_after(new_path, before)
+            self.rollup_remove(old_path)
+            del self.fileserver[old_path]
+
+        for old_paths, new_paths in ambiguous:
+            print("Ambiguous: {} old and {} new files with the same size and modification time, e.g. {} -> {}".format(
+                len(old_paths), len(new_paths), old_paths[0], new_paths[0]))
+
+        if use_fingerprint and not dry_run:
+            files = self.iter_files(processed=True, still_there=True)
+            recorded = moves.record_fingerprints(self.fileserver, files, governor=self.governor)
+            print("{} fingerprints have been recorded.".format(recorded))
+
+        print("{} moved files have been found, {} groups are ambiguous.".format(len(found), len(ambiguous)))
+        if (found or use_fingerprint) and not dry_run:
+            self.save_json()
+        return {'moved': len(found), 'ambiguous': len(ambiguous)}
+
+    """
+        @description:   This method checks in parallel whether the files are still in place and records their
+                        size, modification time, inode and device, like update_entries() does one file after the
+                        other. The checks are throttled by self.governor; if none is set, a governor with
+                        the default limits is used.
+
+        @parameters:    * include_skipped [bool, default=False] - if True, skipped files are checked as well
+
+        @return:        [int] Returns the number of files which cannot be found.
+    """
+    def check_existence(self, include_skipped=False):
+        print("=> check_existence(include_skipped={})".format(include_skipped))
+        time_check_start = time.time()
+        governor = self.governor if self.governor is not None else IOGovernor()
+
+        files = (file for file, entry in self.fileserver.items()
+                 if not entry.get('pruned') and (include_skipped or not entry['skip']))
+        total = 0
+        non_existent = 0
+        for file, file_stat in governor.map(moves.file_stat, files):
+            total += 1
+            before = self.rollup_before(file)
+            entry = self.fileserver[file]
+            entry['still_there'] = file_stat is not None
+            if file_stat is not None:
+                entry['stat'] = file_stat
+            else:
+                non_existent += 1
+            self.rollup_after(file, before)
+
+        print("{} files checked, {} cannot be found. ({:.2f}s)".format(total, non_existent, time.time() - time_check_start))
+        governor.report()
+        return non_existent
+
+    """
+        @description:   This method is the pruning hook of register_files(). A folder is pruned if it lies
+                        within one of the skipped folders, i.e. if all of its files would be skipped by
+                        classify_entry() anyway. The skip rules need to be loaded (load_skip_rules()).
+
+        @return:        [String] Returns the rule why the folder is pruned, or None.
+    """
+    def prune_folder(self, folder_path):
+        return self.skip_rules.match_folder(folder_path)
+
+    """
+        @description:   This method creates the placeholder entry of a pruned folder. The placeholder stands
+                        for all files within the folder, which are skipped without being registered.
+    """
+    def create_placeholder(self, folder_path, reason):
+        return {
+            'extension' : "",
+            'still_there' : True,
+            'processed' : False,
+            'skip' : True,
+            'path' : folder_path,
+            'name' : "",
+            'pruned' : True,
+            'rule_verdict' : reason
+        }
+
+    """
+        @description:   This method checks whether a JPG file has a corresponding TIFF file, in which case
+                        the JPG is not uploaded.
+    """
+    def has_tiff_version(self, file):
+        if self.fileserver[file]['extension'] not in ("jpg", "jpeg"):
+            return False
+        path_stem = file[:file.rfind(".") + 1]
+        return path_stem + "tif" in self.fileserver or path_stem + "tiff" in self.fileserver
+
+    """
+        @description:   This method sets the 'skip' flag of a single entry according to the skip rules and
+                        the rule for invisible files. The skip rules need to be loaded (load_skip_rules()).
+
+                        If the content of a file does not match its extension (see sniff_files()), the
+                        skipped extensions are checked against the detected type as well. Files which have
+                        been found to be corrupt are always skipped.
+
+        @parameters:    * file [String] - key of the entry
+                        * reevaluate [bool] - if False, a stored verdict of the skip rules is reused
+    """
+    def classify_entry(self, file, reevaluate=True):
+        entry = self.fileserver[file]
+        verdict = entry.get('rule_verdict')
+        if verdict is None or reevaluate:
+            verdict = self.skip_rules.classify(entry['path'], entry['name'], entry['extension'])
+            if not verdict and entry.get('sniff', {}).get('mismatch') and entry.get('detected_type'):
+                verdict = self.skip_rules.match_name("", entry['detected_type']) or False
+            entry['rule_verdict'] = verdict
+        self.skip_rules.count(verdict)
+
+        if verdict:
+            entry['skip'] = True
+        elif entry['name'].startswith("."):
+            # skip all invisible files (starting with a .)
+            entry['skip'] = True
+        elif entry.get('sniff', {}).get('corrupt'):
+            entry['skip'] = True
+        else:
+            entry['skip'] = False
+        return entry['skip']
+
+    """
+        @description:   This method extracts the database connections of a single entry unless they have
+                        already been extracted with the current DB_EXTRACTOR_VERSION.
+
+        @return:        [bool] Returns True if the database connections have been extracted.
+    """
+    def update_db_connection(self, file, force=False):
+        entry = self.fileserver[file]
+        if force or entry.get('db_version') != DB_EXTRACTOR_VERSION or 'db_entries' not in entry:
+            entry['db_entries'] = self.extract_db_connection(file)
+            entry['db_version'] = DB_EXTRACTOR_VERSION
+            return True
+        return False
+
+    """
+        @description:   This method reads the skipped folders and skipped extensions from their files
+                        (see SkipRules) into self.skip_rules. self.skipped_folders contains the normalized
+                        folders, self.skipped_extensions the set of plain extensions.
+
+        @return:        [String] Returns a fingerprint (SHA-1) of both rule files. It changes as soon as
+                        any of the rules is edited, so stored verdicts can be checked against it.
+    """
+    def load_skip_rules(self):
+        self.skip_rules = SkipRules(self.path_skipped_folders, self.path_skipped_extensions)
+        self.skipped_folders = self.skip_rules.folders
+        self.skipped_extensions = self.skip_rules.extensions
+        return self.skip_rules.fingerprint
 
     """
         @description:   This method saves the current state of the JSON object to the hard disk. 
+                        While saving, the storage folder is locked against other sessions. If the catalogue
+                        has been saved by another session since this session loaded (or saved) it, nothing
+                        is written unless force is True.
+
+        @return:        [bool] Returns True if the catalogue has been saved.
     """
-    def save_json(self, alternative_path=""):
+    def save_json(self, alternative_path="", force=False):
         print("=> save_json({})".format(alternative_path))
+        if self.read_only:
+            print("This Fileserver object is read-only, nothing has been saved.")
+            return False
+
         if alternative_path == "":
             path = self.path_storage
         else:
@@ -239,38 +746,231 @@ class Fileserver:
 
         file_ext_number = 1
         path = self.slash(path)
-
-        # backup old file
-        not_moved = True # True until a free number has been found and old JSON been saved to
+        catalogue_path = path + self.json_fileserver + ".txt"
 
         # create archive directory if necessary
         if not os.path.isdir(path + "archive/"):
             os.makedirs(path + "archive/")
 
-        while not_moved:
-            if os.path.isfile(path + "/archive/" + self.json_fileserver + "_" + str(file_ext_number) + ".txt"):
-                file_ext_number += 1
-                continue
-            else:
-                try:
-                    old_path = path + self.json_fileserver + ".txt"
+        with FileLock(path + self.json_fileserver + ".lock"):
+            expected = self.catalogue_stamps.get(catalogue_path)
+            current = self.catalogue_stamp(catalogue_path)
+            if expected is not None and current != expected and not force:
+                print("The catalogue at {} has been changed by another session since it has been loaded. "
+                      "Nothing has been saved; reload it or use save_json(force=True).".format(catalogue_path))
+                return False
+
+            # create new file next to the current one; the current file is only replaced once the new
+            # one is complete, so a crash while writing never leaves the storage without a catalogue
+            temporary_path = catalogue_path + ".tmp"
+            self.write_json(temporary_path, self.fileserver)
+
+            # backup old file
+            not_moved = True # True until a free number has been found and old JSON been saved to
+
+            while not_moved:
+                if os.path.isfile(path + "/archive/" + self.json_fileserver + "_" + str(file_ext_number) + ".txt"):
+                    file_ext_number += 1
+                    continue
+                else:
+                    old_path = catalogue_path
                     new_path = path + "/archive/" + self.json_fileserver + "_" + str(file_ext_number) + ".txt"
-                    os.rename(old_path, new_path)
-                    not_moved = False
-                except FileNotFoundError:
+                    if os.path.isfile(old_path):
+                        try:
+                            # the current file stays in place until it is replaced below
+                            os.link(old_path, new_path)
+                        except OSError:
+                            os.rename(old_path, new_path)
                     not_moved = False
 
-        # create new file
-        with open(path + self.json_fileserver + ".txt", "w") as outfile:
-            json.dump(self.fileserver, outfile)
+            os.replace(temporary_path, catalogue_path)
+
+            # store the skip rules which the verdicts in the entries are based on
+            self.write_json(path + self.json_rules + ".txt.tmp", self.rules_state)
+            os.replace(path + self.json_rules + ".txt.tmp", path + self.json_rules + ".txt")
+
+            # store the concordance which the database connections are based on
+            self.write_json(path + self.json_concordance + ".txt.tmp", self.concordance_state)
+            os.replace(path + self.json_concordance + ".txt.tmp", path + self.json_concordance + ".txt")
+
+            self.catalogue_stamps[catalogue_path] = self.catalogue_stamp(catalogue_path)
+        return True
+
+    """
+        @description:   This method writes data as JSON and makes sure it has been written to the disk
+                        before returning.
+    """
+    def write_json(self, path, data):
+        with open(path, "w") as outfile:
+            json.dump(data, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    """
+        @description:   These methods handle the checkpoints of long operations, which are appended to one file
+                        in the storage folder (one JSON line per checkpoint). Every checkpoint contains the
+                        name of the operation, its counters and only the entries (and folders) which have been
+                        changed since the previous checkpoint, so writing a checkpoint does not become slower
+                        with the size of the catalogue. load_checkpoint() merges all checkpoints; an incomplete
+                        last line (crash while writing) is ignored.
+    """
+    def checkpoint_due(self, files_since_checkpoint):
+        if self.read_only or files_since_checkpoint == 0:
+            return False
+        return files_since_checkpoint >= self.checkpoint_every or \
+            time.time() - self.time_last_checkpoint >= self.checkpoint_interval
+
+    def save_checkpoint(self, operation, state):
+        path = self.slash(self.path_storage) + self.json_checkpoint + ".txt"
+        print("=> save_checkpoint({})".format(operation), flush=True)
+        state = dict(state)
+        state['operation'] = operation
+        line = json.dumps(state) + "\n"
+        with open(path, "a") as checkpoint_file:
+            checkpoint_file.write(line)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        self.time_last_checkpoint = time.time()
+
+    def load_checkpoint(self, operation):
+        path = self.slash(self.path_storage) + self.json_checkpoint + ".txt"
+        state = None
+        try:
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        part = json.loads(line)
+                    except ValueError:
+                        break
+                    if part.get('operation') != operation:
+                        print("The checkpoint at {} belongs to {}(), starting from the beginning.".format(
+                            path, part.get('operation')))
+                        return None
+                    if state is None:
+                        state = {'entries': {}, 'done_folders': []}
+                    state['entries'].update(part.pop('entries', {}))
+                    state['done_folders'].extend(part.pop('done_folders', []))
+                    state.update(part)
+        except FileNotFoundError:
+            pass
+
+        if state is None:
+            print("There is no checkpoint at {}, starting from the beginning.".format(path))
+            return None
+        print("Resuming {}() from the checkpoint at {}.".format(operation, path))
+        return state
+
+    def remove_checkpoint(self):
+        # the checkpoint belongs to the session writing the catalogue
+        if self.read_only:
+            return
+        path = self.slash(self.path_storage) + self.json_checkpoint + ".txt"
+        if os.path.isfile(path):
+            os.remove(path)
+
+    """
+        @description:   This method returns the state (modification time, size) of a catalogue file, or None
+                        if there is no such file.
+    """
+    def catalogue_stamp(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    """
+        @description:   This method exports the catalogue for analyses in chunks, as Parquet file if pyarrow
+                        is available and as CSV file otherwise (see export.py).
+
+        @parameters:    * alternative_path [String] - target file; by default fileserver_export.parquet
+                            (or .csv) in the storage folder
+                        * file_format [String] - "parquet", "csv" or "auto" (default)
+    """
+    def export_catalogue(self, alternative_path="", file_format="auto", chunk_size=100000):
+        if file_format == "auto":
+            file_format = "parquet" if export.pyarrow is not None else "csv"
+        if alternative_path == "":
+            path = self.slash(self.path_storage) + "fileserver_export." + file_format
+        else:
+            path = r"" + alternative_path
+        return export.export_catalogue(self, path, file_format, chunk_size)
+
+    """
+        @description:   This method writes the manifests for the bulk import of all files which are still to
+                        be uploaded (see manifest.py), filtered by package and/or path prefix. The manifests
+                        are written resource by resource and split as soon as they reach max_entries
+                        resources or max_bytes of files.
+
+        @parameters:    * package [String] - only files of this package
+                        * prefix [String] - only files whose path starts with this prefix
+                        * output_directory [String] - by default the folder manifests/ in the storage folder
+                        * file_format [String] - "json" (default) or "xml"
+                        * max_entries [int] - maximum number of resources per manifest
+                        * max_bytes [int] - maximum total size of the files listed in one manifest
+                        * include_processed [bool, default=False] - if True, processed files are listed too
+
+        @return:        [List] Returns the paths of the manifests written.
+    """
+    def write_manifests(self, package=None, prefix=None, output_directory="", file_format="json", max_entries=10000,
+                        max_bytes=50 * 1024 ** 3, include_processed=False):
+        print("=> write_manifests(package={}, prefix={}, file_format={})".format(package, prefix, file_format))
+        if output_directory == "":
+            output_directory = self.slash(self.path_storage) + "manifests/"
+        if prefix is not None:
+            prefix = self.slash(prefix)
+
+        name = package or (prefix.rstrip("/").rsplit("/", 1)[-1] if prefix else "") or "manifest"
+        name = "".join(character if character.isalnum() or character in "-_" else "_" for character in name)
+
+        files = self.iter_files(package=package, prefix=prefix, skip=False, still_there=True,
+                                processed=None if include_processed else False)
+        written = manifest.write_manifests(self.fileserver, files, output_directory, name, file_format, max_entries,
+                                           max_bytes)
+
+        for path, entries, size in written:
+            print("- {}: {} resources, {:.2f} GB".format(path, entries, size / 1024 ** 3))
+        print("{} manifests have been written.".format(len(written)))
+        return [path for path, entries, size in written]
+
+    """
+        @description:   This method compares two snapshots of the catalogue without loading them (see
+                        snapdiff.py) and prints the number of differences.
+
+        @parameters:    * old [String/int] - number of the archived snapshot, "current" or a path
+                        * new [String/int] - number of the archived snapshot, "current" (default) or a path
+                        * output_path [String] - if set, all differences are written there as JSON Lines
+
+        @return:        [Dict] Returns the number of added, removed and changed entries.
+    """
+    def diff_snapshots(self, old, new="current", output_path=""):
+        print("=> diff_snapshots({}, {})".format(old, new))
+        old_path = snapdiff.snapshot_path(old, self.path_storage, self.json_fileserver)
+        new_path = snapdiff.snapshot_path(new, self.path_storage, self.json_fileserver)
+        changes = snapdiff.diff_snapshots(old_path, new_path)
+
+        if output_path:
+            with open(output_path, "w", encoding="utf-8") as output_file:
+                statistics = snapdiff.write_diff(changes, output_file)
+        else:
+            with open(os.devnull, "w") as output_file:
+                statistics = snapdiff.write_diff(changes, output_file)
+
+        print("{} added, {} removed, {} changed.".format(statistics['added'], statistics['removed'], statistics['changed']))
+        for field, number in sorted(statistics['fields'].items()):
+            print("- {}: {} entries".format(field, number))
+        return statistics
 
     """
         @description:   This method loads an already stored JSON-file. If no JSON file is available
                         at the specified location, a new registering takes place.
                         
+                        While loading, the storage folder is locked against sessions which are saving.
+
         @return:        [Dict] Returns the dictionary contained in the Fileserver JSON (or, if not
                         available, a new one).
     """
+    @memreport.tracked
     def load_json(self, alternative_path=""):
         print("=> load_json({})".format(alternative_path))
         if alternative_path == "":
@@ -278,240 +978,160 @@ class Fileserver:
         else:
             path = r"" + alternative_path
         path = self.slash(path)
+        path_lock = path[:path.rfind("/") + 1] + self.json_fileserver + ".lock"
+
+        # a crash between archiving the old and renaming the new catalogue leaves the new one as .tmp; it is only
+        # restored if it is complete
+        if not os.path.isfile(path) and os.path.isfile(path + ".tmp") and not self.read_only:
+            try:
+                with open(path + ".tmp") as json_file:
+                    json.load(json_file)
+                print("Restoring the catalogue from {}.".format(path + ".tmp"))
+                os.replace(path + ".tmp", path)
+            except ValueError:
+                print("{} is incomplete and is not restored; the last complete catalogue is in the archive "
+                      "folder.".format(path + ".tmp"))
 
         try:
-            with open(path) as json_file:
-                data = json.load(json_file)
+            with FileLock(path_lock, shared=True):
+                with open(path) as json_file:
+                    data = json.load(json_file)
+                self.catalogue_stamps[path] = self.catalogue_stamp(path)
                 print("Fileserver JSON has been successfully loaded.")
                 self.fileserver = data
+                self.rollups = None
+
+            # share one string per folder instead of one per entry
+            for entry in self.fileserver.values():
+                entry['path'] = sys.intern(entry['path'])
         except FileNotFoundError:
+            if self.read_only:
+                print("No file has been found at {}.".format(path))
+                return
             print("No file has been found at {}. A new file will be created.".format(path))
             self.register_files()
             self.save_json()
+            return
+
+        # load the skip rules the stored verdicts are based on; without them, all verdicts are re-evaluated
+        path_rules = path[:path.rfind("/") + 1] + self.json_rules + ".txt"
+        try:
+            with open(path_rules) as json_file:
+                self.rules_state = json.load(json_file)
+        except FileNotFoundError:
+            self.rules_state = {}
+
+        # load the concordance the database connections are based on; older catalogues without it are assumed to
+        # be based on the current concordance
+        path_concordance_state = path[:path.rfind("/") + 1] + self.json_concordance + ".txt"
+        try:
+            with open(path_concordance_state) as json_file:
+                self.concordance_state = json.load(json_file)
+        except FileNotFoundError:
+            self.concordance_state = self.concordance.state()
+
+    """
+        @description:   This method checks the extracted database connections of all files against a local
+                        CSV or JSON export of the database objects (see dbreconcile.py). It reports references
+                        to identifiers which do not exist in the database (dangling), identifiers which match
+                        several objects (ambiguous) and database objects no file refers to (unreferenced).
+
+        @parameters:    * path_export [String] - the export of the database objects
+                        * output_path [String] - if set, all findings are written there as JSON Lines
+                        * include_skipped [bool, default=False] - if True, skipped and lost files are checked too
+
+        @return:        [Dict] Returns the number of findings per type and per category.
+    """
+    def reconcile_db(self, path_export, output_path="", include_skipped=False):
+        print("=> reconcile_db({})".format(path_export))
+        index = dbreconcile.DatabaseIndex(self.concordance).load(self.slash(path_export))
+        print("{} database objects loaded.".format(index.count))
+
+        if include_skipped:
+            entries = self.fileserver.items()
+        else:
+            entries = ((file, self.fileserver[file]) for file in self.iter_files(skip=False, still_there=True))
+        findings = dbreconcile.reconcile(index, entries)
+
+        if output_path:
+            with open(output_path, "w", encoding="utf-8") as output_file:
+                statistics = dbreconcile.write_findings(findings, output_file)
+        else:
+            statistics = dbreconcile.write_findings(findings)
+        dbreconcile.print_statistics(statistics)
+        return statistics
 
     """
         @description:   This method simply changes all slash characters such that URLs are
-                        formatted in the same way.
+                        formatted in the same way. Strings without backslashes are returned as
+                        they are, without creating a new string.
                         
         @return:        [String] Returns the re-formatted string.
     """
     def slash(self, string):
+        if "\\" not in string:
+            return string
         result = string.replace(r"\\", "/")
         result = result.replace("\\", "/")
         return result
 
-    def extract_db_connection(self, path_and_file_name):
-        def add_value(dictionary, value, key):
-            if key not in dictionary:
-                dictionary[key] = []
-            if not value in dictionary[key]:
-                dictionary[key].append(value)
-            return 1
-
-        def get_regex_findall(regex, string, ignorecase=True):
-            if ignorecase:
-                regex_compiled = re.compile(regex, re.IGNORECASE)
-            else:
-                regex_compiled = re.compile(regex)
-
-            findall = re.findall(regex_compiled, string)
-
-            result = None
-            if findall:
-                result = findall[0][0]
-
-            if result:
-                return result
-            else:
-                return None
-
-        def get_regex_match(regex, string, ignorecase=True):
-            if ignorecase:
-                regex_compiled = re.compile(regex, re.IGNORECASE)
-            else:
-                regex_compiled = re.compile(regex)
-
-            match = re.match(regex_compiled, string)
-            result = None
-            if match:
-                result = match.group(0)
-
-            if result:
-                return result
-            else:
-                return None
-
-        def contains_au(string):
-            regex_au = r"(AU\d+)"
-
-            au = get_regex_match(regex_au, string)
-
-            if au:
-                if au.startswith("AU"):
-                    au = au[2:]
-                return au
-            else:
-                return False
-
-        def contains_field_number(string):
-            regex_field = r"(\b(AU)?\d{1,5}_V?\d+\b)"
-
-            if get_regex_match(regex_field, string):
-                return get_regex_match(regex_field, string)
-            else:
-                return False
-
-        def contains_find(string):
-            regex_ab = r"(\bAB\d+(\.\d+)?\b)"
-            regex_c = r"\b(C\d+[a-z]?)"
-            regex_chest = r"(\bCHEST\d+\b)"
-            regex_mask = r"(\bMASK\d+\b)"
-            regex_jackal = r"(\bJackal\d+\b)"
-            regex_co = r"(\bCO\d+(\.\d+)?\b)"
-            regex_w = r"(\bW\d+(\.\d+)?[a-z]?\b)"
-            regex_u = r"(\bUI+\d*x?R?[a-z]?)"
-            regex_dm = r"(\bDM\d+\b)"
-            regex_mi = r"(\bMI\d+\b)"
-            regex_fn = r"(\bFN\d+[\.]?\d{0,2}([a-z]([-|+][a-z])*)?)"
-            regex_t = r"(\bT\d+\b)"
-            regex_jde = r"(\bJD?E\d+\D{0,2}\b)"
-            regex_dn = r"(\bDN\d+(\.\d+)?\b)"
-            regex_cone = r"(\bCONE\d+(\.\d+)?\b)"
-
-            if get_regex_match(regex_ab, string):
-                return get_regex_match(regex_ab, string)
-            elif get_regex_match(regex_c, string):
-                return get_regex_match(regex_c, string)
-            elif get_regex_match(regex_chest, string):
-                return get_regex_match(regex_chest, string)
-            elif get_regex_match(regex_mask, string):
-                return get_regex_match(regex_mask, string)
-            elif get_regex_match(regex_jackal, string):
-                return get_regex_match(regex_jackal, string)
-            elif get_regex_match(regex_jde, string):
-                return get_regex_match(regex_jde, string)
-            elif get_regex_match(regex_co, string):
-                return get_regex_match(regex_co, string)
-            elif get_regex_match(regex_w, string):
-                return get_regex_match(regex_w, string)
-            elif get_regex_match(regex_u, string):
-                return get_regex_match(regex_u, string)
-            elif get_regex_match(regex_dm, string):
-                return get_regex_match(regex_dm, string)
-            elif get_regex_match(regex_mi, string):
-                return get_regex_match(regex_mi, string)
-            elif get_regex_match(regex_fn, string):
-                return get_regex_findall(regex_fn, string, False)
-            elif get_regex_match(regex_t, string):
-                return get_regex_match(regex_t, string)
-            elif get_regex_match(regex_dn, string):
-                return get_regex_match(regex_dn, string)
-            elif get_regex_match(regex_cone, string):
-                return get_regex_match(regex_cone, string)
-            else:
-                return False
-
-        def contains_planum(string):
-            regex_planum = r"(\b(AU)?\d+PL\d+(\.\d+)?\b)"
-
-            if get_regex_match(regex_planum, string):
-                planum = get_regex_match(regex_planum, string)
-                if planum.startswith("AU"):
-                    planum = planum[2:]
-                return planum
-            else:
-                return False
-
-        def contains_profile(string):
-            regex_profile = r"(\b(AU)?\d+PR\d+\b)"
-
-            if get_regex_match(regex_profile, string):
-                profile = get_regex_match(regex_profile, string)
-                if profile.startswith("AU"):
-                    profile = profile[2:]
-                return profile
-            else:
-                return False
-
-        def contains_su(string):
-            regex_su = r"(\bPL\d+-\d+)"
-
-            if get_regex_match(regex_su, string):
-                return get_regex_match(regex_su, string)
-            else:
-                return False
+    """
+        @description:   This method normalizes the path of a folder once when it enters the Fileserver object.
+                        The result is interned, so all entries of a folder share one single string and
+                        comparisons between them are cheap.
 
-        def contains_zo(string):
-            regex_zo = r"(\bZO\d+\b)"
-            regex_zs = r"(\bZS\\d+[a-z]?(\.\d+[a-z]?)?)"
-            regex_zp = r"(\bZP\d+[a-z]?(\.\d+[a-z]?)?)"
-            regex_zk = r"(\bZK[S|C]?\d+[a-z]?(\.\d+[a-z]?)?)"
-
-            if get_regex_match(regex_zo, string):
-                return get_regex_match(regex_zo, string)
-            elif get_regex_match(regex_zs, string):
-                return get_regex_match(regex_zs, string)
-            elif get_regex_match(regex_zp, string):
-                return get_regex_match(regex_zp, string)
-            elif get_regex_match(regex_zk, string):
-                return get_regex_match(regex_zk, string)
-            else:
-                return False
+        @return:        [String] Returns the normalized path of the folder.
+    """
+    def normalize_folder(self, path):
+        return sys.intern(self.slash(path))
 
-        def contains_tomb(string):
-            regex_tomb = r"(\b(TT|K)\d+[a-c]?|95[a-c])"
-
-            tomb_concordance = {
-                "k85": "1",
-                "k453": "100",
-                "k90": "500",
-                "k555": "2000",
-                "tt84": "6500",
-                "tt95": "10000",
-                "95a": "10010",
-                "tt95a": "10010",
-                "95b": "10003",
-                "tt95b": "10003",
-                "95c": "10004",
-                "tt95c": "10004"
-            }
-
-            tomb = get_regex_match(regex_tomb, string)
-
-            if tomb:
-                tomb = tomb.lower()
-                if tomb in tomb_concordance:
-                    tomb = tomb_concordance[tomb]
-                return tomb.upper()
-            else:
-                return False
+    """
+        @description:   This method joins a normalized folder and a file name to the normalized file path,
+                        which is used as key in self.fileserver.
+    """
+    def join_path(self, folder, name):
+        if folder.endswith("/"):
+            return folder + name
+        return folder + "/" + name
 
-        keys = {}
+    """
+        @description:   This method extracts the database connections (AU, FieldNumber, Find, Planum, Profile,
+                        SU, ZO, Tomb) from the path of a file (see extraction.py).
 
-        path = self.slash(path_and_file_name)
-        path = path.replace("/", " ")
+        @return:        [Dict] Returns a dictionary with a list of identifiers per category found.
+    """
+    def extract_db_connection(self, path_and_file_name):
+        return extraction.extract_db_connection(self.slash(path_and_file_name), self.concordance)
 
-        components = path.split(' ')
+    """
+        @description:   This method reloads the concordance file (./storage/concordance.json) if it has been
+                        modified and compares it with the concordance the database connections have been
+                        extracted with, which is saved with the catalogue. The database connections of all
+                        entries which contain a category whose rules have changed are extracted again, so
+                        curators can extend the concordance during a running session or between sessions.
 
-        for component in components:
-            if contains_au(component):
-                add_value(keys, contains_au(component), 'AU')
-            if contains_field_number(component):
-                add_value(keys, contains_field_number(component), 'FieldNumber')
-            if contains_find(component):
-                add_value(keys, contains_find(component), 'Find')
-            if contains_planum(component):
-                add_value(keys, contains_planum(component), 'Planum')
-            if contains_profile(component):
-                add_value(keys, contains_profile(component), 'Profile')
-            if contains_su(component):
-                add_value(keys, contains_su(component), 'SU')
-            if contains_zo(component):
-                add_value(keys, contains_zo(component), 'ZO')
-            if contains_tomb(component):
-                add_value(keys, contains_tomb(component), 'Tomb')
+        @return:        [int] Returns the number of entries whose database connections have been extracted.
+    """
+    def reload_concordance(self):
+        self.concordance.reload_if_changed()
+        if self.concordance_state.get('fingerprint') == self.concordance.fingerprint:
+            return 0
+
+        changed = self.concordance.changes(self.concordance_state)
+        self.concordance_state = self.concordance.state()
+        if not changed:
+            return 0
+        print("The concordance has changed since the database connections have been extracted, changed "
+              "categories: {}".format(", ".join(sorted(changed))))
 
-        return keys
+        total = 0
+        for file, entry in self.fileserver.items():
+            db_entries = entry.get('db_entries')
+            if db_entries and not changed.isdisjoint(db_entries):
+                self.update_db_connection(file, True)
+                total += 1
+        print("{} database connections have been extracted again.".format(total))
+        return total
 
     """
         @description:   This method prints to the console a set containing all extensions of the files
@@ -551,6 +1171,81 @@ class Fileserver:
             print("There are currently no files registered. Please reload the existing file or re-register"
                   "the files on the fileserver.")
 
+    """
+        @description:   This method iterates lazily over all registered files which match all of the given
+                        filters. Filters which are None are not applied, so the filters can be combined at will.
+                        No list is built, i.e. the results can be streamed into further processing steps.
+
+        @parameters:    * extension [String] - only files with this extension
+                        * package [String] - only files which have been assigned to this package
+                        * skip [bool] - only files whose 'skip' flag has this value
+                        * still_there [bool] - only files whose 'still_there' flag has this value
+                        * processed [bool] - only files whose 'processed' flag has this value
+                        * prefix [String] - only files whose path starts with this prefix
+                        * db_category [String] - only files with a database connection of this category,
+                            e.g. 'AU' or 'Tomb'
+                        * db_connection [bool] - only files with (True) or without (False) any database
+                            connection
+                        * in_package [bool] - only files which are (True) or are not (False) part of any
+                            package
+
+        @return:        [Generator] Yields the paths of the matching files.
+    """
+    def iter_files(self, extension=None, package=None, skip=None, still_there=None, processed=None, prefix=None,
+                   db_category=None, db_connection=None, in_package=None):
+        if extension is not None:
+            extension = extension.lower()
+        if package is not None:
+            package = package.lower()
+        if prefix is not None:
+            prefix = self.slash(prefix)
+
+        for file, entry in self.fileserver.items():
+            if skip is not None and entry['skip'] != skip:
+                continue
+            if still_there is not None and entry['still_there'] != still_there:
+                continue
+            if processed is not None and entry['processed'] != processed:
+                continue
+            if extension is not None and entry['extension'] != extension:
+                continue
+            if prefix is not None and not file.startswith(prefix):
+                continue
+            if package is not None and package not in entry.get('packages', ()):
+                continue
+            if in_package is not None and ('packages' in entry) != in_package:
+                continue
+            if db_category is not None and not entry.get('db_entries', {}).get(db_category):
+                continue
+            if db_connection is not None and bool(entry.get('db_entries')) != db_connection:
+                continue
+            yield file
+
+    """
+        @description:   Generator variants of the query methods below. Unless include_skipped is True, only
+                        files are yielded which are neither skipped nor lost.
+    """
+    def iter_files_by_extension(self, extension, include_skipped=False):
+        if include_skipped:
+            return self.iter_files(extension=extension)
+        return self.iter_files(extension=extension, skip=False, still_there=True)
+
+    def iter_files_by_package(self, package_name, include_skipped=False):
+        # lost files are never part of the result, skipped files only if requested
+        if include_skipped:
+            return self.iter_files(package=package_name, still_there=True)
+        return self.iter_files(package=package_name, skip=False, still_there=True)
+
+    def iter_files_without_db_connection(self, include_skipped=False):
+        if include_skipped:
+            return self.iter_files(db_connection=False)
+        return self.iter_files(db_connection=False, skip=False, still_there=True)
+
+    def iter_unassigned_files(self, include_skipped=False):
+        if include_skipped:
+            return self.iter_files(db_connection=False, in_package=False)
+        return self.iter_files(db_connection=False, in_package=False, skip=False, still_there=True)
+
     """
         @description:   This method prints to the console all files including their path which are
                         registered with the specified file type extension.
@@ -561,74 +1256,32 @@ class Fileserver:
                             files will be printed which are destined for upload
     """
     def get_files_by_extension(self, extension, print_skipped=False):
-        for file in self.fileserver:
-            skipped = self.fileserver[file]['skip'] or not self.fileserver[file]['still_there']
-            if skipped and not print_skipped:
-                continue
-            if self.fileserver[file]['extension'] == extension.lower():
-                print(file)
+        for file in self.iter_files_by_extension(extension, print_skipped):
+            print(file)
 
     def get_files_without_db_connection(self, print_skipped=False):
         print("=> get_files_without_db_connection(print_skipped={}".format(print_skipped))
         total = 0
-        for file in self.fileserver:
-            skipped = self.fileserver[file]['skip']
-            file_found = self.fileserver[file]['still_there']
-            if not print_skipped:
-                if skipped or not file_found:
-                    continue
-            if 'db_entries' not in self.fileserver[file] or not self.fileserver[file]['db_entries']:
-                print(file)
-                total += 1
+        for file in self.iter_files_without_db_connection(print_skipped):
+            print(file)
+            total += 1
         print("{} files have no database connection.".format(total))
 
     def get_unassigned_files(self, print_skipped=False):
         print("=> get_unassigned_files(print_skipped={}".format(print_skipped))
-        total = 0
         set_unassigned_files = []
-        for file in self.fileserver:
-            skipped = self.fileserver[file]['skip']
-            file_found = self.fileserver[file]['still_there']
-            if not print_skipped:
-                if skipped or not file_found:
-                    continue
-
-            no_db_connection = False
-            no_package_connection = False
-
-            if 'db_entries' not in self.fileserver[file] or not self.fileserver[file]['db_entries']:
-                no_db_connection = True
-            if 'packages' not in self.fileserver[file]:
-                no_package_connection = True
-
-            if no_db_connection and no_package_connection:
-                total += 1
-                set_unassigned_files.append(file)
-                print(file)
-        print("{} files have no database connection and are not part of any package.".format(total))
-        return set_unassigned_files.sort()
+        for file in self.iter_unassigned_files(print_skipped):
+            set_unassigned_files.append(file)
+            print(file)
+        print("{} files have no database connection and are not part of any package.".format(len(set_unassigned_files)))
+        set_unassigned_files.sort()
+        return set_unassigned_files
 
     def get_unassigned_folders(self, print_skipped=False):
         print("=> get_unassigned_folders(print_skipped={}".format(print_skipped))
-        paths = []
-        for file in self.fileserver:
-            skipped = self.fileserver[file]['skip']
-            file_found = self.fileserver[file]['still_there']
-            if not print_skipped:
-                if skipped or not file_found:
-                    continue
-
-            no_db_connection = False
-            no_package_connection = False
-
-            if 'db_entries' not in self.fileserver[file] or not self.fileserver[file]['db_entries']:
-                no_db_connection = True
-            if 'packages' not in self.fileserver[file]:
-                no_package_connection = True
-
-            if no_db_connection and no_package_connection:
-                if self.fileserver[file]['path'] not in paths:
-                    paths.append(self.fileserver[file]['path'])
+        counter = 'unassigned_total' if print_skipped else 'unassigned'
+        rollups = self.get_rollups()
+        paths = [folder for folder, rollup in rollups.folders.items() if rollup['direct'][counter] > 0]
 
         paths.sort()
         for path in paths:
@@ -651,25 +1304,31 @@ class Fileserver:
     def add_folder_to_package(self, path_to_folder, package_name, recursive):
         print("=> add_folder_to_package(folder: {}, package_name: {}, recursive: {})".format(path_to_folder, package_name.lower(), recursive))
         total = 0
+        path_to_folder = self.slash(path_to_folder)
+        package_name = package_name.lower()
         for file in self.fileserver:
             file_path = self.fileserver[file]['path']
 
             # skip file if it's not in the right place
             if recursive:
-                if not file_path.startswith(self.slash(path_to_folder)):
+                if not file_path.startswith(path_to_folder):
                     continue
             else:
-                if not file_path == self.slash(path_to_folder):
+                if not file_path == path_to_folder:
                     continue
 
+            before = self.rollup_before(file)
+
             # if package set does not yet exist, create it
             if 'packages' not in self.fileserver[file]:
                 self.fileserver[file]['packages'] = []
 
-            if package_name.lower() not in self.fileserver[file]['packages']:
-                self.fileserver[file]['packages'].append(package_name.lower())
+            if package_name not in self.fileserver[file]['packages']:
+                self.fileserver[file]['packages'].append(package_name)
                 total += 1
 
+            self.rollup_after(file, before)
+
         print("Successfully added package {0} to {1} files.".format(package_name.lower(), total))
 
     """
@@ -683,20 +1342,9 @@ class Fileserver:
     """
     def get_files_by_package(self, package_name, print_skipped=False):
         total = 0
-        for file in self.fileserver:
-            skipped = self.fileserver[file]['skip']
-            file_found = self.fileserver[file]['still_there']
-
-            if skipped and not print_skipped:
-                continue
-            if not file_found:
-                continue
-            if 'packages' not in self.fileserver[file]:
-                continue
-
-            if package_name.lower() in self.fileserver[file]['packages']:
-                total += 1
-                print(file)
+        for file in self.iter_files_by_package(package_name, print_skipped):
+            total += 1
+            print(file)
 
         print("{0} files have been found for package {1}.".format(total, package_name.lower()))
 
@@ -731,28 +1379,97 @@ class Fileserver:
                 deletable_entries.append(file)
 
         for entry in deletable_entries:
+            self.rollup_remove(entry)
             del self.fileserver[entry]
 
         self.save_json()
 
+    """
+        @description:   This method computes the aggregated numbers of all folders (see rollups.py) from
+                        scratch. It is called after each registration and update; in between, the numbers
+                        are kept current by rollup_before()/rollup_after()/rollup_remove().
+    """
+    def compute_rollups(self):
+        self.rollups = FolderRollups()
+        self.rollups.compute(self.fileserver)
+        return self.rollups
+
+    def get_rollups(self):
+        if self.rollups is None:
+            return self.compute_rollups()
+        return self.rollups
+
+    """
+        @description:   These methods keep the aggregated numbers current when a single entry is changed:
+                        rollup_before() has to be called before the change, rollup_after() after it (for a
+                        new entry, with before=None). rollup_remove() has to be called before an entry is
+                        deleted. As long as no numbers have been computed, nothing has to be done.
+    """
+    def rollup_before(self, file):
+        if self.rollups is None or file not in self.fileserver:
+            return None
+        return self.rollups.counters_of(self.fileserver[file])
+
+    def rollup_after(self, file, before):
+        if self.rollups is None:
+            return
+        if before is None:
+            self.rollups.insert(self.fileserver[file])
+        else:
+            self.rollups.change(self.fileserver[file], before)
+
+    def rollup_remove(self, file):
+        if self.rollups is not None and file in self.fileserver:
+            self.rollups.remove(self.fileserver[file])
+
+    """
+        @description:   This method reports the memory taken by the catalogue, broken down by structure and by
+                        top-level folder, and the memory measured during load_json() and update_entries() if
+                        the object has been created with track_memory=True (see memreport.py). The deep sizes
+                        are computed entry by entry, which takes a while for large catalogues.
+
+        @parameters:    * output_path [String] - if set, the report is written there as JSON
+                        * top [int, default=20] - number of top-level folders in the report
+
+        @return:        [Dict] Returns the report.
+    """
+    def memory_report(self, output_path="", top=20):
+        print("=> memory_report({})".format(output_path))
+        report = memreport.memory_report(self, top)
+
+        megabyte = 1024 ** 2
+        catalogue = report['catalogue']
+        print("Catalogue: {} entries, {:.1f} MB".format(catalogue['entries'], catalogue['total'] / megabyte))
+        for structure, size in catalogue['structures'].items():
+            print("- {}: {:.1f} MB".format(structure, size / megabyte))
+        print("Top-level folders:")
+        for folder, size in report['folders'].items():
+            print("- {}: {:.1f} MB".format(folder or "(root)", size / megabyte))
+        for name, size in report['other'].items():
+            print("{}: {:.1f} MB".format(name, size / megabyte))
+        for operation, numbers in report['operations'].items():
+            print("{}(): {:.1f} MB before, {:.1f} MB after, peak {:.1f} MB".format(
+                operation, numbers['before'] / megabyte, numbers['after'] / megabyte, numbers['peak'] / megabyte))
+        process = report['process']
+        print("Overhead: tracemalloc {:.1f} MB, report {:.1f} MB".format(
+            process['tracemalloc'] / megabyte, process['report'] / megabyte))
+
+        if output_path:
+            with open(output_path, "w") as output_file:
+                json.dump(report, output_file, indent=4)
+        return report
+
     """
         @description:   Simple method which simply counts all the flags available for the data entries.
+                        The numbers are taken from the aggregated numbers of the folders.
     """
     def get_numbers(self):
         print("=> get_numbers()")
-        counter_skipped = 0
-        counter_lost = 0
-        counter_processed = 0
-        counter_total = 0
-
-        for file in self.fileserver:
-            counter_total += 1
-            if self.fileserver[file]['skip']:
-                counter_skipped += 1
-            if not self.fileserver[file]['still_there']:
-                counter_lost += 1
-            if self.fileserver[file]['processed']:
-                counter_processed += 1
+        numbers = self.get_rollups().get("")
+        counter_skipped = numbers['skipped']
+        counter_lost = numbers['lost']
+        counter_processed = numbers['processed']
+        counter_total = numbers['files']
 
         print("Aggregation of numbers has finished:")
         print("- Elements in total: {}".format(counter_total))
@@ -760,8 +1477,42 @@ class Fileserver:
         print("- Elements lost: {}   -   still there: {}".format(counter_lost, counter_total-counter_lost))
         print("- Elements processed: {}   -   unprocessed: {}".format(counter_processed, counter_total-counter_processed-counter_skipped-counter_lost
                                                                       ))
+        if numbers['pruned']:
+            print("- Pruned folders: {}".format(numbers['pruned']))
+
+    """
+        @description:   This method prints the aggregated numbers of a folder.
+
+        @parameters:    * path_to_folder [String] - Path to the folder.
+                        * recursive [bool] - if True (default), the numbers include all subfolders.
+
+        @return:        [Dict] Returns the numbers of the folder.
+    """
+    def get_folder_numbers(self, path_to_folder, recursive=True):
+        print("=> get_folder_numbers(folder: {}, recursive: {})".format(path_to_folder, recursive))
+        numbers = self.get_rollups().get(self.slash(path_to_folder), recursive)
+        print("- Files: {} (skipped: {}, lost: {}, processed: {})".format(
+            numbers['files'], numbers['skipped'], numbers['lost'], numbers['processed']))
+        print("- Files without database connection and package: {}".format(numbers['unassigned']))
+        print("- Extensions:")
+        pprint(numbers['extensions'])
+        return numbers
 
     def test_string(self, string):
         print("=> test_string(string='{}')".format(string))
         result = self.extract_db_connection(string)
-        print(result)
\ No newline at end of file
+        print(result)
+
+    """
+        @description:   Bulk version of test_string(): extracts the database connections of all paths in a
+                        file (one path per line) in parallel and writes them as JSON Lines (see extraction.py).
+
+        @return:        [Dict] Returns the hit statistics per category.
+    """
+    def test_strings(self, path_to_list, output_path, workers=None):
+        print("=> test_strings(path_to_list='{}', output_path='{}')".format(path_to_list, output_path))
+        with open(path_to_list, encoding="utf-8") as input_file, open(output_path, "w", encoding="utf-8") as output_file:
+            results = extraction.extract_bulk(input_file, self.path_concordance, workers)
+            statistics = extraction.write_results(results, output_file)
+        pprint(statistics)
+        return statistics
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""
+    @description:   IOGovernor class which controls how hard the scans of the Fileserver hit the share: it limits
+                    the number of operations and bytes per second (token buckets), follows time-of-day
+                    profiles (e.g. gentle during office hours, full speed at night) and adapts the number of
+                    concurrent operations to the latency of the share. The latency is measured per window of
+                    operations: if it rises above the target (by default twice the lowest latency seen so
+                    far), the concurrency is halved, otherwise it is increased by one (AIMD). For listings,
+                    only the time until the first batch of entries has arrived is taken as latency, so large
+                    directories are comparable to single operations like stat().
+
+                    Profiles are given as list of dictionaries; the first profile whose time range contains
+                    the current time applies, otherwise the limits given to the constructor:
+
+                        governor = IOGovernor(ops_per_second=None, max_workers=16, profiles=[
+                            {'start': "07:00", 'end': "19:00", 'ops_per_second': 200,
+                             'bytes_per_second': 20 * 1024 ** 2, 'max_workers': 2}
+                        ])
+                        fileserver.governor = governor
+                        fileserver.register_files()
+
+                    All file system operations of the governor (listing, stat, read) are executed through
+                    call(), operation() or scandir(), which wait for a free slot and for the budget. The
+                    directory cache (register_files(use_cache=True)) lists the folders it has to list again
+                    through the governor as well.
+"""
+
+import json, os, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+import ext.scandir as scandir
+
+
+"""
+    @description:   Token bucket which hands out a number of tokens per second; rate None means unlimited.
+"""
+class TokenBucket:
+    def __init__(self, rate=None, burst=None):
+        self.lock = threading.Lock()
+        self.rate = None
+        self.burst = None
+        self.tokens = 0.0
+        self.time_last = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        with self.lock:
+            self.rate = rate
+            self.burst = burst if burst is not None else (rate if rate else None)
+            if self.burst is not None:
+                self.tokens = min(self.tokens, self.burst)
+
+    """
+        @description:   This method waits until the tokens are available. Requests larger than the burst
+                        are granted once the bucket is full and leave it in debt, so they cannot block forever.
+    """
+    def acquire(self, amount=1):
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.time_last) * self.rate)
+                self.time_last = now
+                if self.tokens >= min(amount, self.burst):
+                    self.tokens -= amount
+                    return
+                waiting = (min(amount, self.burst) - self.tokens) / self.rate
+            time.sleep(waiting)
+
+
+"""
+    @description:   Stopwatch of a single operation; it can be stopped before the operation has finished.
+"""
+class Stopwatch:
+    def __init__(self):
+        self.time_start = time.monotonic()
+        self.time_stop = None
+
+    def stop(self):
+        if self.time_stop is None:
+            self.time_stop = time.monotonic()
+
+    def elapsed(self):
+        return (self.time_stop if self.time_stop is not None else time.monotonic()) - self.time_start
+
+
+class IOGovernor:
+    def __init__(self, ops_per_second=None, bytes_per_second=None, min_workers=1, max_workers=8,
+                 target_latency=None, window=50, profiles=None):
+        self.default_limits = {
+            'ops_per_second': ops_per_second,
+            'bytes_per_second': bytes_per_second,
+            'max_workers': max_workers
+        }
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_latency = target_latency
+        self.window = window
+        self.profiles = profiles or []
+
+        self.ops = TokenBucket(ops_per_second)
+        self.bytes = TokenBucket(bytes_per_second)
+        self.condition = threading.Condition()
+        self.active = 0
+        self.limit = max(min_workers, min(max_workers, 4))
+        self.profile_limit = max_workers
+        self.profile = None
+        self.profile_applied = False
+        self.time_profile_check = 0.0
+
+        self.latencies = []
+        self.lowest_latency = None
+        self.statistics = {'ops': 0, 'bytes': 0, 'latency': 0.0, 'backoffs': 0, 'increases': 0}
+
+    """
+        @description:   This method creates a governor from a JSON file with the keyword arguments of the
+                        constructor (including the list of profiles).
+    """
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as json_file:
+            return cls(**json.load(json_file))
+
+    def _minutes(self, value):
+        hours, minutes = value.split(":")
+        return int(hours) * 60 + int(minutes)
+
+    """
+        @description:   This method applies the limits of the profile of the current time. It is checked at
+                        most once per minute.
+    """
+    def update_profile(self, now=None):
+        if now is None:
+            if time.monotonic() - self.time_profile_check < 60:
+                return
+            self.time_profile_check = time.monotonic()
+            now = time.localtime()
+        minutes = now.tm_hour * 60 + now.tm_min
+
+        current = None
+        for profile in self.profiles:
+            start = self._minutes(profile['start'])
+            end = self._minutes(profile['end'])
+            if (start <= minutes < end) if start <= end else (minutes >= start or minutes < end):
+                current = profile
+                break
+        if current is self.profile and self.profile_applied:
+            return
+        self.profile = current
+        self.profile_applied = True
+
+        limits = dict(self.default_limits)
+        if current is not None:
+            limits.update((key, value) for key, value in current.items() if key in limits)
+        self.ops.set_rate(limits['ops_per_second'])
+        self.bytes.set_rate(limits['bytes_per_second'])
+        with self.condition:
+            self.profile_limit = max(self.min_workers, min(self.max_workers, limits['max_workers']))
+            self.limit = min(self.limit, self.profile_limit)
+            self.condition.notify_all()
+
+    """
+        @description:   Context manager around a single file system operation: it waits for a free slot
+                        and for the budget of operations and bytes, and measures the latency. It yields a
+                        Stopwatch which can be stopped early, if only a part of the operation is to be timed.
+
+        @parameters:    * nbytes [int] - number of bytes the operation transfers (e.g. for reading)
+    """
+    @contextmanager
+    def operation(self, nbytes=0):
+        self.update_profile()
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        try:
+            self.ops.acquire()
+            if nbytes:
+                self.bytes.acquire(nbytes)
+            stopwatch = Stopwatch()
+            yield stopwatch
+            self._record(stopwatch.elapsed(), nbytes)
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify()
+
+    def call(self, function, *args, nbytes=0):
+        with self.operation(nbytes):
+            return function(*args)
+
+    def _record(self, latency, nbytes):
+        with self.condition:
+            self.statistics['ops'] += 1
+            self.statistics['bytes'] += nbytes
+            self.statistics['latency'] += latency
+            self.latencies.append(latency)
+            if len(self.latencies) < self.window:
+                return
+
+            mean = sum(self.latencies) / len(self.latencies)
+            self.latencies = []
+            if self.lowest_latency is None or mean < self.lowest_latency:
+                self.lowest_latency = mean
+            target = self.target_latency if self.target_latency is not None else 2 * self.lowest_latency
+
+            if mean > target:
+                self.limit = max(self.min_workers, self.limit // 2)
+                self.statistics['backoffs'] += 1
+            elif self.limit < self.profile_limit:
+                self.limit += 1
+                self.statistics['increases'] += 1
+                self.condition.notify()
+
+    """
+        @description:   This method applies a function to all items in parallel, with as many threads as
+                        the governor allows at most. Only a limited number of items is read ahead.
+
+        @return:        [Generator] Yields tuples (item, result) in the order of the items.
+    """
+    def map(self, function, items, nbytes=None):
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in items:
+                size = nbytes(item) if nbytes is not None else 0
+                pending.append((item, executor.submit(self.call, function, item, nbytes=size)))
+                if len(pending) >= self.max_workers * 4:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+            while pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+    """
+        @description:   This method lists a directory as one operation. The listing of a large directory
+                        takes many round trips, so only the time until the first batch of entries has arrived
+                        is taken as its latency.
+
+        @return:        [List] Returns the entries (see ext/scandir.scandir()).
+    """
+    def scandir(self, path):
+        with self.operation() as stopwatch:
+            entries = []
+            for entry in scandir.scandir(path):
+                stopwatch.stop()
+                entries.append(entry)
+        return entries
+
+    def _list(self, path):
+        dirs = []
+        files = []
+        symlinks = set()
+        for entry in self.scandir(path):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+                if entry.is_symlink():
+                    symlinks.add(entry.name)
+            else:
+                files.append(entry.name)
+        return path, dirs, files, symlinks
+
+    """
+        @description:   Parallel equivalent of ext/scandir.walk(). The directories are listed concurrently,
+                        so they are yielded in no particular order, but every directory before its
+                        subdirectories (top-down only). Like with os.walk(), directories can be pruned by
+                        removing them from the list of directories before the next directory is requested.
+    """
+    def walk(self, top, onerror=None, followlinks=False):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self._list, top)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        path, dirs, files, symlinks = future.result()
+                    except OSError as error:
+                        if onerror is not None:
+                            onerror(error)
+                        continue
+
+                    yield path, dirs, files
+                    for name in dirs:
+                        if followlinks or name not in symlinks:
+                            pending.add(executor.submit(self._list, os.path.join(path, name)))
+
+    def report(self):
+        ops = self.statistics['ops']
+        print("I/O governor: {} operations, {:.1f} MB, mean latency {:.1f}ms, concurrency {} "
+              "({} back-offs, {} increases)".format(ops, self.statistics['bytes'] / 1024 ** 2, 1000 * self.statistics['latency'] / ops if ops else 0,
+            self.limit, self.statistics['backoffs'], self.statistics['increases']))
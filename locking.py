@@ -0,0 +1,82 @@
+"""
+    @description:   FileLock class, an advisory lock on a lock file which is used to coordinate several
+                    Fileserver sessions working on the same storage folder. On POSIX systems, flock() is used
+                    and readers can share the lock; on Windows, msvcrt only supports exclusive locks, so readers
+                    lock exclusively there as well (for the short time they are reading).
+
+                    Example:
+
+                        with FileLock("./storage/fileserver_json.lock", shared=True):
+                            ...
+"""
+
+import os, time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class FileLock:
+    def __init__(self, path, shared=False, timeout=None, poll_interval=0.1):
+        self.path = path
+        self.shared = shared
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    """
+        @description:   This method waits until the lock has been acquired. If a timeout (in seconds) is set
+                        and the lock cannot be acquired within it, LockTimeout is raised.
+    """
+    def acquire(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        time_start = time.time()
+        waiting = False
+        while True:
+            try:
+                self._lock()
+                return
+            except OSError:
+                if self.timeout is not None and time.time() - time_start >= self.timeout:
+                    os.close(self.fd)
+                    self.fd = None
+                    raise LockTimeout("The lock {} could not be acquired within {}s.".format(self.path, self.timeout))
+                if not waiting:
+                    print("Waiting for the lock {} held by another session...".format(self.path), flush=True)
+                    waiting = True
+                time.sleep(self.poll_interval)
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def _lock(self):
+        if fcntl is not None:
+            mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+            fcntl.flock(self.fd, mode | fcntl.LOCK_NB)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
@@ -0,0 +1,193 @@
+"""
+    @description:   Streaming writer of manifests for the bulk import. Every file to be imported becomes one
+                    resource with its path, size, packages and database connections. The resources are
+                    written one by one, and a manifest is closed and the next one started as soon as it
+                    reaches the maximum number of entries or the maximum total size of the files it lists,
+                    so every manifest stays within the limits of the importer.
+
+                    JSON manifests look like
+
+                        {"manifest": {"name": "diary", "part": 1},
+                         "resources": [{"file": ..., "name": ..., "size": 1234, "packages": [...],
+                                        "db_entries": {"AU": ["1000"]}}, ...]}
+
+                    and XML manifests like
+
+                        <manifest name="diary" part="1">
+                          <resource file="..." name="..." size="1234">
+                            <package>diary</package>
+                            <db_link category="AU">1000</db_link>
+                          </resource>
+                        </manifest>
+
+                    Each manifest is written to a temporary file first and renamed once it is complete. The
+                    parts of an earlier run with the same name and format are removed before the first
+                    manifest is written, so no stale part of a longer run is left behind.
+"""
+
+import json, os, re
+from xml.sax.saxutils import escape, quoteattr
+
+FORMATS = ("json", "xml")
+
+
+class ManifestWriter:
+    def __init__(self, output_directory, name="manifest", file_format="json", max_entries=10000,
+                 max_bytes=50 * 1024 ** 3):
+        if file_format not in FORMATS:
+            raise ValueError("Unknown manifest format '{}'.".format(file_format))
+        self.output_directory = output_directory
+        self.name = name
+        self.file_format = file_format
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.part = 0
+        self.file = None
+        self.path = None
+        self.entries = 0
+        self.bytes = 0
+        self.written = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+    """
+        @description:   This method adds one resource. A new manifest is started if the current one would
+                        exceed one of the limits; a single file larger than max_bytes gets a manifest of its
+                        own.
+    """
+    def add(self, resource):
+        size = resource.get('size') or 0
+        if self.file is not None and (self.entries >= self.max_entries or self.bytes + size > self.max_bytes):
+            self.close()
+        if self.file is None:
+            self._open()
+
+        if self.file_format == "json":
+            self.file.write((",\n  " if self.entries else "\n  ") + json.dumps(resource))
+        else:
+            self.file.write(self._xml(resource))
+        self.entries += 1
+        self.bytes += size
+
+    def _open(self):
+        self.part += 1
+        self.path = os.path.join(self.output_directory, "{}_{:04d}.{}".format(self.name, self.part, self.file_format))
+        self.file = open(self.path + ".tmp", "w", encoding="utf-8")
+        self.entries = 0
+        self.bytes = 0
+        if self.file_format == "json":
+            self.file.write('{{"manifest": {}, "resources": ['.format(json.dumps({'name': self.name, 'part': self.part})))
+        else:
+            self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n<manifest name={} part="{}">\n'.format(
+                quoteattr(self.name), self.part))
+
+    """
+        @description:   This method completes the current manifest. If complete is False (after an error),
+                        the incomplete manifest is removed.
+    """
+    def close(self, complete=True):
+        if self.file is None:
+            return
+        if self.file_format == "json":
+            self.file.write("\n]}\n")
+        else:
+            self.file.write("</manifest>\n")
+        self.file.close()
+        self.file = None
+
+        if complete:
+            os.replace(self.path + ".tmp", self.path)
+            self.written.append((self.path, self.entries, self.bytes))
+        else:
+            os.remove(self.path + ".tmp")
+
+    @staticmethod
+    def _xml(resource):
+        lines = ['  <resource file={} name={} size="{}">\n'.format(
+            quoteattr(resource['file']), quoteattr(resource['name']), resource.get('size') or 0)]
+        for package in resource.get('packages', ()):
+            lines.append('    <package>{}</package>\n'.format(escape(package)))
+        for category, identifiers in sorted((resource.get('db_entries') or {}).items()):
+            for identifier in identifiers:
+                lines.append('    <db_link category={}>{}</db_link>\n'.format(quoteattr(category), escape(identifier)))
+        lines.append('  </resource>\n')
+        return "".join(lines)
+
+
+"""
+    @description:   This function removes all parts of the manifests with the given name and format from the
+                    output directory, including temporary files of an interrupted run.
+
+    @return:        [int] Returns the number of files removed.
+"""
+def remove_parts(output_directory, name, file_format):
+    pattern = re.compile(r"{}_\d{{4,}}\.{}(\.tmp)?$".format(re.escape(name), re.escape(file_format)))
+    removed = 0
+    for filename in os.listdir(output_directory):
+        if pattern.match(filename):
+            os.remove(os.path.join(output_directory, filename))
+            removed += 1
+    return removed
+
+
+"""
+    @description:   This function builds the resource of a catalogue entry. The size is taken from the state
+                    recorded by update_entries(), or from the file itself if there is none.
+
+    @return:        [Dict] Returns the resource, or None if the file cannot be found.
+"""
+def resource_of(file, entry):
+    if 'stat' in entry:
+        size = entry['stat'][0]
+    else:
+        try:
+            size = os.stat(file).st_size
+        except OSError:
+            return None
+    return {
+        'file': file,
+        'name': entry['name'],
+        'size': size,
+        'packages': list(entry.get('packages', [])),
+        'db_entries': entry.get('db_entries') or {}
+    }
+
+
+"""
+    @description:   This function writes the manifests for a selection of files. Earlier parts with the same
+                    name and format are removed first (see remove_parts()).
+
+    @parameters:    * entries [Dict] - the catalogue (file path: entry)
+                    * files [Iterable] - the files to be listed, e.g. fileserver.iter_files(...)
+                    * output_directory [String] - folder of the manifests
+                    * name [String] - name of the manifests, followed by the number of the part
+                    * file_format [String] - "json" or "xml"
+                    * max_entries [int] - maximum number of resources per manifest
+                    * max_bytes [int] - maximum total size of the files listed in one manifest
+
+    @return:        [List] Returns tuples (path, number of resources, total size) of the manifests written.
+"""
+def write_manifests(entries, files, output_directory, name="manifest", file_format="json", max_entries=10000,
+                    max_bytes=50 * 1024 ** 3):
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    removed = remove_parts(output_directory, name, file_format)
+    if removed:
+        print("{} manifests of an earlier run have been removed.".format(removed))
+
+    missing = 0
+    with ManifestWriter(output_directory, name, file_format, max_entries, max_bytes) as writer:
+        for file in files:
+            resource = resource_of(file, entries[file])
+            if resource is None:
+                missing += 1
+                continue
+            writer.add(resource)
+    if missing:
+        print("{} files could not be found and have been left out.".format(missing))
+    return writer.written
@@ -0,0 +1,216 @@
+"""
+    @description:   Memory accounting of a Fileserver object. Two kinds of numbers are collected:
+
+                    * deep sizes - the memory taken by the catalogue, broken down by structure (path keys,
+                        entry dictionaries, folder strings, names, db_entries, packages, ...) and by
+                        top-level folder. Objects which are shared (e.g. the interned folder strings) are
+                        counted only once, for the first entry using them.
+                    * peaks - if tracking is enabled (Fileserver(..., track_memory=True)), the memory
+                        allocated before, after and at most during load_json() and update_entries() is
+                        measured with tracemalloc. The lines allocating most are only listed if
+                        memory_top_lines of the Fileserver is set, as a snapshot of all traces is taken
+                        for them.
+
+                    Overhead: while tracemalloc is tracing, every allocation is slower and its trace takes
+                    memory of its own (reported as process/tracemalloc); a snapshot copies all traces. The
+                    deep sizes need a set with the id of every object of the catalogue, i.e. several ten
+                    bytes per object for the time of the report (reported as process/report). Both are left
+                    out of the numbers of the report: max_rss is taken before the deep sizes are computed,
+                    and the lines of memreport.py, tracemalloc and contextlib are filtered out of the snapshot.
+
+                    The report is a dictionary which can be written as JSON:
+
+                        {"catalogue": {"entries": ..., "total": ..., "structures": {"keys": ..., ...}},
+                         "folders": {"AU1000": ..., ...}, "other": {"rollups": ..., ...},
+                         "operations": {"load_json": {"before": ..., "after": ..., "peak": ..., ...}},
+                         "process": {"max_rss": ..., "tracemalloc": ..., "report": ...}}
+"""
+
+import contextlib, functools, sys, time, tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+FLAGS = ('skip', 'still_there', 'processed', 'pruned')
+STRUCTURES = {'path': 'folders', 'name': 'names', 'extension': 'extensions', 'db_entries': 'db_entries',
+              'packages': 'packages'}
+
+
+"""
+    @description:   This function returns the size of an object including all objects it contains (dicts,
+                    lists, tuples, sets). Objects whose id is in seen are not counted again.
+
+    @return:        [int] Returns the size in bytes.
+"""
+def deep_size(obj, seen):
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+    return size
+
+
+"""
+    @description:   This function breaks down the memory of a catalogue by structure and by top-level folder.
+
+    @parameters:    * entries [Dict] - the catalogue (file path: entry)
+                    * root [String] - the normalized path of the fileserver; the first folder below it is
+                        the top-level folder of an entry
+
+    @return:        [Tuple] Returns the dictionary of the catalogue numbers and the sizes per folder.
+"""
+def catalogue_breakdown(entries, root, seen=None):
+    if seen is None:
+        seen = set()
+    # small integers, booleans and None are shared by the interpreter
+    seen.update(id(value) for value in (True, False, None))
+
+    structures = {'catalogue_dict': sys.getsizeof(entries), 'keys': 0, 'entry_dicts': 0, 'flags': 0}
+    folders = {}
+    seen.add(id(entries))
+    root = root.rstrip("/") + "/"
+
+    for file, entry in entries.items():
+        size_key = deep_size(file, seen)
+        size_entry = sys.getsizeof(entry)
+        seen.add(id(entry))
+        structures['keys'] += size_key
+        structures['entry_dicts'] += size_entry
+        total = size_key + size_entry
+
+        for field, value in entry.items():
+            size = deep_size(field, seen) + deep_size(value, seen)
+            structure = 'flags' if field in FLAGS else STRUCTURES.get(field, field)
+            structures[structure] = structures.get(structure, 0) + size
+            total += size
+
+        path = entry['path']
+        relative = path[len(root):] if path.startswith(root) else path
+        folder = relative.split("/", 1)[0]
+        folders[folder] = folders.get(folder, 0) + total
+
+    catalogue = {
+        'entries': len(entries),
+        'total': sum(structures.values()),
+        'structures': dict(sorted(structures.items(), key=lambda item: -item[1]))
+    }
+    return catalogue, dict(sorted(folders.items(), key=lambda item: -item[1]))
+
+
+"""
+    @description:   This function starts tracing the memory allocations, so the numbers of the operations
+                    measured later on include everything allocated since then.
+"""
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+"""
+    @description:   Context manager which measures the memory allocated by an operation with tracemalloc and
+                    stores the numbers in peaks[name]. If tracing has not been started before, it is started
+                    for the operation only. The top lines allocating most are only listed if top is set.
+"""
+@contextmanager
+def track(peaks, name, top=0):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    time_start = time.time()
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = []
+        if top:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                # the context manager of the tracking itself
+                tracemalloc.Filter(False, contextlib.__file__)
+            ))
+            statistics = snapshot.statistics("lineno")[:top]
+        if started:
+            tracemalloc.stop()
+        peaks[name] = {
+            'before': before,
+            'after': current,
+            'peak': peak,
+            'seconds': round(time.time() - time_start, 3),
+            'top': [{'line': str(statistic.traceback[0]), 'size': statistic.size, 'count': statistic.count}
+                    for statistic in statistics]
+        }
+
+
+"""
+    @description:   Decorator for methods of the Fileserver: if track_memory of the object is True, the memory
+                    of the method is measured and stored in memory_peaks under the name of the method, with
+                    the memory_top_lines lines allocating most.
+"""
+def tracked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not getattr(self, 'track_memory', False):
+            return method(self, *args, **kwargs)
+        with track(self.memory_peaks, method.__name__, getattr(self, 'memory_top_lines', 0)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+"""
+    @description:   This function collects the full report of a Fileserver object.
+
+    @parameters:    * fileserver [Fileserver] - the object to report on
+                    * top [int] - number of top-level folders which are listed (all if None)
+
+    @return:        [Dict] Returns the report.
+"""
+def memory_report(fileserver, top=None):
+    # taken first, so the memory of the report itself is not included
+    process = {
+        'max_rss': max_rss(),
+        'tracemalloc': tracemalloc.get_tracemalloc_memory() if tracemalloc.is_tracing() else 0
+    }
+
+    seen = set()
+    catalogue, folders = catalogue_breakdown(fileserver.fileserver, fileserver.slash(fileserver.path_fileserver), seen)
+    if top is not None:
+        folders = dict(list(folders.items())[:top])
+
+    other = {}
+    for name in ('rollups', 'rules_state', 'skip_rules', 'concordance'):
+        value = getattr(fileserver, name, None)
+        if value is not None:
+            other[name] = deep_size(getattr(value, '__dict__', value), seen)
+    process['report'] = sys.getsizeof(seen)
+
+    return {
+        'catalogue': catalogue,
+        'folders': folders,
+        'other': other,
+        'operations': dict(getattr(fileserver, 'memory_peaks', {})),
+        'process': process
+    }
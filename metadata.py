@@ -0,0 +1,276 @@
+"""
+    @description:   Extraction of technical metadata (dimensions, bit depth, number of pages, dates) from the
+                    headers of TIFF, JPEG and PDF files. Only a bounded number of bytes is read per file
+                    (MAX_BYTES, by default 64 KB), never the whole file.
+
+                    The metadata of every file is stored in its entry of the catalogue:
+
+                        entry['metadata'] = {'stamp': [size, mtime_ns], 'format': 'tiff', 'width': 4000,
+                                             'height': 3000, 'bit_depth': 24, 'pages': 1,
+                                             'date': '2015:03:21 10:14:02'}
+
+                    Keys which cannot be read from the header are left out. As long as size and modification
+                    time of a file do not change ('stamp'), its metadata is not read again.
+"""
+
+import os, re, struct, threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_BYTES = 64 * 1024
+# maximum number of pages counted in a multi-page TIFF
+MAX_TIFF_PAGES = 10000
+
+FORMATS = {'tif': 'tiff', 'tiff': 'tiff', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'pdf': 'pdf'}
+
+TIFF_WIDTH = 256
+TIFF_HEIGHT = 257
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_DATETIME = 306
+TIFF_EXIF_IFD = 34665
+EXIF_DATETIME_ORIGINAL = 36867
+
+# size in bytes of the TIFF field types (BYTE, ASCII, SHORT, LONG, RATIONAL, ...)
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+REGEX_PDF_VERSION = re.compile(rb"%PDF-(\d\.\d)")
+REGEX_PDF_PAGES = [
+    re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)"),
+    re.compile(rb"/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+]
+REGEX_PDF_LINEARIZED_PAGES = re.compile(rb"/Linearized\s[^>]*?/N\s+(\d+)")
+REGEX_PDF_DATE = re.compile(rb"/CreationDate\s*\(D:(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?")
+
+
+"""
+    @description:   Reader which reads small pieces of an open file at given offsets and stops as soon as
+                    the budget of bytes is used up.
+"""
+class BoundedReader:
+    def __init__(self, file, max_bytes):
+        self.file = file
+        self.budget = max_bytes
+
+    def read(self, offset, length):
+        if length > self.budget:
+            raise EOFError("The header exceeds the limit of bytes to read.")
+        self.file.seek(offset)
+        data = self.file.read(length)
+        self.budget -= len(data)
+        if len(data) < length:
+            raise EOFError("The file ends within the header.")
+        return data
+
+
+"""
+    @description:   This function reads the metadata from the header of a file.
+
+    @parameters:    * path [String] - the file
+                    * file_format [String] - "tiff", "jpeg" or "pdf"
+                    * max_bytes [int] - maximum number of bytes read from the file
+
+    @return:        [Dict] Returns the metadata found; it contains 'error' if the header could not be read.
+"""
+def read_metadata(path, file_format, max_bytes=MAX_BYTES):
+    metadata = {'format': file_format}
+    try:
+        with open(path, "rb") as file:
+            reader = BoundedReader(file, max_bytes)
+            if file_format == "tiff":
+                read_tiff(reader, metadata)
+            elif file_format == "jpeg":
+                read_jpeg(reader, metadata)
+            elif file_format == "pdf":
+                read_pdf(file, os.fstat(file.fileno()).st_size, max_bytes, metadata)
+    except (OSError, EOFError, ValueError, struct.error) as error:
+        metadata['error'] = str(error)
+    return metadata
+
+
+def read_tiff(reader, metadata, base=0, exif_only=False):
+    header = reader.read(base, 8)
+    if header[:2] == b"II":
+        order = "<"
+    elif header[:2] == b"MM":
+        order = ">"
+    else:
+        raise ValueError("No TIFF header.")
+    if struct.unpack(order + "H", header[2:4])[0] != 42:
+        raise ValueError("No TIFF header.")
+
+    offset = struct.unpack(order + "I", header[4:8])[0]
+    tags = _read_ifd(reader, base, offset, order)
+    if not exif_only:
+        if TIFF_WIDTH in tags:
+            metadata['width'] = tags[TIFF_WIDTH][0]
+        if TIFF_HEIGHT in tags:
+            metadata['height'] = tags[TIFF_HEIGHT][0]
+        if TIFF_BITS_PER_SAMPLE in tags:
+            bits = tags[TIFF_BITS_PER_SAMPLE]
+            samples = tags.get(TIFF_SAMPLES_PER_PIXEL, [len(bits)])[0]
+            metadata['bit_depth'] = sum(bits) if len(bits) > 1 else bits[0] * samples
+    if TIFF_DATETIME in tags:
+        metadata['date'] = tags[TIFF_DATETIME]
+    if TIFF_EXIF_IFD in tags:
+        exif = _read_ifd(reader, base, tags[TIFF_EXIF_IFD][0], order)
+        if EXIF_DATETIME_ORIGINAL in exif:
+            metadata['date'] = exif[EXIF_DATETIME_ORIGINAL]
+
+    if not exif_only:
+        # count the pages by following the chain of image file directories
+        pages = 1
+        next_offset = tags['next']
+        while next_offset and pages < MAX_TIFF_PAGES:
+            try:
+                count = struct.unpack(order + "H", reader.read(base + next_offset, 2))[0]
+                next_offset = struct.unpack(order + "I", reader.read(base + next_offset + 2 + count * 12, 4))[0]
+            except EOFError:
+                next_offset = None
+                break
+            pages += 1
+        if next_offset is None:
+            metadata['pages_at_least'] = pages
+        else:
+            metadata['pages'] = pages
+
+
+def _read_ifd(reader, base, offset, order):
+    count = struct.unpack(order + "H", reader.read(base + offset, 2))[0]
+    data = reader.read(base + offset + 2, count * 12 + 4)
+    tags = {'next': struct.unpack(order + "I", data[count * 12:count * 12 + 4])[0]}
+
+    for position in range(0, count * 12, 12):
+        tag, field_type, number = struct.unpack(order + "HHI", data[position:position + 8])
+        if tag not in (TIFF_WIDTH, TIFF_HEIGHT, TIFF_BITS_PER_SAMPLE, TIFF_SAMPLES_PER_PIXEL, TIFF_DATETIME,
+                       TIFF_EXIF_IFD, EXIF_DATETIME_ORIGINAL):
+            continue
+        size = TIFF_TYPE_SIZES.get(field_type, 1) * number
+        if size <= 4:
+            value = data[position + 8:position + 8 + size]
+        else:
+            value_offset = struct.unpack(order + "I", data[position + 8:position + 12])[0]
+            value = reader.read(base + value_offset, size)
+
+        if field_type == 2:
+            tags[tag] = value.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        elif field_type == 3:
+            tags[tag] = list(struct.unpack(order + "H" * number, value))
+        elif field_type in (4, 13):
+            tags[tag] = list(struct.unpack(order + "I" * number, value))
+    return tags
+
+
+def read_jpeg(reader, metadata):
+    if reader.read(0, 2) != b"\xff\xd8":
+        raise ValueError("No JPEG header.")
+
+    offset = 2
+    while True:
+        prefix, marker, length = struct.unpack(">BBH", reader.read(offset, 4))
+        if prefix != 0xFF:
+            raise ValueError("Invalid JPEG segment at offset {}.".format(offset))
+        if marker == 0xDA or marker == 0xD9:
+            # start of scan or end of image: no header segments follow
+            break
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            precision, height, width, components = struct.unpack(">BHHB", reader.read(offset + 4, 6))
+            metadata['width'] = width
+            metadata['height'] = height
+            metadata['bit_depth'] = precision * components
+            break
+        if marker == 0xE1 and 'date' not in metadata:
+            if reader.read(offset + 4, 6) == b"Exif\0\0":
+                try:
+                    read_tiff(reader, metadata, base=offset + 10, exif_only=True)
+                except ValueError:
+                    pass
+        offset += 2 + length
+
+
+def read_pdf(file, size, max_bytes, metadata):
+    head = file.read(min(size, max_bytes // 2))
+    match = REGEX_PDF_VERSION.match(head)
+    if match is None:
+        raise ValueError("No PDF header.")
+    metadata['version'] = match.group(1).decode("ascii")
+
+    # the page tree and the document information are either at the beginning (linearized files) or at the end
+    if size > len(head):
+        file.seek(max(len(head), size - max_bytes // 2))
+        data = head + file.read()
+    else:
+        data = head
+
+    match = REGEX_PDF_LINEARIZED_PAGES.search(head)
+    if match:
+        metadata['pages'] = int(match.group(1))
+    else:
+        counts = [int(count) for regex in REGEX_PDF_PAGES for count in regex.findall(data)]
+        if counts:
+            # the root of the page tree has the highest count
+            metadata['pages'] = max(counts)
+
+    match = REGEX_PDF_DATE.search(data)
+    if match:
+        parts = [part.decode("ascii") for part in match.groups() if part]
+        metadata['date'] = ":".join(parts[:3]) + (" " + ":".join(parts[3:]) if len(parts) > 3 else "")
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+"""
+    @description:   This function reads the metadata of many entries of a catalogue in a bounded thread pool
+                    and stores it in the entries. Files whose size and modification time match the stored
+                    stamp are not read again.
+
+    @parameters:    * entries [Dict] - the catalogue (file path: entry)
+                    * files [Iterable] - the files of the catalogue to look at
+                    * workers [int] - number of threads reading files
+                    * force [bool] - if True, the metadata is read again regardless of the stamp
+
+    @return:        [Dict] Returns the number of files read, unchanged, missing and with errors.
+"""
+def collect_metadata(entries, files, workers=8, force=False, max_bytes=MAX_BYTES):
+    statistics = {'read': 0, 'unchanged': 0, 'missing': 0, 'errors': 0}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def work(file, file_format):
+        try:
+            entry = entries[file]
+            try:
+                stamp = file_stamp(file)
+            except OSError:
+                with lock:
+                    statistics['missing'] += 1
+                return
+            if not force and entry.get('metadata', {}).get('stamp') == stamp:
+                with lock:
+                    statistics['unchanged'] += 1
+                return
+
+            try:
+                metadata = read_metadata(file, file_format, max_bytes)
+            except Exception as error:
+                # unexpected errors of a single file are recorded like the expected ones
+                metadata = {'format': file_format, 'error': "{}: {}".format(type(error).__name__, error)}
+            metadata['stamp'] = stamp
+            entry['metadata'] = metadata
+            with lock:
+                statistics['read'] += 1
+                if 'error' in metadata:
+                    statistics['errors'] += 1
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file in files:
+            file_format = FORMATS.get(entries[file]['extension'])
+            if file_format is None:
+                continue
+            slots.acquire()
+            executor.submit(work, file, file_format)
+    return statistics
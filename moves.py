@@ -0,0 +1,214 @@
+"""
+    @description:   Detection of files which have been moved or renamed. A moved file shows up twice in the
+                    catalogue: its old path is no longer there (still_there=False) and its new path has been
+                    registered as new, unprocessed file. Both are matched by the state recorded in 'stat'
+                    (size, modification time, inode, device) during update_entries():
+
+                    1. the old and new entries are grouped by (size, modification time) in hash indexes
+                    2. within a group, entries with the same inode are matched (moves within a volume)
+                    3. then entries with the same content fingerprint, if fingerprints are used
+                    4. then a single old entry and a single new entry, or entries with the same file name,
+                       unless both are on the same device and their inodes differ (a moved file keeps its
+                       inode within a volume, so they are different files)
+
+                    Groups which cannot be resolved are reported as ambiguous and left alone.
+
+                    A fingerprint (see fingerprint()) hashes the size and the first and last block of a file.
+                    As the old file cannot be read anymore once it has been moved, fingerprints have to be
+                    recorded beforehand (record_fingerprints()), e.g. for all processed files.
+"""
+
+import hashlib, os, stat as stat_module, threading
+from concurrent.futures import ThreadPoolExecutor
+
+FINGERPRINT_BLOCK = 64 * 1024
+
+
+"""
+    @description:   This function returns the state of a file as it is recorded in entry['stat'].
+
+    @return:        [List] Returns [size, mtime_ns, inode, device], or None if there is no regular file at path.
+"""
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not stat_module.S_ISREG(stat.st_mode):
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev]
+
+
+"""
+    @description:   This function computes the content fingerprint of a file from its size and its first and
+                    last FINGERPRINT_BLOCK bytes.
+
+    @return:        [String] Returns the fingerprint as hexadecimal string.
+"""
+def fingerprint(path, block_size=FINGERPRINT_BLOCK):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        digest.update(str(size).encode("ascii"))
+        digest.update(file.read(block_size))
+        if size > block_size:
+            file.seek(max(block_size, size - block_size))
+            digest.update(file.read(block_size))
+    return digest.hexdigest()
+
+
+"""
+    @description:   This function records the fingerprints of entries in a bounded thread pool. Fingerprints
+                    which have been recorded for the current size and modification time are kept. If an
+                    IOGovernor is given (see governor.py), the reads are throttled by it.
+
+    @return:        [int] Returns the number of fingerprints computed.
+"""
+def record_fingerprints(entries, files, workers=8, governor=None):
+    computed = [0]
+    lock = threading.Lock()
+    if governor is not None:
+        workers = governor.max_workers
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def work(file):
+        try:
+            entry = entries[file]
+            state = file_stat(file)
+            if state is None:
+                return
+            if entry.get('fingerprint', {}).get('stamp') == state[:2]:
+                return
+            try:
+                if governor is None:
+                    value = fingerprint(file)
+                else:
+                    value = governor.call(fingerprint, file, nbytes=min(state[0], 2 * FINGERPRINT_BLOCK))
+                entry['fingerprint'] = {'stamp': state[:2], 'value': value}
+            except OSError:
+                return
+            with lock:
+                computed[0] += 1
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file in files:
+            slots.acquire()
+            executor.submit(work, file)
+    return computed[0]
+
+
+def _is_vanished(entry):
+    return not entry['still_there'] and not entry.get('pruned') and 'stat' in entry
+
+
+def _is_new(entry):
+    return entry['still_there'] and not entry['processed'] and not entry.get('pruned') and 'stat' in entry
+
+
+def _pair(olds, news, key, accept=None):
+    pairs = []
+    for new in list(news):
+        value = key(new)
+        if value is None:
+            continue
+        matching = [old for old in olds if key(old) == value and (accept is None or accept(old, new))]
+        if len(matching) == 1:
+            pairs.append((matching[0], new))
+            olds.remove(matching[0])
+            news.remove(new)
+    return pairs
+
+
+"""
+    @description:   This function finds the moved files of a catalogue.
+
+    @parameters:    * entries [Dict] - the catalogue (file path: entry)
+                    * use_fingerprint [bool] - if True, the fingerprints of new files are computed where
+                        needed and compared with the fingerprints recorded for the old files
+                    * governor [IOGovernor] - if given (see governor.py), the reads of the fingerprints are
+                        throttled by it
+
+    @return:        [Tuple] Returns the list of moves (old file, new file, criterion) and the list of
+                    ambiguous groups (old files, new files).
+"""
+def find_moves(entries, use_fingerprint=False, governor=None):
+    old_index = {}
+    for file, entry in entries.items():
+        if _is_vanished(entry):
+            old_index.setdefault(tuple(entry['stat'][:2]), []).append(file)
+
+    new_index = {}
+    if old_index:
+        for file, entry in entries.items():
+            if _is_new(entry):
+                key = tuple(entry['stat'][:2])
+                if key in old_index:
+                    new_index.setdefault(key, []).append(file)
+
+    def inode(file):
+        return entries[file]['stat'][2] or None
+
+    def stored_fingerprint(file):
+        return entries[file].get('fingerprint', {}).get('value')
+
+    def name(file):
+        return entries[file]['name']
+
+    # entries recorded before the device was part of the state are not checked
+    def same_file_possible(old, new):
+        old_stat = entries[old]['stat']
+        new_stat = entries[new]['stat']
+        if len(old_stat) < 4 or len(new_stat) < 4 or not old_stat[2] or not new_stat[2]:
+            return True
+        return old_stat[3] != new_stat[3] or old_stat[2] == new_stat[2]
+
+    moves = []
+    ambiguous = []
+    for key, news in new_index.items():
+        olds = list(old_index[key])
+
+        for old, new in _pair(olds, news, inode):
+            moves.append((old, new, "inode"))
+
+        if use_fingerprint and news and any(stored_fingerprint(old) for old in olds):
+            for new in news:
+                try:
+                    if governor is None:
+                        value = fingerprint(new)
+                    else:
+                        value = governor.call(fingerprint, new, nbytes=min(key[0], 2 * FINGERPRINT_BLOCK))
+                    entries[new]['fingerprint'] = {'stamp': list(key), 'value': value}
+                except OSError:
+                    pass
+            for old, new in _pair(olds, news, stored_fingerprint):
+                moves.append((old, new, "fingerprint"))
+
+        if len(olds) == 1 and len(news) == 1 and same_file_possible(olds[0], news[0]):
+            moves.append((olds.pop(), news.pop(), "size_mtime"))
+        for old, new in _pair(olds, news, name, same_file_possible):
+            moves.append((old, new, "name"))
+
+        if olds and news:
+            ambiguous.append((olds, news))
+
+    return moves, ambiguous
+
+
+"""
+    @description:   This function carries the state of an old entry over to the entry of its new path: the
+                    upload state, the package assignments and, for processed files, the database connections
+                    the upload has been based on.
+"""
+def carry_over(old_entry, new_entry, old_path):
+    new_entry['processed'] = old_entry['processed']
+    if 'packages' in old_entry:
+        packages = new_entry.setdefault('packages', [])
+        packages.extend(package for package in old_entry['packages'] if package not in packages)
+    if old_entry['processed'] and 'db_entries' in old_entry:
+        new_entry['db_entries'] = old_entry['db_entries']
+        new_entry['db_version'] = old_entry.get('db_version')
+    if 'fingerprint' in old_entry and 'fingerprint' not in new_entry:
+        new_entry['fingerprint'] = old_entry['fingerprint']
+    new_entry['moved_from'] = old_path
@@ -0,0 +1,137 @@
+"""
+    @description:   FolderRollups class which keeps aggregated numbers for every folder of a Fileserver object,
+                    so folder-level and share-wide reports do not have to look at every single entry.
+
+                    For every folder, two sets of counters are kept: 'direct' for the files within the folder
+                    itself and 'total' for all files in the folder and its subfolders. The share-wide totals
+                    are stored under the empty folder "". The counters are:
+
+                    * files - number of registered files (placeholders of pruned folders are counted as
+                        'pruned' instead)
+                    * skipped, lost, processed - number of files with the respective flag
+                    * unassigned - files to be uploaded without database connection and without package
+                    * unassigned_total - the same, but including skipped and lost files
+                    * extensions [Dict] - number of files per extension
+"""
+
+COUNTERS = ('files', 'pruned', 'skipped', 'lost', 'processed', 'unassigned', 'unassigned_total')
+
+
+class FolderRollups:
+    def __init__(self):
+        self.folders = {}
+
+    """
+        @description:   This method computes the numbers of all folders from scratch: first the direct numbers
+                        of every folder, then, bottom-up, the totals of the folders and all their parents.
+    """
+    def compute(self, entries):
+        direct = {}
+        for entry in entries.values():
+            folder = self.folder_of(entry)
+            counters = direct.get(folder)
+            if counters is None:
+                counters = direct[folder] = self.new_counters()
+            self.add(counters, self.counters_of(entry), 1)
+
+        self.folders = {}
+        for folder, counters in direct.items():
+            self._rollup(folder)['direct'] = counters
+            for ancestor in self.ancestors(folder):
+                self.add(self._rollup(ancestor)['total'], counters, 1)
+
+    def _rollup(self, folder):
+        rollup = self.folders.get(folder)
+        if rollup is None:
+            rollup = self.folders[folder] = {'direct': self.new_counters(), 'total': self.new_counters()}
+        return rollup
+
+    @staticmethod
+    def new_counters():
+        counters = dict.fromkeys(COUNTERS, 0)
+        counters['extensions'] = {}
+        return counters
+
+    @staticmethod
+    def folder_of(entry):
+        return entry['path'].rstrip("/")
+
+    """
+        @description:   This method returns the folder itself, all its parent folders and finally "" for the
+                        share-wide numbers.
+    """
+    @staticmethod
+    def ancestors(folder):
+        while True:
+            yield folder
+            if not folder:
+                break
+            position = folder.rfind("/")
+            folder = folder[:position] if position != -1 else ""
+
+    """
+        @description:   This method returns the numbers a single entry contributes to its folder.
+    """
+    @staticmethod
+    def counters_of(entry):
+        if entry.get('pruned'):
+            return {'pruned': 1}
+
+        unassigned = not entry.get('db_entries') and 'packages' not in entry
+        uploadable = not entry['skip'] and entry['still_there']
+        return {
+            'files': 1,
+            'skipped': int(entry['skip']),
+            'lost': int(not entry['still_there']),
+            'processed': int(entry['processed']),
+            'unassigned': int(unassigned and uploadable),
+            'unassigned_total': int(unassigned),
+            'extensions': {entry['extension']: 1}
+        }
+
+    @staticmethod
+    def add(counters, numbers, sign):
+        for key, value in numbers.items():
+            if key == 'extensions':
+                extensions = counters['extensions']
+                for extension, number in value.items():
+                    extensions[extension] = extensions.get(extension, 0) + sign * number
+                    if not extensions[extension]:
+                        del extensions[extension]
+            else:
+                counters[key] += sign * value
+
+    """
+        @description:   These methods keep the numbers current when single entries are added, removed or
+                        changed. For a change, the numbers of the entry before the change have to be taken
+                        with counters_of() and handed to change().
+    """
+    def insert(self, entry):
+        self._apply(self.folder_of(entry), self.counters_of(entry), 1)
+
+    def remove(self, entry):
+        self._apply(self.folder_of(entry), self.counters_of(entry), -1)
+
+    def change(self, entry, before):
+        after = self.counters_of(entry)
+        if after != before:
+            folder = self.folder_of(entry)
+            self._apply(folder, before, -1)
+            self._apply(folder, after, 1)
+
+    def _apply(self, folder, numbers, sign):
+        self.add(self._rollup(folder)['direct'], numbers, sign)
+        for ancestor in self.ancestors(folder):
+            self.add(self._rollup(ancestor)['total'], numbers, sign)
+
+    """
+        @description:   This method returns the numbers of a folder.
+
+        @parameters:    * folder [String] - normalized path of the folder ("" for the whole fileserver)
+                        * recursive [bool] - if True (default), the numbers include all subfolders
+    """
+    def get(self, folder, recursive=True):
+        rollup = self.folders.get(folder.rstrip("/"))
+        if rollup is None:
+            return self.new_counters()
+        return rollup['total'] if recursive else rollup['direct']
@@ -0,0 +1,193 @@
+"""
+    @description:   SkipRules class which loads the skipped folders and skipped extensions from their
+                    rule files and classifies files against them.
+
+                    The rule files may contain comment lines (starting with #) and empty lines. Entries
+                    of the extension file which are plain extensions (e.g. "psd", "ds_store") are kept in
+                    a set, all other entries (e.g. "_01_95a", "rock sampling 2015 at sheikh abd el-qurna")
+                    are treated as suffixes of the file name and compiled into one regular expression.
+"""
+
+import hashlib, re
+
+
+class SkipRules:
+    def __init__(self, path_skipped_folders, path_skipped_extensions):
+        self.path_skipped_folders = path_skipped_folders
+        self.path_skipped_extensions = path_skipped_extensions
+
+        self.folders = []
+        self.extensions = frozenset()
+        self.suffixes = []
+        self.fingerprint = None
+
+        self._folder_index = frozenset()
+        self._suffix_matcher = None
+        self.hits = {}
+
+        self.load()
+
+    """
+        @description:   This method (re-)reads both rule files. Folders are normalized to forward slashes
+                        with a trailing slash, extensions and suffixes are case-folded.
+
+        @return:        [String] Returns a fingerprint (SHA-1) of both rule files.
+    """
+    def load(self):
+        fingerprint = hashlib.sha1()
+
+        folders = []
+        for entry in self._read_lines(self.path_skipped_folders, fingerprint, "skipped_folder"):
+            entry = self.slash(entry)
+            if not entry.endswith("/"):
+                entry = entry + "/"
+            if entry not in folders:
+                folders.append(entry)
+
+        fingerprint.update(b"\0")
+
+        extensions = set()
+        suffixes = []
+        for entry in self._read_lines(self.path_skipped_extensions, fingerprint, "skipped_extensions"):
+            entry = entry.casefold()
+            if self.is_extension(entry):
+                extensions.add(entry)
+            elif entry not in suffixes:
+                suffixes.append(entry)
+
+        self.folders = folders
+        self.extensions = frozenset(extensions)
+        self.suffixes = suffixes
+        self.fingerprint = fingerprint.hexdigest()
+
+        self._folder_index = frozenset(folders)
+        if suffixes:
+            # longest suffixes first, so the reported rule is the most specific one
+            pattern = "|".join(re.escape(suffix) for suffix in sorted(suffixes, key=len, reverse=True))
+            self._suffix_matcher = re.compile("(?:" + pattern + r")\Z")
+        else:
+            self._suffix_matcher = None
+
+        self.hits = dict.fromkeys(self.folders + sorted(self.extensions) + self.suffixes, 0)
+        return self.fingerprint
+
+    def _read_lines(self, path, fingerprint, name):
+        try:
+            with open(path, "rb") as rule_file:
+                content = rule_file.read()
+        except FileNotFoundError:
+            print("There is no {} file at {}. Please correct the path.".format(name, path))
+            return []
+
+        fingerprint.update(content)
+        lines = []
+        for line in content.decode("utf-8").splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            lines.append(line)
+        return lines
+
+    """
+        @description:   A plain extension contains neither whitespace, dots nor slashes and does not start
+                        with an underscore, i.e. it can actually be the part after the last dot of a file name.
+    """
+    @staticmethod
+    def is_extension(entry):
+        return re.fullmatch(r"[^\s./\\_][^\s./\\]*", entry) is not None
+
+    @staticmethod
+    def slash(string):
+        result = string.replace(r"\\", "/")
+        result = result.replace("\\", "/")
+        return result
+
+    """
+        @description:   This method checks whether a folder (normalized, without trailing slash) lies within
+                        one of the skipped folders. Only the ancestors of the folder are looked up, so the
+                        costs do not depend on the number of rules.
+
+        @return:        [String] Returns the matching folder rule, or None.
+    """
+    def match_folder(self, path):
+        path = path + "/"
+        index = self._folder_index
+        position = path.find("/")
+        while position != -1:
+            if path[:position + 1] in index:
+                return path[:position + 1]
+            position = path.find("/", position + 1)
+        return None
+
+    """
+        @description:   This method checks whether a file name is skipped because of its extension or
+                        because it ends with one of the skipped suffixes. A file name without extension is
+                        checked as a whole against the skipped extensions.
+
+        @return:        [String] Returns the matching extension or suffix rule, or None.
+    """
+    def match_name(self, name, extension):
+        # files without extension are checked by their whole name
+        extension = (extension or name).casefold()
+        if extension in self.extensions:
+            return extension
+        if self._suffix_matcher is not None:
+            match = self._suffix_matcher.search(name.casefold())
+            if match:
+                return match.group(0)
+        return None
+
+    """
+        @description:   This method classifies a file against all rules.
+
+        @return:        [String/bool] Returns the rule which causes the file to be skipped, or False.
+    """
+    def classify(self, path, name, extension):
+        rule = self.match_folder(path) or self.match_name(name, extension)
+        return rule if rule else False
+
+    """
+        @description:   This method counts a verdict (as returned by classify()) for the statistics of
+                        the rules which are in use.
+    """
+    def count(self, verdict):
+        if verdict in self.hits:
+            self.hits[verdict] += 1
+
+    """
+        @description:   This method returns all rules which did not match any file since the rules have
+                        been loaded (or since the last reset of the hits).
+    """
+    def unused(self):
+        return [rule for rule in self.hits if self.hits[rule] == 0]
+
+    def report_unused(self):
+        unused = self.unused()
+        if unused:
+            print("{} skip rules did not match any file:".format(len(unused)))
+            for rule in unused:
+                print("- " + rule)
+
+    """
+        @description:   This method returns the current rules in a form which can be stored next to the
+                        catalogue and compared with later versions of the rules (see changes()).
+    """
+    def state(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'folders': self.folders,
+            'extensions': sorted(self.extensions),
+            'suffixes': self.suffixes
+        }
+
+    """
+        @description:   This method compares the current rules with a stored state.
+
+        @return:        [Tuple] Returns the folder rules, extension rules and suffix rules which have been
+                        added or removed since the stored state.
+    """
+    def changes(self, state):
+        changed_folders = set(state.get('folders', [])) ^ set(self.folders)
+        changed_extensions = set(state.get('extensions', [])) ^ set(self.extensions)
+        changed_suffixes = set(state.get('suffixes', [])) ^ set(self.suffixes)
+        return changed_folders, changed_extensions, changed_suffixes
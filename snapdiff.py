@@ -0,0 +1,242 @@
+"""
+    @description:   Diff between two snapshots of the catalogue (e.g. two files in storage/archive/). Neither
+                    snapshot is loaded as a whole: both are read entry by entry, sorted by path in runs of a
+                    limited size on the disk (if they do not fit into one run) and merge-joined, so the memory
+                    needed does not depend on the size of the catalogue.
+
+                    Every difference is one dictionary:
+
+                        {"file": ..., "change": "added"}
+                        {"file": ..., "change": "removed"}
+                        {"file": ..., "change": "changed", "fields": {"processed": [false, true]}}
+
+                    Only the fields in FIELDS are compared. From the command line, snapshots can be given as
+                    path or as number of the archived snapshot ("current" for the current catalogue):
+
+                        python snapdiff.py 12 13 --storage ./storage/ -o diff.jsonl
+                        python snapdiff.py ./storage/archive/fileserver_json_13.txt current
+"""
+
+import argparse, heapq, json, os, sys, tempfile
+from operator import itemgetter
+
+FIELDS = ('skip', 'still_there', 'processed', 'packages', 'db_entries')
+
+
+"""
+    @description:   This function reads the top-level JSON object of a snapshot piece by piece.
+
+    @return:        [Generator] Yields tuples (file, entry) in the order of the snapshot.
+"""
+def iter_snapshot(path, block_size=1 << 20):
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as json_file:
+        buffer = ""
+        position = 0
+        end_of_file = False
+
+        def fill():
+            nonlocal buffer, position, end_of_file
+            block = json_file.read(block_size)
+            if not block:
+                end_of_file = True
+            buffer = buffer[position:] + block
+            position = 0
+
+        def skip_whitespace():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n":
+                    position += 1
+                if position < len(buffer) or end_of_file:
+                    return
+                fill()
+
+        def decode():
+            nonlocal position
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    # a value at the very end of the buffer might be cut off (e.g. a number)
+                    if end < len(buffer) or end_of_file:
+                        position = end
+                        return value
+                except json.JSONDecodeError:
+                    if end_of_file:
+                        raise
+                fill()
+
+        def expect(character):
+            nonlocal position
+            skip_whitespace()
+            if position >= len(buffer) or buffer[position] != character:
+                raise ValueError("Expected '{}' in the snapshot {}.".format(character, path))
+            position += 1
+
+        expect("{")
+        skip_whitespace()
+        if position < len(buffer) and buffer[position] == "}":
+            return
+        while True:
+            skip_whitespace()
+            file = decode()
+            expect(":")
+            skip_whitespace()
+            yield file, decode()
+
+            skip_whitespace()
+            if position < len(buffer) and buffer[position] == ",":
+                position += 1
+            else:
+                expect("}")
+                return
+
+
+def _read_run(path):
+    with open(path, encoding="utf-8") as run_file:
+        for line in run_file:
+            yield tuple(json.loads(line))
+
+
+"""
+    @description:   This function returns the entries of a snapshot sorted by path. Snapshots with more than
+                    run_size entries are sorted in runs which are written to temporary_directory and merged.
+
+    @return:        [Generator] Yields tuples (file, entry) sorted by file.
+"""
+def iter_sorted(path, temporary_directory, run_size=200000):
+    runs = []
+    run = []
+    for item in iter_snapshot(path):
+        run.append(item)
+        if len(run) >= run_size:
+            runs.append(_write_run(run, temporary_directory))
+            run = []
+    run.sort(key=itemgetter(0))
+
+    if not runs:
+        yield from run
+        return
+    if run:
+        runs.append(_write_run(run, temporary_directory))
+    yield from heapq.merge(*(_read_run(run_path) for run_path in runs), key=itemgetter(0))
+
+
+def _write_run(run, temporary_directory):
+    run.sort(key=itemgetter(0))
+    handle, run_path = tempfile.mkstemp(suffix=".jsonl", dir=temporary_directory)
+    with os.fdopen(handle, "w", encoding="utf-8") as run_file:
+        for item in run:
+            run_file.write(json.dumps(item) + "\n")
+    return run_path
+
+
+def _compare(old, new, fields):
+    changes = {}
+    for field in fields:
+        before = old.get(field)
+        after = new.get(field)
+        if field == 'packages':
+            before = sorted(before or [])
+            after = sorted(after or [])
+        elif field == 'db_entries':
+            before = before or {}
+            after = after or {}
+        if before != after:
+            changes[field] = [before, after]
+    return changes
+
+
+"""
+    @description:   This function compares two snapshots of the catalogue.
+
+    @parameters:    * old_path [String] - the older snapshot
+                    * new_path [String] - the newer snapshot
+                    * fields [Tuple] - the fields of the entries which are compared
+                    * run_size [int] - number of entries which are sorted in memory at once
+
+    @return:        [Generator] Yields one dictionary per added, removed or changed entry, sorted by file.
+"""
+def diff_snapshots(old_path, new_path, fields=FIELDS, run_size=200000):
+    with tempfile.TemporaryDirectory(prefix="snapdiff_") as temporary_directory:
+        old = iter_sorted(old_path, temporary_directory, run_size)
+        new = iter_sorted(new_path, temporary_directory, run_size)
+        old_item = next(old, None)
+        new_item = next(new, None)
+
+        while old_item is not None or new_item is not None:
+            if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+                yield {'file': old_item[0], 'change': "removed"}
+                old_item = next(old, None)
+            elif old_item is None or new_item[0] < old_item[0]:
+                yield {'file': new_item[0], 'change': "added"}
+                new_item = next(new, None)
+            else:
+                changes = _compare(old_item[1], new_item[1], fields)
+                if changes:
+                    yield {'file': new_item[0], 'change': "changed", 'fields': changes}
+                old_item = next(old, None)
+                new_item = next(new, None)
+
+
+"""
+    @description:   This function writes the differences as JSON Lines and counts them.
+
+    @return:        [Dict] Returns the number of added, removed and changed entries, and per field the
+                    number of entries in which it changed.
+"""
+def write_diff(changes, output):
+    statistics = {'added': 0, 'removed': 0, 'changed': 0, 'fields': {}}
+    for change in changes:
+        statistics[change['change']] += 1
+        for field in change.get('fields', ()):
+            statistics['fields'][field] = statistics['fields'].get(field, 0) + 1
+        output.write(json.dumps(change) + "\n")
+    return statistics
+
+
+"""
+    @description:   This function resolves a snapshot given as number of an archived snapshot, as "current"
+                    or as path.
+"""
+def snapshot_path(snapshot, path_storage="./storage/", json_fileserver="fileserver_json"):
+    path_storage = path_storage.replace("\\", "/")
+    if not path_storage.endswith("/"):
+        path_storage += "/"
+    if str(snapshot) == "current":
+        return path_storage + json_fileserver + ".txt"
+    if str(snapshot).isdigit():
+        return path_storage + "archive/" + json_fileserver + "_" + str(snapshot) + ".txt"
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares two snapshots of the Fileserver catalogue.")
+    parser.add_argument("old", help="older snapshot: path, number of the archived snapshot or 'current'")
+    parser.add_argument("new", help="newer snapshot: path, number of the archived snapshot or 'current'")
+    parser.add_argument("--storage", default="./storage/", help="storage folder (default: ./storage/)")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output file, or - for stdout (default)")
+    parser.add_argument("--fields", default=",".join(FIELDS), help="compared fields, separated by commas")
+    parser.add_argument("--run-size", type=int, default=200000, help="entries sorted in memory at once")
+    arguments = parser.parse_args(argv)
+
+    old_path = snapshot_path(arguments.old, arguments.storage)
+    new_path = snapshot_path(arguments.new, arguments.storage)
+    fields = tuple(field for field in arguments.fields.split(",") if field)
+
+    output_file = sys.stdout if arguments.output == "-" else open(arguments.output, "w", encoding="utf-8")
+    try:
+        statistics = write_diff(diff_snapshots(old_path, new_path, fields, arguments.run_size), output_file)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    print("{} -> {}: {} added, {} removed, {} changed.".format(
+        old_path, new_path, statistics['added'], statistics['removed'], statistics['changed']), file=sys.stderr)
+    for field, number in sorted(statistics['fields'].items()):
+        print("- {}: {} entries".format(field, number), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
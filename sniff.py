@@ -0,0 +1,298 @@
+"""
+    @description:   Detection of the real format of files from their leading bytes ("magic bytes"), independent
+                    of their extension. Besides the format, two problems are detected:
+
+                    * mismatch - the extension belongs to another format than the content (e.g. a PNG file
+                        named .jpg)
+                    * truncated - the file is empty or ends before its format says it should end (e.g. a JPEG
+                        file without end-of-image marker, a PDF file without %%EOF). Data appended after the
+                        end marker (e.g. the video of a motion photo) does not make a file truncated; the
+                        end marker is searched for in the whole file before it is regarded as missing.
+
+                    A file is corrupt if it is truncated, or if its extension promises a format whose magic
+                    bytes are mandatory and unambiguous (e.g. TIFF, JPEG, PNG, ZIP) but cannot be found in the
+                    file at all. Formats whose magic bytes are optional or may be preceded by other data
+                    (LOOSE_TYPES, e.g. MP3 without ID3 tag, XML without declaration, QuickTime files without
+                    ftyp box) and extensions used by unrelated formats (LOOSE_EXTENSIONS, e.g. .db) are never
+                    regarded as corrupt; if their format is not recognized, they are reported as mismatch
+                    only. The result is stored per entry of the catalogue:
+
+                        entry['detected_type'] = "jpg"      (None if the format is unknown)
+                        entry['sniff'] = {'stamp': [size, mtime_ns], 'mismatch': False, 'truncated': False,
+                                          'corrupt': False}
+
+                    The detected types are named after the usual extension of the format, so they can be
+                    checked against the skipped extensions.
+"""
+
+import os, struct, threading
+from concurrent.futures import ThreadPoolExecutor
+
+HEAD_BYTES = 64
+TAIL_BYTES = 1024
+ZIP_TAIL_BYTES = 22 + 65535
+# PDF readers accept data in front of the header within the first KB
+PDF_HEADER_BYTES = 1024
+# if the end marker of a JPEG, PDF, PNG or GIF file is not within the last TAIL_BYTES, data may have been appended
+# after it (e.g. the video of a "motion photo"); it is then searched for further back in blocks, down to the header,
+# so a file is only regarded as truncated if it ends within its image data or stream
+TRAILER_BLOCK = 1024 * 1024
+# the EXIF thumbnail of a JPEG file (within the first 64 KB) has an end marker of its own
+JPEG_HEADER_BYTES = 65536 + 4
+
+# (detected type, offset, magic bytes)
+SIGNATURES = [
+    ('tif', 0, b"II*\0"),
+    ('tif', 0, b"MM\0*"),
+    ('tif', 0, b"II+\0"),
+    ('tif', 0, b"MM\0+"),
+    ('jpg', 0, b"\xff\xd8\xff"),
+    ('pdf', 0, b"%PDF-"),
+    ('png', 0, b"\x89PNG\r\n\x1a\n"),
+    ('gif', 0, b"GIF87a"),
+    ('gif', 0, b"GIF89a"),
+    ('bmp', 0, b"BM"),
+    ('psd', 0, b"8BPS"),
+    ('zip', 0, b"PK\x03\x04"),
+    ('zip', 0, b"PK\x05\x06"),
+    ('doc', 0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),
+    ('rar', 0, b"Rar!\x1a\x07"),
+    ('7z', 0, b"7z\xbc\xaf\x27\x1c"),
+    ('gz', 0, b"\x1f\x8b"),
+    ('mp3', 0, b"ID3"),
+    ('rtf', 0, b"{\\rtf"),
+    ('ps', 0, b"%!PS"),
+    ('ps', 0, b"\xc5\xd0\xd3\xc6"),
+    ('sqlite', 0, b"SQLite format 3\0"),
+    ('mp4', 4, b"ftyp"),
+    # QuickTime files may start with any of their top-level atoms
+    ('mp4', 4, b"moov"),
+    ('mp4', 4, b"mdat"),
+    ('mp4', 4, b"wide"),
+    ('mp4', 4, b"free"),
+    ('mp4', 4, b"skip"),
+    ('mp4', 4, b"pnot")
+]
+RIFF_TYPES = {b"WAVE": 'wav', b"AVI ": 'avi', b"WEBP": 'webp'}
+LOOSE_TYPES = frozenset(('mp3', 'mp4', 'xml'))
+LOOSE_EXTENSIONS = frozenset(('db',))
+
+# extensions which are expected for a detected type; files with other known extensions are mismatches
+EXTENSIONS = {
+    'tif': ('tif', 'tiff'),
+    'jpg': ('jpg', 'jpeg', 'jpe'),
+    'pdf': ('pdf', 'ai'),
+    'ps': ('ps', 'eps', 'ai'),
+    'png': ('png',),
+    'gif': ('gif',),
+    'bmp': ('bmp',),
+    'psd': ('psd', 'psb'),
+    'zip': ('zip', 'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'kmz', 'jar'),
+    'doc': ('doc', 'xls', 'ppt', 'msg', 'db'),
+    'rar': ('rar',),
+    '7z': ('7z',),
+    'gz': ('gz', 'tgz'),
+    'mp3': ('mp3',),
+    'rtf': ('rtf',),
+    'xml': ('xml', 'svg', 'kml', 'gpx'),
+    'mp4': ('mp4', 'mov', 'm4a', 'm4v', '3gp'),
+    'wav': ('wav',),
+    'avi': ('avi',),
+    'webp': ('webp',),
+    'sqlite': ('sqlite', 'sqlite3', 'db')
+}
+
+
+def _known_extensions():
+    known = {}
+    for detected_type, extensions in EXTENSIONS.items():
+        for extension in extensions:
+            known.setdefault(extension, set()).add(detected_type)
+    return known
+
+
+# extension: set of the types expected for it
+KNOWN_EXTENSIONS = _known_extensions()
+
+
+"""
+    @description:   This function detects the format from the leading bytes of a file.
+
+    @return:        [String] Returns the detected type, or None if the format is unknown.
+"""
+def detect_type(head):
+    if head[:4] == b"RIFF":
+        return RIFF_TYPES.get(head[8:12])
+    for detected_type, offset, magic in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return detected_type
+    if _is_xml(head):
+        return 'xml'
+    # MPEG audio frames without ID3 tag start with a frame sync (11 set bits)
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return 'mp3'
+    return None
+
+
+"""
+    @description:   This function checks whether the leading bytes are the beginning of an XML document: after
+                    an optional byte order mark and whitespace, a declaration, a comment, a document type or
+                    directly the root element.
+"""
+def _is_xml(head):
+    if head[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        encoding = "utf-16-le" if head[:2] == b"\xff\xfe" else "utf-16-be"
+        head = head[2:].decode(encoding, "ignore").encode("ascii", "ignore")
+    elif head[:3] == b"\xef\xbb\xbf":
+        head = head[3:]
+    head = head.lstrip()
+    return head[:2] in (b"<?", b"<!") or (head[:1] == b"<" and (head[1:2].isalpha() or head[1:2] == b"_"))
+
+
+def _read_tail(file, size, length):
+    file.seek(max(0, size - length))
+    return file.read(length)
+
+
+def _tail_contains(file, size, marker, floor=0):
+    if marker in _read_tail(file, size, TAIL_BYTES):
+        return True
+    end = size - TAIL_BYTES
+    while end > floor:
+        start = max(floor, end - TRAILER_BLOCK)
+        file.seek(start)
+        # the blocks overlap by the length of the marker, so a marker across two blocks is found as well
+        if marker in file.read(end - start + len(marker) - 1):
+            return True
+        end = start
+    return False
+
+
+"""
+    @description:   This function checks whether a file of the detected type ends where its format says it
+                    should end. Formats without such a check are never regarded as truncated.
+"""
+def is_truncated(file, size, detected_type, head):
+    if detected_type == 'jpg':
+        # some cameras append data after the end-of-image marker
+        return not _tail_contains(file, size, b"\xff\xd9", JPEG_HEADER_BYTES)
+    if detected_type == 'pdf':
+        return not _tail_contains(file, size, b"%%EOF")
+    if detected_type == 'png':
+        # type and CRC of the IEND chunk
+        return not _tail_contains(file, size, b"IEND\xaeB`\x82", 8)
+    if detected_type == 'gif':
+        if _read_tail(file, size, 32).rstrip(b"\0").endswith(b";"):
+            return False
+        # block terminator of the last image followed by the trailer
+        return not _tail_contains(file, size, b"\0;", 13)
+    if detected_type == 'zip':
+        return b"PK\x05\x06" not in _read_tail(file, size, ZIP_TAIL_BYTES)
+    if detected_type == 'tif':
+        # BigTIFF stores the offset of the first directory in 8 bytes
+        big = head[2:4] in (b"+\0", b"\0+")
+        if len(head) < (16 if big else 8):
+            return True
+        order = "<" if head[:2] == b"II" else ">"
+        if big:
+            offset = struct.unpack(order + "Q", head[8:16])[0]
+        else:
+            offset = struct.unpack(order + "I", head[4:8])[0]
+        return offset >= size
+    if detected_type == 'bmp':
+        return len(head) < 6 or struct.unpack("<I", head[2:6])[0] > size
+    if detected_type in ('wav', 'avi', 'webp'):
+        return len(head) < 8 or struct.unpack("<I", head[4:8])[0] + 8 > size
+    return False
+
+
+"""
+    @description:   This function sniffs a single file.
+
+    @parameters:    * path [String] - the file
+                    * extension [String] - the extension of the file as registered in the catalogue
+
+    @return:        [Dict] Returns the detected type and the flags mismatch, truncated and corrupt.
+"""
+def sniff_file(path, extension):
+    extension = extension.lower()
+    expected_types = KNOWN_EXTENSIONS.get(extension, ())
+
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        head = file.read(HEAD_BYTES)
+        detected_type = detect_type(head)
+        if detected_type is None and 'pdf' in expected_types:
+            file.seek(0)
+            if b"%PDF-" in file.read(PDF_HEADER_BYTES):
+                detected_type = 'pdf'
+        truncated = size == 0 or (detected_type is not None and is_truncated(file, size, detected_type, head))
+
+    # only formats with mandatory and unambiguous magic bytes can be regarded as corrupt
+    strict = bool(expected_types) and extension not in LOOSE_EXTENSIONS and expected_types.isdisjoint(LOOSE_TYPES)
+    if detected_type is None:
+        mismatch = bool(expected_types) and not strict
+        corrupt = strict
+    else:
+        mismatch = bool(expected_types) and detected_type not in expected_types
+        corrupt = truncated and detected_type not in LOOSE_TYPES
+    return {
+        'detected_type': detected_type,
+        'mismatch': mismatch,
+        'truncated': truncated,
+        'corrupt': corrupt
+    }
+
+
+"""
+    @description:   This function sniffs many entries of a catalogue in a bounded thread pool and stores the
+                    results in the entries. Files whose size and modification time match the stored stamp
+                    are not read again. If the detected type of an entry changes, its stored verdict of the
+                    skip rules is removed, so update_entries() classifies it again.
+
+    @parameters:    * entries [Dict] - the catalogue (file path: entry)
+                    * files [Iterable] - the files of the catalogue to look at
+                    * workers [int] - number of threads reading files
+                    * force [bool] - if True, the files are read again regardless of the stamp
+
+    @return:        [Dict] Returns the number of files read, unchanged and missing, and of mismatches,
+                    truncated and corrupt files among the files read.
+"""
+def sniff_entries(entries, files, workers=8, force=False):
+    statistics = {'read': 0, 'unchanged': 0, 'missing': 0, 'mismatch': 0, 'truncated': 0, 'corrupt': 0}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def work(file):
+        try:
+            entry = entries[file]
+            try:
+                stat = os.stat(file)
+                stamp = [stat.st_size, stat.st_mtime_ns]
+                if not force and entry.get('sniff', {}).get('stamp') == stamp:
+                    with lock:
+                        statistics['unchanged'] += 1
+                    return
+                result = sniff_file(file, entry['extension'])
+            except OSError:
+                with lock:
+                    statistics['missing'] += 1
+                return
+
+            if entry.get('detected_type') != result['detected_type']:
+                entry.pop('rule_verdict', None)
+            entry['detected_type'] = result.pop('detected_type')
+            result['stamp'] = stamp
+            entry['sniff'] = result
+            with lock:
+                statistics['read'] += 1
+                for flag in ('mismatch', 'truncated', 'corrupt'):
+                    statistics[flag] += int(result[flag])
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file in files:
+            slots.acquire()
+            executor.submit(work, file)
+    return statistics
@@ -0,0 +1,63 @@
+"""
+    @description:   Tests of the format detection (see sniff.py) on small generated files.
+
+                        python -m unittest discover tests
+"""
+
+import os, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sniff
+
+JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00" + b"\x12\x34" * 50000 + b"\xff\xd9"
+PDF = b"%PDF-1.4\n" + b"1 0 obj << >> endobj\n" * 1000 + b"%%EOF\n"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100 + b"\x00\x00\x00\x00IEND\xaeB`\x82"
+# appended data without any end marker, like the video of a motion photo
+TRAILER = b"\x00\x00\x00\x18ftypmp42" * (256 * 1024)
+
+
+class SniffFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def sniff(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as sample:
+            sample.write(content)
+        return sniff.sniff_file(path, name.rsplit(".", 1)[1])
+
+    def assertValid(self, result, detected_type):
+        self.assertEqual(result, {'detected_type': detected_type, 'mismatch': False, 'truncated': False,
+                                  'corrupt': False})
+
+    def test_complete_files(self):
+        self.assertValid(self.sniff("a.jpg", JPEG), 'jpg')
+        self.assertValid(self.sniff("a.pdf", PDF), 'pdf')
+        self.assertValid(self.sniff("a.png", PNG), 'png')
+
+    def test_appended_trailer(self):
+        self.assertGreater(len(TRAILER), 2 * 1024 ** 2)
+        self.assertValid(self.sniff("motion.jpg", JPEG + TRAILER), 'jpg')
+        self.assertValid(self.sniff("appended.pdf", PDF + TRAILER), 'pdf')
+        self.assertValid(self.sniff("appended.png", PNG + TRAILER), 'png')
+
+    def test_truncated_files(self):
+        for name, content in (("a.jpg", JPEG[:-2] + TRAILER), ("a.pdf", PDF[:-6]), ("a.png", PNG[:-12])):
+            result = self.sniff(name, content)
+            self.assertTrue(result['truncated'], name)
+            self.assertTrue(result['corrupt'], name)
+
+    def test_loose_types(self):
+        result = self.sniff("a.xml", b"\xff\xfe" + "<root/>".encode("utf-16-le"))
+        self.assertValid(result, 'xml')
+        result = self.sniff("a.mp3", b"\x00" * 100)
+        self.assertTrue(result['mismatch'])
+        self.assertFalse(result['corrupt'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+    @description:   Tests of the scans of the Fileserver on the virtual file system (see virtualfs.py). They
+                    run in a temporary working directory, as the storage folder is relative to it.
+
+                        python -m unittest discover tests
+"""
+
+import os, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fileserver import Fileserver
+from virtualfs import VirtualFS
+
+ROOT = "/virtual/Fileserver"
+
+
+class RegisterFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        os.mkdir("storage")
+
+        self.fs = VirtualFS.synthetic(ROOT, depth=3, folders=3, files=4)
+        # root, 3 folders and 9 subfolders with 4 files each
+        self.folders = 1 + 3 + 9
+        self.files = 4 * self.folders
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_register_files_with_cache(self):
+        with self.fs.patch():
+            fileserver = Fileserver(ROOT + "/", "./storage/", loading_existant=False)
+            self.assertEqual(len(fileserver.fileserver), self.files)
+
+            self.fs.reset_counts()
+            fileserver.register_files(use_cache=True)
+            self.assertEqual(len(fileserver.fileserver), self.files)
+            self.assertEqual(self.fs.counts['scandir'], self.folders)
+
+            # the cache is warm: every folder costs a stat(), but none is listed again
+            self.fs.reset_counts()
+            fileserver.register_files(use_cache=True)
+            self.assertEqual(len(fileserver.fileserver), self.files)
+            self.assertEqual(self.fs.counts['scandir'], 0)
+            self.assertEqual(self.fs.counts['stat'], self.folders)
+
+            # only the modified folder is listed again
+            self.fs.add_file(ROOT + "/new.tif", 100)
+            self.fs.reset_counts()
+            fileserver.register_files(use_cache=True)
+            self.assertEqual(len(fileserver.fileserver), self.files + 1)
+            self.assertEqual(self.fs.counts['scandir'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+    @description:   Tests of the FileserverWatcher (see watch.py) on the virtual file system (see virtualfs.py).
+                    They run in a temporary working directory, as the storage folder and the rule files are
+                    relative to it.
+
+                        python -m unittest discover tests
+"""
+
+import os, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fileserver import Fileserver
+from virtualfs import VirtualFS
+from watch import FileserverWatcher
+
+ROOT = "/virtual/Fileserver"
+PRUNED = ROOT + "/Bibliography"
+
+
+class PollTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        os.mkdir("storage")
+        with open("storage/skipped_folders.txt", "w") as rule_file:
+            rule_file.write(PRUNED + "\n")
+        with open("storage/skipped_extensions.txt", "w") as rule_file:
+            rule_file.write("psd\n")
+
+        self.fs = VirtualFS(ROOT)
+        for path in ("/AU1000/a.tif", "/AU1000/b.jpg", "/TT84/c.tif", "/Bibliography/d.pdf",
+                     "/Bibliography/sub/e.pdf"):
+            self.fs.add_file(ROOT + path, 100)
+        self.patch = self.fs.patch()
+        self.patch.__enter__()
+
+        self.fileserver = Fileserver(ROOT + "/", "./storage/", loading_existant=False)
+        self.watcher = FileserverWatcher(self.fileserver, save_every=10 ** 6, save_interval=10 ** 6)
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def still_there(self):
+        return sorted(file for file, entry in self.fileserver.fileserver.items() if entry['still_there'])
+
+    def test_created(self):
+        self.fs.add_file(ROOT + "/TT84/new.tif", 100)
+        self.watcher._poll_once()
+        entry = self.fileserver.fileserver[ROOT + "/TT84/new.tif"]
+        self.assertTrue(entry['still_there'])
+        self.assertEqual(entry['path'], ROOT + "/TT84")
+        self.assertIn('db_entries', entry)
+
+    def test_deleted(self):
+        self.fs.remove(ROOT + "/AU1000/a.tif")
+        self.watcher._poll_once()
+        self.assertFalse(self.fileserver.fileserver[ROOT + "/AU1000/a.tif"]['still_there'])
+        self.assertTrue(self.fileserver.fileserver[ROOT + "/AU1000/b.jpg"]['still_there'])
+
+    def test_moved_by_polling(self):
+        self.fs.move(ROOT + "/AU1000/a.tif", ROOT + "/TT84/a.tif")
+        self.watcher._poll_once()
+        self.assertFalse(self.fileserver.fileserver[ROOT + "/AU1000/a.tif"]['still_there'])
+        self.assertTrue(self.fileserver.fileserver[ROOT + "/TT84/a.tif"]['still_there'])
+
+    def test_moved_keeps_entry(self):
+        self.fileserver.load_skip_rules()
+        entry = self.fileserver.fileserver[ROOT + "/AU1000/a.tif"]
+        entry['processed'] = True
+        entry['sniff'] = {'stamp': [100, 1], 'mismatch': False, 'truncated': False, 'corrupt': False}
+
+        self.fs.move(ROOT + "/AU1000/a.tif", ROOT + "/TT84/a.tif")
+        self.watcher.moved(ROOT + "/AU1000/a.tif", ROOT + "/TT84/a.tif", False)
+        self.assertNotIn(ROOT + "/AU1000/a.tif", self.fileserver.fileserver)
+        moved = self.fileserver.fileserver[ROOT + "/TT84/a.tif"]
+        self.assertEqual(moved['path'], ROOT + "/TT84")
+        self.assertTrue(moved['processed'])
+        self.assertEqual(moved['sniff']['stamp'], [100, 1])
+
+    def test_pruned_folder(self):
+        self.fileserver.register_files(prune=True, record_pruned=True)
+        before = self.still_there()
+        self.assertIn(PRUNED + "/", before)
+        self.assertNotIn(PRUNED + "/d.pdf", before)
+
+        self.fs.add_file(PRUNED + "/f.pdf", 100)
+        self.watcher._poll_once()
+        self.assertEqual(self.still_there(), before)
+        self.assertEqual(len(self.fileserver.fileserver), len(before))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+"""
+    @description:   UploadScheduler class which drives the upload of all files of a Fileserver object that
+                    still have to be uploaded, i.e. files which are neither skipped, lost nor processed.
+
+                    The files are grouped into batches (by folder or by package) and handed to an uploader,
+                    which is any callable accepting a list of file paths and raising an exception if the
+                    upload failed. The batches are uploaded by a bounded pool of worker threads. As soon as a
+                    batch has been uploaded, its files are flagged as processed and the batch is written to a
+                    journal, so an interrupted upload can be continued without uploading these files again.
+
+                    Example with the local stand-in uploader:
+
+                        fileserver = Fileserver()
+                        scheduler = UploadScheduler(fileserver, LocalCopyUploader("D:/upload_test/", fileserver))
+                        scheduler.run()
+"""
+
+import os, json, time, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class UploadScheduler:
+    def __init__(self, fileserver, uploader, batch_by="folder", batch_size=100, workers=4, retries=3,
+                 retry_delay=5, journal_path=""):
+        if batch_by not in ("folder", "package"):
+            raise ValueError("batch_by must be either 'folder' or 'package', not '{}'.".format(batch_by))
+
+        self.fileserver = fileserver
+        self.uploader = uploader
+        self.batch_by = batch_by
+        self.batch_size = batch_size
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        if journal_path == "":
+            self.journal_path = fileserver.slash(fileserver.path_storage) + "upload_journal.txt"
+        else:
+            self.journal_path = r"" + journal_path
+
+        self.lock = threading.Lock()
+        self.uploaded_batches = 0
+        self.uploaded_files = 0
+        self.failed_batches = []
+
+    """
+        @description:   This method groups all files which still have to be uploaded into batches. The files
+                        are returned by the catalogue grouped by folder, so only one batch is collected at a
+                        time: it is handed out as soon as it is full or the folder (or package) changes.
+
+        @return:        [Generator] Yields tuples (key, list of file paths).
+    """
+    def batches(self):
+        key = None
+        batch = []
+        files = self.fileserver.iter_files(skip=False, still_there=True, processed=False)
+        for file in files:
+            entry = self.fileserver.fileserver[file]
+            if self.batch_by == "folder":
+                file_key = entry['path']
+            else:
+                packages = entry.get('packages')
+                file_key = packages[0] if packages else ""
+
+            if batch and (file_key != key or len(batch) >= self.batch_size):
+                yield key, batch
+                batch = []
+            key = file_key
+            batch.append(file)
+
+        if batch:
+            yield key, batch
+
+    """
+        @description:   This method uploads all remaining files. A leftover journal of an interrupted run is
+                        applied first. At the end, the Fileserver JSON is saved and the journal is removed,
+                        unless a batch has failed.
+
+        @return:        [bool] Returns True if all batches have been uploaded successfully and the catalogue
+                        has been saved.
+    """
+    def run(self):
+        print("=> UploadScheduler.run(batch_by={}, batch_size={}, workers={})".format(
+            self.batch_by, self.batch_size, self.workers))
+        time_start = time.time()
+        self.recover()
+
+        # at most two batches per worker wait in the queue, so the batches are not built all at once
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for key, batch in self.batches():
+                slots.acquire()
+                future = executor.submit(self._upload_batch, key, batch)
+                future.add_done_callback(
+                    lambda future, key=key, batch=batch: self._batch_done(future, key, batch, slots))
+
+        # if the catalogue cannot be saved (read-only session, or saved by another session in the meantime) or a
+        # batch has failed, the journal is kept and applied again by the next run (see recover()), as the batch
+        # may have failed after it had been written to the journal
+        saved = self.fileserver.save_json()
+        if not saved:
+            print("The catalogue has not been saved, the journal {} is kept for the next run.".format(
+                self.journal_path))
+        elif not self.failed_batches and os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+        print("Upload finished! ({0:.2f}s)".format(time.time() - time_start))
+        print("{} files in {} batches have been uploaded.".format(self.uploaded_files, self.uploaded_batches))
+        if self.failed_batches:
+            print("{} batches failed:".format(len(self.failed_batches)))
+            for key, batch, error in self.failed_batches:
+                print("- {} ({} files): {}".format(key, len(batch), error))
+        return saved and not self.failed_batches
+
+    """
+        @description:   This method is called as soon as a batch has finished. Errors which have not been handled
+                        by _upload_batch() (e.g. while writing the journal) are recorded as failed batch.
+    """
+    def _batch_done(self, future, key, batch, slots):
+        slots.release()
+        error = future.exception()
+        if error is not None:
+            print("Batch {} failed: {}".format(key, repr(error)), flush=True)
+            with self.lock:
+                self.failed_batches.append((key, batch, repr(error)))
+
+    def _upload_batch(self, key, batch):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.uploader(batch)
+                break
+            except Exception as error:
+                if attempt > self.retries:
+                    print("Batch {} failed after {} attempts: {}".format(key, attempt, error), flush=True)
+                    with self.lock:
+                        self.failed_batches.append((key, batch, repr(error)))
+                    return False
+                print("Batch {} failed (attempt {}), retrying: {}".format(key, attempt, error), flush=True)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+        self.checkpoint(batch)
+        print("Batch {} uploaded ({} files).".format(key, len(batch)), flush=True)
+        return True
+
+    """
+        @description:   This method flags all files of an uploaded batch as processed. The batch is appended
+                        to the journal in one single write (and flushed to disk) while holding the lock, so
+                        either the whole batch is recorded or none of it.
+    """
+    def checkpoint(self, batch):
+        line = json.dumps(batch) + "\n"
+        with self.lock:
+            with open(self.journal_path, "a") as journal:
+                journal.write(line)
+                journal.flush()
+                os.fsync(journal.fileno())
+            for file in batch:
+                before = self.fileserver.rollup_before(file)
+                self.fileserver.fileserver[file]['processed'] = True
+                self.fileserver.rollup_after(file, before)
+            self.uploaded_batches += 1
+            self.uploaded_files += len(batch)
+
+    """
+        @description:   This method applies the journal of an interrupted upload to the Fileserver object, i.e.
+                        all files which have been uploaded in that run are flagged as processed again.
+                        An incomplete last line (crash while writing) is ignored. The journal is only removed
+                        once the catalogue has been saved.
+    """
+    def recover(self):
+        if not os.path.isfile(self.journal_path):
+            return 0
+
+        total = 0
+        with open(self.journal_path) as journal:
+            for line in journal:
+                try:
+                    batch = json.loads(line)
+                except ValueError:
+                    continue
+                for file in batch:
+                    if file in self.fileserver.fileserver:
+                        before = self.fileserver.rollup_before(file)
+                        self.fileserver.fileserver[file]['processed'] = True
+                        self.fileserver.rollup_after(file, before)
+                        total += 1
+
+        print("{} files of an interrupted upload have been flagged as processed.".format(total))
+        if self.fileserver.save_json():
+            os.remove(self.journal_path)
+        else:
+            print("The catalogue has not been saved, the journal {} is kept.".format(self.journal_path))
+        return total
+
+
+"""
+    @description:   Stand-in uploader which copies the files into a local directory, keeping their path
+                    relative to the fileserver. It can be used to test the UploadScheduler without the
+                    actual upload.
+"""
+class LocalCopyUploader:
+    def __init__(self, target_directory, fileserver):
+        self.target_directory = fileserver.slash(target_directory)
+        self.path_fileserver = fileserver.slash(fileserver.path_fileserver)
+
+    def __call__(self, batch):
+        for file in batch:
+            relative = file[len(self.path_fileserver):] if file.startswith(self.path_fileserver) else file
+            target = os.path.join(self.target_directory, relative.lstrip("/").replace(":", ""))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(file, target)
@@ -0,0 +1,343 @@
+"""
+    @description:   VirtualFS class, a test double for the file system calls of the Fileserver (ext/scandir's
+                    scandir() and walk(), os.stat(), os.path.isfile(), os.path.isdir() and os.path.exists()).
+                    It serves a synthetic or recorded tree from memory, adds a configurable latency (with
+                    jitter) to every listing and every stat() to imitate the network share, and counts all
+                    calls. Paths outside of the virtual tree are passed on to the real file system, so the
+                    storage folder keeps working.
+
+                    Example:
+
+                        fs = VirtualFS.synthetic("L:/Fileserver", depth=3, folders=5, files=20,
+                                                 listing_latency=0.02, stat_latency=0.005, jitter=0.3)
+                        with fs.patch():
+                            fileserver = Fileserver("L:/Fileserver/", "./storage/", loading_existant=False)
+                            fileserver.register_files(use_cache=True)
+                        print(fs.counts)
+
+                    A tree can be recorded from a real folder (record()) and stored as JSON (save(), load()),
+                    so the same tree can be used again. The tree can be changed (add_file(), remove(),
+                    move()) to test incremental scans; the modification times of the folders change like
+                    on a real file system.
+
+                    benchmark.py compares the modes of register_files() on a virtual tree; the tests in
+                    tests/test_virtualfs.py use it to count the calls of the scans.
+"""
+
+import json, os, random, stat as stat_module, threading, time
+from collections import Counter
+from contextlib import contextmanager
+
+import ext.scandir as scandir
+
+
+class VirtualStat:
+    __slots__ = ('st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_size', 'st_mtime', 'st_mtime_ns')
+
+    def __init__(self, is_dir, size, mtime_ns, inode):
+        self.st_mode = (stat_module.S_IFDIR | 0o755) if is_dir else (stat_module.S_IFREG | 0o644)
+        self.st_ino = inode
+        self.st_dev = 0
+        self.st_nlink = 1
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+        self.st_mtime = mtime_ns / 1e9
+
+
+class VirtualDirEntry:
+    __slots__ = ('fs', 'name', 'path', '_node')
+
+    def __init__(self, fs, directory, name, node):
+        self.fs = fs
+        self.name = name
+        self.path = directory + "/" + name
+        self._node = node
+
+    def is_dir(self, follow_symlinks=True):
+        return self._node[0]
+
+    def is_file(self, follow_symlinks=True):
+        return not self._node[0]
+
+    def is_symlink(self):
+        return False
+
+    def inode(self):
+        return self._node[3]
+
+    """
+        @description:   On Windows, the stat information comes with the listing; on other systems, it costs
+                        an additional stat() (see VirtualFS.entry_stat_free).
+    """
+    def stat(self, follow_symlinks=True):
+        self.fs._count("entry_stat")
+        if not self.fs.entry_stat_free:
+            self.fs._wait(self.fs.stat_latency)
+        return VirtualStat(*self._node)
+
+    def __repr__(self):
+        return "<VirtualDirEntry {!r}>".format(self.name)
+
+
+class VirtualFS:
+    def __init__(self, root, listing_latency=0.0, stat_latency=0.0, jitter=0.0, entry_stat_free=True, seed=None):
+        self.root = self.normalize(root)
+        self.listing_latency = listing_latency
+        self.stat_latency = stat_latency
+        self.jitter = jitter
+        self.entry_stat_free = entry_stat_free
+        self.random = random.Random(seed)
+
+        # folder: {name: [is_dir, size, mtime_ns, inode]}; the folders themselves are nodes of their parents
+        self.folders = {self.root: {}}
+        self.root_node = [True, 0, time.time_ns(), 1]
+        self.next_inode = 2
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(path):
+        path = os.fspath(path).replace("\\", "/")
+        while "//" in path:
+            path = path.replace("//", "/")
+        return path.rstrip("/") if len(path) > 1 else path
+
+    """
+        @description:   This method creates a synthetic tree with the given number of folders per level and
+                        files per folder.
+    """
+    @classmethod
+    def synthetic(cls, root, depth=3, folders=5, files=20, extensions=("tif", "jpg", "pdf"), seed=0, **options):
+        fs = cls(root, seed=seed, **options)
+        generator = random.Random(seed)
+
+        def fill(path, level):
+            for number in range(files):
+                name = "file_{}_{}.{}".format(level, number, extensions[number % len(extensions)])
+                fs.add_file(path + "/" + name, generator.randint(1, 50 * 1024 ** 2))
+            if level < depth:
+                for number in range(folders):
+                    folder = path + "/AU{}".format(generator.randint(1000, 9999)) + "_{}".format(number)
+                    fs.add_folder(folder)
+                    fill(folder, level + 1)
+
+        fill(fs.root, 1)
+        return fs
+
+    """
+        @description:   This method records the tree of a real folder (names, sizes, modification times).
+    """
+    @classmethod
+    def record(cls, path, root=None, **options):
+        path = cls.normalize(path)
+        fs = cls(root or path, **options)
+        for directory, dirs, files in scandir.walk(path):
+            directory = cls.normalize(directory)
+            target = fs.root + directory[len(path):]
+            for name in dirs:
+                fs.add_folder(target + "/" + name)
+            for name in files:
+                try:
+                    stat = os.stat(directory + "/" + name)
+                except OSError:
+                    continue
+                fs.add_file(target + "/" + name, stat.st_size, stat.st_mtime_ns)
+        return fs
+
+    def save(self, path):
+        with open(path, "w") as json_file:
+            json.dump({'root': self.root, 'folders': self.folders}, json_file)
+
+    @classmethod
+    def load(cls, path, **options):
+        with open(path) as json_file:
+            data = json.load(json_file)
+        fs = cls(data['root'], **options)
+        fs.folders = data['folders']
+        fs.next_inode = 1 + max((node[3] for children in fs.folders.values() for node in children.values()), default=1)
+        return fs
+
+    def _split(self, path):
+        path = self.normalize(path)
+        position = path.rfind("/")
+        return path[:position], path[position + 1:]
+
+    def _touch(self, folder, mtime_ns=None):
+        node = self._node(folder)
+        if node is not None:
+            node[2] = mtime_ns or time.time_ns()
+
+    def _node(self, path):
+        path = self.normalize(path)
+        if path == self.root:
+            return self.root_node
+        parent, name = self._split(path)
+        children = self.folders.get(parent)
+        return children.get(name) if children is not None else None
+
+    def _new_node(self, is_dir, size, mtime_ns):
+        node = [is_dir, size, mtime_ns or time.time_ns(), self.next_inode]
+        self.next_inode += 1
+        return node
+
+    def add_folder(self, path, mtime_ns=None):
+        path = self.normalize(path)
+        parent, name = self._split(path)
+        if parent not in self.folders:
+            self.add_folder(parent)
+        if name not in self.folders[parent]:
+            self.folders[parent][name] = self._new_node(True, 0, mtime_ns)
+            self.folders[path] = {}
+            self._touch(parent)
+
+    def add_file(self, path, size=0, mtime_ns=None):
+        parent, name = self._split(path)
+        if parent not in self.folders:
+            self.add_folder(parent)
+        self.folders[parent][name] = self._new_node(False, size, mtime_ns)
+        self._touch(parent)
+
+    def remove(self, path):
+        path = self.normalize(path)
+        parent, name = self._split(path)
+        node = self.folders[parent].pop(name)
+        if node[0]:
+            for folder in [folder for folder in self.folders if folder == path or folder.startswith(path + "/")]:
+                del self.folders[folder]
+        self._touch(parent)
+
+    """
+        @description:   This method moves a file within the tree; like on a real volume, the file keeps its
+                        inode, size and modification time.
+    """
+    def move(self, old_path, new_path):
+        old_parent, old_name = self._split(old_path)
+        new_parent, new_name = self._split(new_path)
+        if new_parent not in self.folders:
+            self.add_folder(new_parent)
+        node = self.folders[old_parent].pop(old_name)
+        if node[0]:
+            raise ValueError("Only files can be moved.")
+        self.folders[new_parent][new_name] = node
+        self._touch(old_parent)
+        self._touch(new_parent)
+
+    def contains(self, path):
+        path = self.normalize(path)
+        return path == self.root or path.startswith(self.root + "/")
+
+    def _count(self, call):
+        with self.lock:
+            self.counts[call] += 1
+
+    def _wait(self, latency):
+        if latency <= 0:
+            return
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(latency * factor)
+
+    """
+        @description:   Virtual equivalents of the file system calls.
+    """
+    def scandir(self, path="."):
+        self._count("scandir")
+        self._wait(self.listing_latency)
+        directory = self.normalize(path)
+        children = self.folders.get(directory)
+        if children is None:
+            raise FileNotFoundError(2, "No such directory", path)
+        return iter([VirtualDirEntry(self, directory, name, node) for name, node in list(children.items())])
+
+    def stat(self, path, *args, **kwargs):
+        self._count("stat")
+        self._wait(self.stat_latency)
+        node = self._node(path)
+        if node is None:
+            raise FileNotFoundError(2, "No such file or directory", path)
+        return VirtualStat(*node)
+
+    def isfile(self, path):
+        self._count("isfile")
+        self._wait(self.stat_latency)
+        node = self._node(path)
+        return node is not None and not node[0]
+
+    def isdir(self, path):
+        self._count("isdir")
+        self._wait(self.stat_latency)
+        node = self._node(path)
+        return node is not None and node[0]
+
+    def exists(self, path):
+        self._count("exists")
+        self._wait(self.stat_latency)
+        return self._node(path) is not None
+
+    def walk(self, top, topdown=True, onerror=None, followlinks=False):
+        try:
+            entries = list(self.scandir(top))
+        except OSError as error:
+            if onerror is not None:
+                onerror(error)
+            return
+
+        dirs = [entry.name for entry in entries if entry.is_dir()]
+        nondirs = [entry.name for entry in entries if not entry.is_dir()]
+        if topdown:
+            yield top, dirs, nondirs
+        for name in dirs:
+            for result in self.walk(os.path.join(top, name), topdown, onerror, followlinks):
+                yield result
+        if not topdown:
+            yield top, dirs, nondirs
+
+    """
+        @description:   Context manager which replaces the file system calls by their virtual equivalents for
+                        all paths within the virtual tree, and restores them afterwards.
+    """
+    @contextmanager
+    def patch(self):
+        originals = {
+            (scandir, 'scandir'): scandir.scandir,
+            (scandir, 'walk'): scandir.walk,
+            (os, 'stat'): os.stat,
+            (os.path, 'isfile'): os.path.isfile,
+            (os.path, 'isdir'): os.path.isdir,
+            (os.path, 'exists'): os.path.exists
+        }
+        virtual = {
+            (scandir, 'scandir'): self.scandir,
+            (scandir, 'walk'): self.walk,
+            (os, 'stat'): self.stat,
+            (os.path, 'isfile'): self.isfile,
+            (os.path, 'isdir'): self.isdir,
+            (os.path, 'exists'): self.exists
+        }
+
+        def dispatch(key):
+            original = originals[key]
+            replacement = virtual[key]
+
+            def call(path=".", *args, **kwargs):
+                if isinstance(path, (str, os.PathLike)) and self.contains(path):
+                    return replacement(path, *args, **kwargs)
+                return original(path, *args, **kwargs)
+            return call
+
+        for (module, name) in originals:
+            setattr(module, name, dispatch((module, name)))
+        try:
+            yield self
+        finally:
+            for (module, name), original in originals.items():
+                setattr(module, name, original)
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts = Counter()
+
+    def report(self):
+        print("Virtual file system: " + ", ".join("{} {}".format(number, call)
+                                                  for call, number in sorted(self.counts.items())))
+        return dict(self.counts)
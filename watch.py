@@ -0,0 +1,415 @@
+"""
+    @description:   FileserverWatcher class which keeps a Fileserver object up to date without rescanning
+                    the whole fileserver. On Linux (e.g. for a local mirror of the share) the filesystem
+                    events are received from inotify; on all other systems, or if inotify is not available,
+                    the fileserver is polled in regular intervals instead.
+
+                    Only the affected entries are classified and get their database connections extracted.
+                    Skipped folders are pruned like by register_files(prune=True) (see
+                    Fileserver.prune_folder()): they are neither walked nor watched, and the entries within
+                    them, including the placeholders of pruned folders, are left as they are.
+                    The Fileserver JSON is saved after a number of changes or after some time, and once more
+                    when the watcher is stopped (e.g. with Ctrl+C).
+
+                    Example:
+
+                        fileserver = Fileserver("/mnt/fileserver/")
+                        FileserverWatcher(fileserver).run()
+"""
+
+import os, struct, time, select
+import ext.scandir as scandir
+
+try:
+    import ctypes, ctypes.util
+except ImportError:
+    ctypes = None
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+"""
+    @description:   Minimal ctypes wrapper around the inotify API of the C library.
+"""
+class Inotify:
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") if ctypes is not None else None
+        if libc_name is None:
+            raise OSError("The C library could not be found, inotify is not available.")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("The C library does not support inotify.")
+
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self.watches = {}
+        self.paths = {}
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.watches[wd] = path
+        self.paths[path] = wd
+        return wd
+
+    def remove_watch(self, path):
+        wd = self.paths.pop(path, None)
+        if wd is not None:
+            self.watches.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    """
+        @description:   This method waits for events.
+
+        @return:        [List] Returns a list of tuples (mask, cookie, directory path, name); the list is
+                        empty if no events arrived within the timeout.
+    """
+    def read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((mask, cookie, self.watches.get(wd), name))
+            if mask & IN_IGNORED:
+                path = self.watches.pop(wd, None)
+                if path is not None and self.paths.get(path) == wd:
+                    del self.paths[path]
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileserverWatcher:
+    def __init__(self, fileserver, save_every=1000, save_interval=300, poll_interval=60, use_inotify=None):
+        self.fileserver = fileserver
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+        self.root = fileserver.slash(fileserver.path_fileserver).rstrip("/")
+        self.inotify = None
+        self.running = False
+        self.changes = 0
+        self.last_save = time.time()
+
+    """
+        @description:   This method watches the fileserver until stop() is called or the process is
+                        interrupted. If use_inotify is None, inotify is used whenever it is available.
+    """
+    def run(self):
+        print("=> FileserverWatcher.run({})".format(self.root))
+        self.fileserver.load_skip_rules()
+
+        if self.use_inotify is not False:
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as error:
+                if self.use_inotify:
+                    raise
+                print("inotify is not available ({}), polling every {}s instead.".format(error, self.poll_interval))
+
+        self.running = True
+        try:
+            if self.inotify is not None:
+                self._run_inotify()
+            else:
+                self._run_polling()
+        except KeyboardInterrupt:
+            print("Watcher has been interrupted.")
+        finally:
+            self.running = False
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
+            if self.changes:
+                self.save()
+
+    def stop(self):
+        self.running = False
+
+    def save(self):
+        print("{} changes have been applied since the last save.".format(self.changes))
+        self.fileserver.save_json()
+        self.changes = 0
+        self.last_save = time.time()
+
+    def _changed(self, number=1):
+        self.changes += number
+        if self.changes >= self.save_every or time.time() - self.last_save >= self.save_interval:
+            self.save()
+
+    def _run_inotify(self):
+        print("Adding watches...")
+        for path, subdirs, files in scandir.walk(self.root):
+            self._prune(path, subdirs)
+            self._add_watch(path)
+        print("{} folders are being watched.".format(len(self.inotify.paths)))
+
+        while self.running:
+            events = self.inotify.read_events(1.0)
+            if not events:
+                if self.changes and time.time() - self.last_save >= self.save_interval:
+                    self.save()
+                continue
+
+            # a move within the fileserver consists of a MOVED_FROM and a MOVED_TO event with the same cookie
+            moved_from = {}
+            for mask, cookie, directory, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    print("inotify queue overflow, checking the whole fileserver.")
+                    self._poll_once()
+                    continue
+                if directory is None or mask & IN_IGNORED:
+                    continue
+
+                path = self.fileserver.slash(os.path.join(directory, name)) if name else directory
+                is_dir = bool(mask & IN_ISDIR)
+
+                if mask & IN_MOVED_FROM:
+                    moved_from[cookie] = (path, is_dir)
+                elif mask & IN_MOVED_TO:
+                    if cookie in moved_from:
+                        old_path, old_is_dir = moved_from.pop(cookie)
+                        self.moved(old_path, path, is_dir)
+                    else:
+                        self.created(path, is_dir)
+                elif mask & (IN_CREATE | IN_CLOSE_WRITE):
+                    self.created(path, is_dir)
+                elif mask & IN_DELETE:
+                    self.deleted(path, is_dir)
+
+            # moved out of the watched tree
+            for old_path, old_is_dir in moved_from.values():
+                self.deleted(old_path, old_is_dir)
+
+    def _add_watch(self, path):
+        try:
+            self.inotify.add_watch(path)
+        except OSError as error:
+            print("Folder cannot be watched: {} ({})".format(path, error))
+
+    def _run_polling(self):
+        while self.running:
+            self._poll_once()
+            waited = 0
+            while self.running and waited < self.poll_interval:
+                time.sleep(min(1, self.poll_interval - waited))
+                waited += 1
+
+    """
+        @description:   This method checks whether a folder is pruned (see Fileserver.prune_folder()).
+
+        @return:        [String] Returns the rule why the folder is pruned, or None.
+    """
+    def _pruned(self, folder_path):
+        if self.fileserver.skip_rules is None:
+            self.fileserver.load_skip_rules()
+        return self.fileserver.prune_folder(folder_path)
+
+    """
+        @description:   This method removes the pruned folders from the subfolders of a walk, so the walk does
+                        not descend into them.
+    """
+    def _prune(self, path, subdirs):
+        path = self.fileserver.slash(path)
+        subdirs[:] = [folder for folder in subdirs if not self._pruned(self.fileserver.join_path(path, folder))]
+
+    """
+        @description:   This method compares the fileserver with the registered entries once: new files are
+                        registered, vanished files are flagged as not still there. Pruned folders are not
+                        walked, so their placeholders and the entries within them are not checked.
+    """
+    def _poll_once(self):
+        seen = set()
+        for path, subdirs, files in scandir.walk(self.root):
+            self._prune(path, subdirs)
+            for file in files:
+                file_path = self.fileserver.slash(os.path.join(path, file))
+                seen.add(file_path)
+                entry = self.fileserver.fileserver.get(file_path)
+                if entry is None or not entry['still_there']:
+                    self.created(file_path, False)
+
+        prefix = self.root + "/"
+        entries = self.fileserver.fileserver
+        for file in list(self.fileserver.iter_files(still_there=True, prefix=prefix)):
+            if file in seen:
+                continue
+            entry = entries[file]
+            if entry.get('pruned') or self._pruned(entry['path']):
+                continue
+            self.deleted(file, False)
+
+    """
+        @description:   These methods apply a single filesystem event to the Fileserver object.
+    """
+    def created(self, path, is_dir):
+        if is_dir:
+            if self._pruned(path):
+                return
+            if self.inotify is not None:
+                self._add_watch(path)
+            # files may have been created before the watch was in place
+            for directory, subdirs, files in scandir.walk(path):
+                self._prune(directory, subdirs)
+                if self.inotify is not None and directory != path:
+                    self._add_watch(directory)
+                for file in files:
+                    self.created(self.fileserver.slash(os.path.join(directory, file)), False)
+            return
+
+        directory = path[:path.rfind("/")]
+        if self._pruned(directory) or not os.path.isfile(path):
+            return
+
+        entries = self.fileserver.fileserver
+        before = self.fileserver.rollup_before(path)
+        if path in entries:
+            entries[path]['still_there'] = True
+        else:
+            entries[path] = self.fileserver.create_entry(self.fileserver.normalize_folder(directory),
+                                                         path[path.rfind("/") + 1:])
+            print("Created: " + path)
+        self._refresh(path, before)
+
+    def deleted(self, path, is_dir):
+        entries = self.fileserver.fileserver
+        if is_dir:
+            if self.inotify is not None:
+                for watched in list(self.inotify.paths):
+                    if watched == path or watched.startswith(path + "/"):
+                        self.inotify.remove_watch(watched)
+            number = 0
+            for file in list(self.fileserver.iter_files(still_there=True, prefix=path + "/")):
+                before = self.fileserver.rollup_before(file)
+                entries[file]['still_there'] = False
+                self.fileserver.rollup_after(file, before)
+                number += 1
+            print("Deleted: {} ({} files)".format(path, number))
+            self._changed(number)
+        elif path in entries and entries[path]['still_there']:
+            before = self.fileserver.rollup_before(path)
+            entries[path]['still_there'] = False
+            self.fileserver.rollup_after(path, before)
+            print("Deleted: " + path)
+            self._changed()
+
+    def moved(self, old_path, new_path, is_dir):
+        entries = self.fileserver.fileserver
+        if is_dir:
+            if self.inotify is not None:
+                for watched in list(self.inotify.paths):
+                    if watched == old_path or watched.startswith(old_path + "/"):
+                        self.inotify.remove_watch(watched)
+            for file in list(self.fileserver.iter_files(prefix=old_path + "/")):
+                self._move_entry(file, new_path + file[len(old_path):])
+            # register the watches of the new location and any file not known so far
+            self.created(new_path, True)
+            return
+
+        self._move_entry(old_path, new_path)
+
+    def _move_entry(self, old_path, new_path):
+        entries = self.fileserver.fileserver
+        if entries.get(old_path, {}).get('pruned'):
+            self._move_placeholder(old_path, new_path)
+            return
+        if self._pruned(new_path[:new_path.rfind("/")]):
+            # moved into a pruned folder, where files are not registered
+            self.deleted(old_path, False)
+            return
+
+        self.fileserver.rollup_remove(old_path)
+        old_entry = entries.pop(old_path, None)
+        new_entry = self.fileserver.create_entry(self.fileserver.normalize_folder(new_path[:new_path.rfind("/")]),
+                                                 new_path[new_path.rfind("/") + 1:])
+        if old_entry is not None:
+            # everything known about the file (upload state, packages, stat, sniff, metadata) moves with it;
+            # only the location changes, the database connections are extracted again from the new path
+            moved_entry = dict(old_entry)
+            for key in ('path', 'name', 'extension'):
+                moved_entry[key] = new_entry[key]
+            moved_entry.pop('db_entries', None)
+            moved_entry.pop('db_version', None)
+            new_entry = moved_entry
+        entries[new_path] = new_entry
+        print("Moved: {} -> {}".format(old_path, new_path))
+        self._refresh(new_path, None)
+
+    """
+        @description:   This method moves the placeholder of a pruned folder along with a moved parent folder.
+                        If the folder is not pruned at its new location, the placeholder is removed and its
+                        files are registered by created().
+    """
+    def _move_placeholder(self, old_key, new_key):
+        entries = self.fileserver.fileserver
+        self.fileserver.rollup_remove(old_key)
+        del entries[old_key]
+        folder_path = new_key.rstrip("/")
+        reason = self._pruned(folder_path)
+        if reason:
+            entries[folder_path + "/"] = self.fileserver.create_placeholder(folder_path, reason)
+            self.fileserver.rollup_after(folder_path + "/", None)
+        print("Moved: {} -> {}".format(old_key, new_key))
+        self._changed()
+
+    """
+        @description:   This method classifies a new or changed entry and extracts its database connections.
+                        before are the aggregated numbers of the entry before the change (None if it is new).
+    """
+    def _refresh(self, path, before):
+        entries = self.fileserver.fileserver
+        entry = entries[path]
+        entry['still_there'] = os.path.isfile(path)
+        if self.fileserver.has_tiff_version(path):
+            entry['skip'] = True
+        else:
+            self.fileserver.classify_entry(path)
+        self.fileserver.update_db_connection(path)
+        self.fileserver.rollup_after(path, before)
+
+        # a new TIFF makes the JPG of the same name obsolete
+        if entry['extension'] in ("tif", "tiff"):
+            path_stem = path[:path.rfind(".") + 1]
+            for jpg in (path_stem + "jpg", path_stem + "jpeg"):
+                if jpg in entries:
+                    jpg_before = self.fileserver.rollup_before(jpg)
+                    entries[jpg]['skip'] = True
+                    self.fileserver.rollup_after(jpg, jpg_before)
+        self._changed()